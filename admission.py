@@ -0,0 +1,440 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from processing import STREAM_POINTS
+from processing_utils import calc_wstep, calc_window
+
+# the resolutions and zero fills of 'calc_wstep()'
+RESOLUTIONS = [1, 0.5, 0.25, 0.125, 0.0625, 0.03125, 0.015625]
+ZERO_FILLS = [0, 1, 2]
+
+# what a request costs when there is no calibration for it (see 'scripts/calibrate_admission.py'):
+# peak memory and CPU seconds, each a fixed part plus a part per grid point. about 1.5 times what
+# a JSON /sample_background of the synthetic CO line list of 'scripts/synthetic.py' measured
+DEFAULT_MODEL = {
+    "memory_bytes": {"base": 16 * 2**20, "per_point": 900},
+    "cpu_seconds": {"base": 0.05, "per_point": 1.2e-5},
+}
+
+# how often a request waiting for the global budget checks it again (seconds)
+POLL_SECONDS = 0.05
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def grid_points(params: dict[str, object]) -> int:
+    """
+    Counts the points of the grid a request is calculated on, without
+    building it. This is known before any calculation from the window and
+    'calc_wstep()', and the cost of every step grows with it.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+
+        Returns:
+            the number of points of the grid
+    """
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+    wave_min, wave_max = calc_window(float(params["waveMin"]), float(params["waveMax"]), wstep)
+
+    # the length of np.arange(wave_min, wave_max + wstep, wstep), see 'calc_grid()'
+    return int(np.ceil((wave_max + wstep - wave_min) / wstep))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def model_key(params: dict[str, object], kind: str) -> str:
+    """
+    Names the cost model of a request. Samples depend on the lines of their
+    molecule (or molecules), backgrounds do not. 'CostEstimator.estimate()'
+    predicts a mixture from the models of its molecules, so the key of a
+    mixture only names its runs in a calibration.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            kind (str): "sample", "background" or "pair" (/sample_background)
+
+        Returns:
+            the key of the model in the calibration (ex. "sample:CO")
+    """
+    if kind == "background":
+        return kind
+
+    # a mixture, ex. "sample:CO+CO2"
+    molecule = params["molecule"]
+    return f"{kind}:{'+'.join(sorted(molecule)) if isinstance(molecule, dict) else molecule}"
+
+
+class CostEstimator:
+    """
+    Predicts the peak memory and the CPU time of a request from its
+    parameters, before anything is calculated.
+
+    Both are modeled as a fixed part plus a part per point of the grid
+    ('grid_points()'). The coefficients of each kind of request and molecule
+    are fitted to measured runs by 'scripts/calibrate_admission.py'; models
+    that were not calibrated fall back to the model of the same kind of
+    request for any molecule ("sample:*"), then to DEFAULT_MODEL.
+    """
+
+    def __init__(self, calibration: str = None) -> None:
+        """
+        Loads the calibration.
+
+            Parameters:
+                calibration (str): the JSON file written by 'scripts/calibrate_admission.py', or None to use DEFAULT_MODEL
+        """
+        self.calibration = calibration
+        self.models = {}
+
+        if calibration:
+            with open(calibration) as f:
+                self.models = json.load(f)["models"]
+
+    def model(self, key: str) -> dict[str, dict[str, float]]:
+        """
+        Finds the cost model of a request.
+
+            Parameters:
+                key (str): the key from 'model_key()'
+
+            Returns:
+                the coefficients of the memory and CPU models
+        """
+        return self.models.get(key) or self.models.get(key.split(":")[0] + ":*") or DEFAULT_MODEL
+
+    def estimate(self, params: dict[str, object], kind: str = "sample") -> dict[str, float]:
+        """
+        Predicts the cost of a request.
+
+            Parameters:
+                params (dict): The parameters provided by the user, or {"spectra": [(kind, params), ...]} for a batch
+                kind (str): "sample", "background", "pair", "sweep", "stream" or "batch"
+
+            Returns:
+                the number of grid points, the peak memory in bytes and the CPU seconds
+        """
+        if kind == "batch":
+            # the spectra of a batch run together, so their costs add up
+            costs = [self.estimate(spectrum, spectrum_kind) for spectrum_kind, spectrum in params["spectra"]]
+            return {name: sum(cost[name] for cost in costs) for name in costs[0]}
+
+        if kind != "background" and isinstance(params["molecule"], dict):
+            # every molecule of a mixture is calculated on its own and at the same time, so the
+            # costs of their own models add up. the grid is the same for all of them
+            costs = [self.estimate({**params, "molecule": molecule, "mole": mole}, kind)
+                     for molecule, mole in params["molecule"].items()]
+            return {name: max(cost[name] for cost in costs) if name == "points" else sum(cost[name] for cost in costs)
+                    for name in costs[0]}
+
+        points = grid_points(params)
+        if kind == "sweep":
+            # every step of a sweep is processed and sent like a sample of its own
+            points *= max(len(params.get("pressures") or []), len(params.get("moles") or []), 1)
+            kind = "sample"
+        elif kind == "stream":
+            # a streamed sample only holds one segment at a time
+            points = min(points, STREAM_POINTS)
+            kind = "sample"
+        cost = {"points": points}
+
+        for name, coefficients in self.model(model_key(params, kind)).items():
+            # calibrated models carry the margin that covers every measured run
+            predicted = coefficients["base"] + coefficients["per_point"] * points
+            cost[name] = predicted * coefficients.get("margin", 1)
+
+        return cost
+
+
+class Ticket:
+    """
+    An admitted request. Its memory stays reserved until it is released.
+    """
+
+    def __init__(self, controller: "AdmissionController", params: dict[str, object],
+                 cost: dict[str, float], downgraded: dict[str, object] = None) -> None:
+        """
+        Creates a ticket.
+
+            Parameters:
+                controller (AdmissionController): the controller that admitted the request
+                params (dict): the parameters to calculate the request with
+                cost (dict): the estimated cost of the request
+                downgraded (dict): what was changed to fit the budget, or None
+        """
+        self.controller = controller
+        self.params = params
+        self.cost = cost
+        self.downgraded = downgraded
+        self.path = None
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """
+        Gives the reserved memory back, and wakes the requests waiting for it.
+        """
+        if self.controller is not None:
+            self.controller._release(self)
+            self.controller = None
+
+
+class AdmissionController:
+    """
+    Decides whether a request may run, from its estimated cost.
+
+    Every running request reserves its estimated peak memory. A request
+    whose memory does not fit in what is left of the budget of this worker
+    (and, when a directory is given, of the budget shared by all workers)
+    waits in a queue until enough is released, for at most 'wait' seconds.
+
+    A request that could never fit, because its peak memory exceeds a
+    whole budget or its CPU time exceeds 'max_seconds', is downgraded to
+    the finest resolution and zero fill that fits, unless the user asked
+    not to be ("downgrade": false). The response then says what was
+    changed. Otherwise the request is rejected.
+
+    Across workers, each reservation is a file in the directory holding its
+    bytes. The files are summed under an fcntl lock, and files of processes
+    that no longer exist are removed.
+    """
+
+    def __init__(self, worker_bytes: int, global_bytes: int = None, directory: str = None,
+                 max_seconds: float = None, wait: float = 10, estimator: CostEstimator = None) -> None:
+        """
+        Creates an admission controller.
+
+            Parameters:
+                worker_bytes (int): the memory requests of this worker may reserve together
+                global_bytes (int): the memory requests of all workers may reserve together, or None
+                directory (str): where the reservations of all workers are kept. needed for global_bytes
+                max_seconds (float): the most CPU seconds a single request may take, or None
+                wait (float): the most seconds a request waits in the queue
+                estimator (CostEstimator): predicts the cost of a request, defaults to the uncalibrated one
+        """
+        self.worker_bytes = worker_bytes
+        self.global_bytes = global_bytes if directory else None
+        self.directory = directory
+        self.max_seconds = max_seconds
+        self.wait = wait
+        self.estimator = estimator or CostEstimator()
+
+        self.reserved = 0
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.downgraded = 0
+        self.rejected = 0
+
+        self._condition = threading.Condition()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def admit(self, params: dict[str, object], kind: str = "sample") -> tuple[Ticket, bool, str]:
+        """
+        Admits a request, after waiting for memory to be released or
+        downgrading it when needed.
+
+            Parameters:
+                params (dict): The parameters provided by the user
+                kind (str): "sample", "background", "pair", "sweep", "stream" or "batch"
+
+            Returns:
+                the ticket to release once the response is built, or the message text if the request is rejected
+        """
+        cost = self.estimator.estimate(params, kind)
+        downgraded = None
+
+        if not self._fits(cost):
+            if params.get("downgrade") is False:
+                self.rejected += 1
+                return None, True, (
+                    f"This spectrum needs about {cost['memory_bytes'] / 2**20:.0f} MB, more than the server allows. "
+                    "Please choose a coarser resolution or zero fill, or a smaller wavenumber range."
+                )
+
+            params, cost, downgraded = self._downgrade(params, kind)
+            if params is None:
+                self.rejected += 1
+                return None, True, (
+                    "This wavenumber range is too large for the server at any resolution. "
+                    "Please choose a smaller wavenumber range."
+                )
+            self.downgraded += 1
+
+        ticket = Ticket(self, params, cost, downgraded)
+        deadline = time.monotonic() + self.wait
+
+        with self._condition:
+            if not self._reserve(ticket):
+                self.queued += 1
+                self.waiting += 1
+                try:
+                    while not self._reserve(ticket):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            return None, True, "The server is busy. Please try again in a moment."
+                        # releases in this worker wake the queue; the global budget is polled
+                        self._condition.wait(min(remaining, POLL_SECONDS) if self.directory else remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.admitted += 1
+
+        return ticket, False, None
+
+    def _fits(self, cost: dict[str, float]) -> bool:
+        """
+        Checks whether a request could ever run, with nothing else running.
+
+            Parameters:
+                cost (dict): the estimated cost of the request
+
+            Returns:
+                True if it fits in the budgets
+        """
+        budgets = [self.worker_bytes] + ([self.global_bytes] if self.global_bytes else [])
+        return (cost["memory_bytes"] <= min(budgets)
+                and (self.max_seconds is None or cost["cpu_seconds"] <= self.max_seconds))
+
+    def _downgrade(self, params: dict[str, object],
+                   kind: str) -> tuple[dict[str, object], dict[str, float], dict[str, object]]:
+        """
+        Finds the finest coarser grid a request fits on. Among settings with
+        the same wstep, the resolution closest to the requested one is used.
+
+            Parameters:
+                params (dict): The parameters provided by the user
+                kind (str): "sample", "background", "pair" or "sweep"
+
+            Returns:
+                the changed parameters, their cost and what was changed, or None if nothing fits
+        """
+        resolution, zero_fill = float(params["resolution"]), int(params["zeroFill"])
+        wstep = calc_wstep(resolution, zero_fill)
+
+        settings = sorted(
+            [(calc_wstep(r, z), abs(np.log2(r / resolution)), r, z) for r in RESOLUTIONS for z in ZERO_FILLS],
+        )
+        for setting_wstep, _, new_resolution, new_zero_fill in settings:
+            if setting_wstep <= wstep:
+                continue
+
+            changed = {**params, "resolution": new_resolution, "zeroFill": new_zero_fill}
+            cost = self.estimator.estimate(changed, kind)
+            if self._fits(cost):
+                return changed, cost, {
+                    "resolution": new_resolution,
+                    "zeroFill": new_zero_fill,
+                    "requested": {"resolution": params["resolution"], "zeroFill": params["zeroFill"]},
+                }
+
+        return None, None, None
+
+    def _reserve(self, ticket: Ticket) -> bool:
+        """
+        Reserves the memory of a request if it fits in what is left of the
+        budgets. Called with the condition held.
+
+            Parameters:
+                ticket (Ticket): the request
+
+            Returns:
+                True if the memory was reserved
+        """
+        memory = int(ticket.cost["memory_bytes"])
+
+        # a request always runs when the worker is idle, since it fits the whole budget
+        if self.running and self.reserved + memory > self.worker_bytes:
+            return False
+
+        if self.global_bytes:
+            with open(os.path.join(self.directory, ".lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if self._global_reserved() + memory > self.global_bytes:
+                    return False
+
+                ticket.path = os.path.join(self.directory, f"{os.getpid()}-{id(ticket)}.reservation")
+                with open(ticket.path, "w") as f:
+                    f.write(str(memory))
+
+        self.reserved += memory
+        self.running += 1
+        return True
+
+    def _global_reserved(self) -> int:
+        """
+        Sums the memory reserved by all workers, and removes the reservations
+        of processes that no longer exist. Called with the directory locked.
+
+            Returns:
+                the reserved memory in bytes
+        """
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".reservation"):
+                continue
+
+            path = os.path.join(self.directory, name)
+            try:
+                os.kill(int(name.split("-")[0]), 0)
+            except ProcessLookupError:
+                os.remove(path)
+                continue
+            except (PermissionError, ValueError):
+                pass
+
+            try:
+                with open(path) as f:
+                    total += int(f.read())
+            except (OSError, ValueError):
+                pass
+
+        return total
+
+    def _release(self, ticket: Ticket) -> None:
+        """
+        Gives back the memory reserved by a request.
+
+            Parameters:
+                ticket (Ticket): the request
+        """
+        with self._condition:
+            self.reserved -= int(ticket.cost["memory_bytes"])
+            self.running -= 1
+
+            if ticket.path is not None:
+                try:
+                    os.remove(ticket.path)
+                except FileNotFoundError:
+                    pass
+
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Reports what the controller decided, and what is running now.
+
+            Returns:
+                the number of requests admitted, queued, downgraded and rejected, and the running requests and reserved bytes
+        """
+        with self._condition:
+            return {
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "downgraded": self.downgraded,
+                "rejected": self.rejected,
+                "running": self.running,
+                "waiting": self.waiting,
+                "reserved_bytes": self.reserved,
+            }
@@ -2,17 +2,99 @@
 #   https://flask.palletsprojects.com/en/2.2.x/
 #   python3 flask_api.py
 
+import itertools
+from collections.abc import Iterator
 import json
+import os
+import secrets
+import tempfile
+import time
 
-from flask import Flask, request
+import numpy as np
+from flask import Flask, Response, g, request, send_file
 from flask_cors import CORS
+from admission import AdmissionController, CostEstimator, Ticket
+from cache import LRUCache, SharedCache
+from engines import ENGINE_REPORT, rss_bytes
+from encoding import encode_spectrum, response_options, stream_spectrum
+from jobs import DONE, PRIORITY_HEADER, Job, JobQueue, priority_allowed
+from metrics import (
+    METRICS_ENABLED,
+    GRID_POINTS,
+    PAYLOAD_BYTES,
+    REQUEST_SECONDS,
+    render_metrics,
+    server_timing,
+    stage,
+    start_request,
+)
+from profiling import (
+    PROFILE_HEADER,
+    PROFILE_LOCK,
+    PROFILE_MODE_HEADER,
+    PROFILED_ENDPOINTS,
+    RequestProfile,
+    profile_allowed,
+    profile_path,
+)
 from processing import (
-    generate_spectrum,
-    generate_background,
-    process_spectrum,
+    IN_FLIGHT,
+    SPECTRUM_CACHE,
+    generate_ideal,
+    generate_background_grid,
+    generate_batch,
+    generate_pair,
+    generate_segments,
+    generate_sweep,
+    process_arrays,
     find_peaks
 )
-from processing_utils import param_check
+from startup import startup_report
+from processing_utils import COMPONENT_CACHE, param_check, apply_zoom, decimation_indices, sweep_steps
+
+# processed spectra kept on the server so later requests (ex. /find_peaks) can
+# refer to them by handle instead of uploading the x and y-values again. they are
+# files in FTIR_HANDLE_DIR, so a handle made by one gunicorn worker can be used by
+# any other. set FTIR_HANDLE_DIR to an empty string to keep them in the memory of
+# each worker instead (only for a single worker)
+HANDLE_DIR = os.environ.get(
+    "FTIR_HANDLE_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "ftir-handles"),
+)
+HANDLE_STORE_BYTES = int(os.environ.get("FTIR_HANDLE_STORE_MB", 256)) * 2**20
+HANDLE_TTL = float(os.environ.get("FTIR_HANDLE_TTL", 600))
+if HANDLE_DIR:
+    SPECTRUM_STORE = SharedCache(HANDLE_DIR, HANDLE_STORE_BYTES, name="handle", ttl=HANDLE_TTL)
+else:
+    SPECTRUM_STORE = LRUCache(HANDLE_STORE_BYTES, name="handle", ttl=HANDLE_TTL)
+
+# the most spectra a single /batch request may ask for
+MAX_BATCH = int(os.environ.get("FTIR_BATCH_MAX", 50))
+
+# the most steps a single /sweep request may ask for
+MAX_SWEEP = int(os.environ.get("FTIR_SWEEP_MAX", 25))
+
+# the most seconds a request may wait for a job to finish. a waiting request holds its web
+# worker (gunicorn's default sync worker answers one request at a time), so keep this short
+# unless gunicorn runs threaded or async workers
+MAX_JOB_WAIT = float(os.environ.get("FTIR_JOB_MAX_WAIT", 2))
+
+# set FTIR_WORKER_BUDGET_MB to limit the memory the spectra of one worker are predicted to need
+# together (see admission.py). set FTIR_ADMISSION_DIR and FTIR_GLOBAL_BUDGET_MB to also limit all
+# workers together, and FTIR_ADMISSION_CALIBRATION to the file 'scripts/calibrate_admission.py' wrote
+ADMISSION = AdmissionController(
+    int(os.environ["FTIR_WORKER_BUDGET_MB"]) * 2**20,
+    int(os.environ.get("FTIR_GLOBAL_BUDGET_MB", 0)) * 2**20 or None,
+    os.environ.get("FTIR_ADMISSION_DIR"),
+    float(os.environ["FTIR_MAX_REQUEST_SECONDS"]) if os.environ.get("FTIR_MAX_REQUEST_SECONDS") else None,
+    float(os.environ.get("FTIR_ADMISSION_WAIT", 10)),
+    CostEstimator(os.environ.get("FTIR_ADMISSION_CALIBRATION")),
+) if int(os.environ.get("FTIR_WORKER_BUDGET_MB", 0)) else None
+
+# long calculations submitted to /jobs run in a pool of processes, so they do not hold a web
+# worker. every gunicorn worker has its own jobs. a job is admitted
+# (ADMISSION) when it is handed to the pool
+JOBS = JobQueue(admission=ADMISSION)
 
 app = Flask(__name__)
 CORS(app)
@@ -23,14 +105,267 @@ try:
 except:
      print("no version file found")
 
+
+@app.before_request
+def start_timing() -> None:
+    if METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+        start_request()
+
+
+@app.after_request
+def finish_timing(response: Response) -> Response:
+    if not METRICS_ENABLED or "request_start" not in g:
+        return response
+
+    # a streamed body is sent after this, so only the work before its first segment is counted
+    total = time.perf_counter() - g.request_start
+    response.headers["Server-Timing"] = server_timing(total)
+    REQUEST_SECONDS.observe(total, request.endpoint or "")
+    if not response.is_streamed:
+        PAYLOAD_BYTES.observe(response.calculate_content_length() or 0, request.endpoint or "")
+    return response
+
+
+@app.before_request
+def start_profile() -> None:
+    # only an operator with FTIR_PROFILE_TOKEN can profile a request
+    if request.endpoint not in PROFILED_ENDPOINTS or not profile_allowed(request.headers.get(PROFILE_HEADER)):
+        return
+
+    if not PROFILE_LOCK.acquire(blocking=False):
+        g.profile_error = "Another request is being profiled."
+        return
+
+    g.profile = RequestProfile(request.endpoint, request.headers.get(PROFILE_MODE_HEADER, "cprofile"))
+    g.profile.start()
+
+
+@app.after_request
+def finish_profile(response: Response) -> Response:
+    if "profile_error" in g:
+        response.headers["X-Profile-Error"] = g.profile_error
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+
+    try:
+        response.headers["X-Profile-Id"] = profile.stop()
+    finally:
+        PROFILE_LOCK.release()
+    return response
+
+
+@app.teardown_request
+def release_profile(error: BaseException = None) -> None:
+    # a request that failed before 'finish_profile()' ran still has to stop its profiler
+    # and free PROFILE_LOCK, or no other request could be profiled again
+    profile = g.pop("profile", None)
+    if profile is None:
+        return
+
+    try:
+        profile.stop()
+    finally:
+        PROFILE_LOCK.release()
+
+
+@app.teardown_request
+def release_admission(error: BaseException = None) -> None:
+    ticket = g.pop("ticket", None)
+    if ticket is not None:
+        ticket.release()
+
+
+def send_spectrum(params: dict[str, object], options: dict[str, object],
+                  x_value: np.ndarray, series: dict[str, np.ndarray],
+                  downgraded: dict[str, object] = None, extra: dict[str, object] = None) -> dict | Response:
+    """
+    Builds the response for a processed spectrum. When the user gives
+    'handle', the full spectrum is kept in SPECTRUM_STORE and its handle is
+    sent back. When the user gives 'maxPoints' (read by 'response_options()'),
+    the spectrum is decimated for display. When the request was downgraded
+    to fit the memory budget, the response says what was changed.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            options (dict): the options from 'response_options()'
+            x_value (np.ndarray): the x-values of the processed spectrum
+            series (dict): the y-values to send, by name (ex. {"y": y_value}). the handle keeps the first one
+            downgraded (dict): the resolution and zero fill the spectrum was calculated with instead, or None
+            extra (dict): additional fields to send with the spectrum
+
+        Returns:
+            the response in the format the user asked for
+    """
+    extra = dict(extra or {})
+    if downgraded:
+        extra["downgraded"] = downgraded
+    GRID_POINTS.observe(len(x_value), request.endpoint or "")
+
+    if params.get("handle"):
+        handle = secrets.token_urlsafe(16)
+        try:
+            SPECTRUM_STORE.put(handle, (x_value, next(iter(series.values()))))
+        except OSError:
+            # ex. FTIR_HANDLE_DIR is full
+            return {
+                "success": False,
+                "text": "The spectrum could not be kept on the server. Please try again without 'handle'.",
+            }
+        extra["handle"] = handle
+        extra["expires"] = SPECTRUM_STORE.ttl
+
+    if options["max_points"] is not None and len(x_value) > options["max_points"]:
+        # spectra on the same grid (including the rows of stacked spectra) keep the union
+        # of their points, so they stay aligned
+        rows = [row for y_value in series.values() for row in np.atleast_2d(y_value)]
+        budget = max(options["max_points"] // len(rows), 2)
+        indices = np.unique(np.concatenate([decimation_indices(row, budget) for row in rows]))
+        x_value = x_value[indices]
+        series = {name: y_value[..., indices] for name, y_value in series.items()}
+        # decimated x-values are no longer evenly spaced
+        options = {**options, "grid": False}
+        extra["decimated"] = True
+
+    with stage("serialize"):
+        return encode_spectrum(x_value, series, options, extra)
+
+
+def admit(params: dict[str, object], kind: str) -> tuple[Ticket, bool, str]:
+    """
+    Reserves the memory a spectrum is predicted to need (see admission.py).
+    A request that does not fit waits for memory to be released, is
+    downgraded to a coarser grid or is rejected.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            kind (str): "sample", "background", "pair", "sweep", "stream" or "batch"
+
+        Returns:
+            the ticket to release once the response is built, or the message text if the request is rejected
+    """
+    if ADMISSION is None:
+        return Ticket(None, params, None), False, None
+
+    ticket, error, message = ADMISSION.admit(params, kind)
+    # released by 'release_admission()' once the response is built
+    g.ticket = ticket
+    return ticket, error, message
+
+
+def release_after(segments: Iterator[tuple[tuple[np.ndarray, np.ndarray], bool, str]],
+                  ticket: Ticket) -> Iterator[tuple[tuple[np.ndarray, np.ndarray], bool, str]]:
+    """
+    Releases the ticket of a streamed spectrum once its segments have all
+    been sent, or the client went away.
+
+        Parameters:
+            segments (Iterator): the processed segments of the spectrum
+            ticket (Ticket): the ticket of the request
+
+        Returns:
+            the same segments
+    """
+    try:
+        yield from segments
+    finally:
+        ticket.release()
+
+
+def read_spectrum_request(data: dict[str, object],
+                          accept: str = "") -> tuple[tuple[str, dict, dict], bool, str]:
+    """
+    Checks a sample or background request that is not sent to /sample or
+    /background directly (ex. inside a batch or as a job). The spectrum is a
+    sample unless its "type" says otherwise.
+
+        Parameters:
+            data (dict): the request provided by the user
+            accept (str): the Accept header of the request
+
+        Returns:
+            the kind of spectrum, the parameters and the response options, or the message text if the request is invalid
+    """
+    params = {key: value for key, value in data.items() if key not in ["type", "priority"]}
+    kind = data.get("type", "sample")
+
+    if kind not in ["sample", "background"] or not param_check(params):
+        return None, True, "One of the given parameters was invalid. Please change some settings and try again."
+
+    try:
+        options = response_options(params, accept)
+    except ValueError as e:
+        return None, True, str(e)
+
+    return (kind, params, options), False, None
+
+
 @app.route("/", methods=["GET"])
 def ftir() -> str:
     if "VERSION" not in app.config:
       app.config["VERSION"] = "0.0.0"
     return "<h1 style='color:blue'>Raston Lab FTIR API%s</h1>" % (" - Version "+app.config["VERSION"])
 
+@app.route("/engines", methods=["GET"])
+def engine_report() -> dict[bool, dict]:
+    # boot time and resident memory of the warm line databases
+    return {"success": True, "engines": ENGINE_REPORT, "rss_mb": round(rss_bytes() / 2**20, 1)}
+
+@app.route("/startup", methods=["GET"])
+def startup() -> dict[bool, dict]:
+    # how this worker started (lazy or preloaded imports) and its memory now
+    return {"success": True, "startup": startup_report()}
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics() -> dict[bool, str] | Response:
+    if not METRICS_ENABLED:
+        return {
+            "success": False,
+            "text": "Metrics are turned off on this server.",
+        }
+
+    return Response(
+        render_metrics(
+            [SPECTRUM_CACHE, COMPONENT_CACHE, SPECTRUM_STORE],
+            {
+                "ftir_resident_memory_bytes": rss_bytes(),
+                **{f"ftir_jobs_{key}": value for key, value in JOBS.stats().items()},
+                **{f"ftir_single_flight_{key}": value for key, value in IN_FLIGHT.stats().items()},
+                **{f"ftir_admission_{key}": value for key, value in (ADMISSION.stats() if ADMISSION else {}).items()},
+            },
+        ),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+@app.route("/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id: str) -> dict[bool, dict, str] | Response:
+    if not profile_allowed(request.headers.get(PROFILE_HEADER)):
+        return {
+            "success": False,
+            "text": "Profiles are only available to operators.",
+        }
+
+    # ?raw=1 sends the .pstats or .folded file for snakeviz, flamegraph.pl, etc.
+    extensions = [".pstats", ".folded"] if request.args.get("raw") else [".json"]
+    paths = [path for path in [profile_path(profile_id, extension) for extension in extensions] if path]
+    if not paths:
+        return {
+            "success": False,
+            "text": "There is no profile with this id.",
+        }
+    path = paths[0]
+
+    if path.endswith(".json"):
+        with open(path) as f:
+            return {"success": True, "profile": json.load(f)}
+    return send_file(path, as_attachment=True)
+
+
 @app.route("/sample", methods=["POST"])
-def sample() -> dict[bool, list[float], list[float]]:
+def sample() -> dict[bool, list[float], list[float]] | Response:
     # put incoming JSON into a dictionary
     params = json.loads(request.data)
 
@@ -41,9 +376,60 @@ def sample() -> dict[bool, list[float], list[float]]:
             "text": "One of the given parameters was invalid. Please change some settings and try again.",
         }
 
+    # how the spectrum is sent back (JSON lists, base64 or binary)
+    try:
+        options = response_options(params, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return {
+            "success": False,
+            "text": str(e),
+        }
+
+    # perform, one wavenumber segment at a time as the response is sent:
+    #   --> transmission spectrum of gas sample (calc_spectrum)
+    #   --> the processing of the spectrum
+    if params.get("stream"):
+        # a streamed spectrum is never held whole, so it can neither be kept nor decimated
+        if params.get("handle") or params.get("maxPoints") is not None:
+            return {
+                "success": False,
+                "text": "'handle' and 'maxPoints' cannot be used with 'stream'.",
+            }
+        # only one segment is held at a time, so a stream reserves the memory of one segment.
+        # a stream cannot say it was downgraded, so it is rejected instead
+        ticket, error, message = admit({**params, "downgrade": False}, "stream")
+        if error:
+            return {
+                "success": False,
+                "text": message,
+            }
+
+        segments = generate_segments(params)
+        first, error, message = next(segments)
+        if error:
+            return {
+                "success": False,
+                "text": message,
+            }
+
+        # the segments are calculated while the response is sent, after this request has been
+        # torn down, so the memory stays reserved until the last one has been sent
+        g.pop("ticket", None)
+        return stream_spectrum(release_after(itertools.chain([(first, False, None)], segments), ticket), options)
+
+    # wait until the memory the spectrum is predicted to need is free. a spectrum that
+    # could never fit is calculated on a coarser grid (the response says so) or rejected
+    ticket, error, message = admit(params, "sample")
+    if error:
+        return {
+            "success": False,
+            "text": message,
+        }
+    params = ticket.params
+
     # perform:
     #   --> transmission spectrum of gas sample (calc_spectrum)
-    spectrum, error, message = generate_spectrum(params)
+    ideal, error, message = generate_ideal(params)
     if error:
         return {
             "success": False,
@@ -54,21 +440,13 @@ def sample() -> dict[bool, list[float], list[float]]:
     #   --> blackbody spectrum of source (sPlanck)
     #   --> transmission spectrum of beamsplitter and cell windows
     #   --> detector response spectrum
-    processed_spectrum = process_spectrum(params, spectrum)
-
-    # https://radis.readthedocs.io/en/latest/source/radis.spectrum.spectrum.html#radis.spectrum.spectrum.Spectrum.get
-    x_value, y_value = processed_spectrum.get("transmittance_noslit")
+    x_value, y_value = process_arrays(apply_zoom(params), *ideal)
 
-    # convert dictionary values to strings and return as JSON
-    return {
-        "success": True,
-        "x": list(x_value),
-        "y": list(map(str, y_value)),
-    }
+    return send_spectrum(params, options, x_value, {"y": y_value}, ticket.downgraded)
 
 
 @app.route("/background", methods=["POST"])
-def background() -> dict[bool, list[float], list[float]]:
+def background() -> dict[bool, list[float], list[float]] | Response:
     # put incoming JSON into a dictionary
     data = json.loads(request.data)
 
@@ -79,19 +457,28 @@ def background() -> dict[bool, list[float], list[float]]:
             "text": "One of the given parameters was invalid. Please change some settings and try again.",
         }
 
-    # perform:
-    #   --> transmission spectrum of gas sample (calc_spectrum)
-    spectrum, error, message = generate_spectrum(data)
+    # how the spectrum is sent back (JSON lists, base64 or binary)
+    try:
+        options = response_options(data, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return {
+            "success": False,
+            "text": str(e),
+        }
+
+    # wait until the memory the spectrum is predicted to need is free
+    ticket, error, message = admit(data, "background")
     if error:
         return {
             "success": False,
             "text": message,
         }
+    data = ticket.params
 
     # perform:
-    #   --> set all y-values to one
+    #   --> build the wavenumber grid (all y-values are one)
     try:
-        background_spectrum = generate_background(spectrum)
+        wave_number = generate_background_grid(data)
     except:
         return {
             "success": False,
@@ -102,31 +489,256 @@ def background() -> dict[bool, list[float], list[float]]:
     #   --> blackbody spectrum of source (sPlanck)
     #   --> transmission spectrum of beamsplitter and cell windows
     #   --> detector response spectrum
-    processed_spectrum = process_spectrum(data, background_spectrum)
-    
-    if processed_spectrum is None:
+    x_value, y_value = process_arrays(apply_zoom(data), wave_number)
+
+    return send_spectrum(data, options, x_value, {"y": y_value}, ticket.downgraded)
+
+
+@app.route("/sample_background", methods=["POST"])
+def sample_background() -> dict[bool, list[float], list[float]] | Response:
+    # put incoming JSON into a dictionary
+    params = json.loads(request.data)
+
+    # verify user input is valid
+    if not param_check(params) or params.get("ratio") not in [None, "transmittance", "absorbance"]:
+        return {
+            "success": False,
+            "text": "One of the given parameters was invalid. Please change some settings and try again.",
+        }
+
+    # how the spectra are sent back (JSON lists, base64 or binary)
+    try:
+        options = response_options(params, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return {
+            "success": False,
+            "text": str(e),
+        }
+
+    # wait until the memory the spectra are predicted to need is free
+    ticket, error, message = admit(params, "pair")
+    if error:
+        return {
+            "success": False,
+            "text": message,
+        }
+    params = ticket.params
+
+    # perform, once for both spectra:
+    #   --> transmission spectrum of gas sample (calc_spectrum)
+    #   --> blackbody spectrum of source, beamsplitter, cell windows and detector response
+    # then the noise of each spectrum, and the transmittance or absorbance when asked for
+    spectra, error, message = generate_pair(params, params.get("ratio"))
+    if error:
+        return {
+            "success": False,
+            "text": message,
+        }
+
+    x_value, series = spectra
+    # the handle keeps the derived spectrum, ready for /find_peaks
+    if params.get("ratio"):
+        series = {params["ratio"]: series.pop(params["ratio"]), **series}
+
+    return send_spectrum(params, options, x_value, series, ticket.downgraded)
+
+
+@app.route("/sweep", methods=["POST"])
+def sweep() -> dict[bool, list[float], list[list[float]]] | Response:
+    # put incoming JSON into a dictionary
+    params = json.loads(request.data)
+
+    # verify user input is valid
+    if not param_check(params) or params.get("stream") or params.get("handle"):
+        return {
+            "success": False,
+            "text": "One of the given parameters was invalid. Please change some settings and try again.",
+        }
+
+    # the pressure and mole fraction of every step, and how the spectra are sent back
+    try:
+        steps = sweep_steps(params, MAX_SWEEP)
+        options = response_options(params, request.headers.get("Accept", ""))
+    except ValueError as e:
+        return {
+            "success": False,
+            "text": str(e),
+        }
+
+    # wait until the memory the spectra are predicted to need is free
+    ticket, error, message = admit(params, "sweep")
+    if error:
         return {
             "success": False,
-            "text": "Issue Processing Data"
+            "text": message,
         }
-    # https://radis.readthedocs.io/en/latest/source/radis.spectrum.spectrum.html#radis.spectrum.spectrum.Spectrum.get
-    x_value, y_value = processed_spectrum.get("transmittance_noslit")
-    # convert dictionary values to strings and return as JSON
-    return {
-        "success": True,
-        "x": list(x_value),
-        "y": list(map(str, y_value)),
-    } 
+    params = ticket.params
+
+    # perform, once for every step (or every pressure with "exact": false):
+    #   --> transmission spectrum of gas sample (calc_spectrum)
+    # then the other mole fractions scaled from it, and once for all steps:
+    #   --> blackbody spectrum of source, beamsplitter, cell windows and detector response
+    exact = bool(params.get("exact", True))
+    spectra, error, message = generate_sweep(params, steps, exact)
+    if error:
+        return {
+            "success": False,
+            "text": message,
+        }
+
+    x_value, y_values = spectra
+    # scaled mole fractions leave out the change in self-broadening, so the client is told
+    extra = {} if exact else {"approximate": True}
+    return send_spectrum(params, options, x_value, {"y": y_values}, ticket.downgraded, extra)
+
+
+@app.route("/batch", methods=["POST"])
+def batch() -> dict[bool, list[dict], str]:
+    # put incoming JSON into a dictionary
+    data = json.loads(request.data)
+    spectra = data.get("spectra")
+
+    if not isinstance(spectra, list) or not 0 < len(spectra) <= MAX_BATCH:
+        return {
+            "success": False,
+            "text": "A batch needs a list of 1 to %d spectra." % MAX_BATCH,
+        }
+
+    # verify user input is valid
+    requests = []
+    for item in spectra:
+        spectrum, error, message = read_spectrum_request(item)
+        if not error and spectrum[2]["format"] == "binary":
+            error, message = True, "The binary format cannot be used inside a batch."
+        if error:
+            return {"success": False, "text": message}
+        requests.append(spectrum)
+
+    # the spectra of a batch are calculated together, so they reserve their memory together.
+    # a batch is never downgraded
+    ticket, error, message = admit(
+        {"spectra": [(kind, params) for kind, params, _ in requests], "downgrade": False}, "batch"
+    )
+    if error:
+        return {
+            "success": False,
+            "text": message,
+        }
+
+    # perform:
+    #   --> every unique transmission spectrum of gas sample (calc_spectrum), once
+    #   --> the processing of every spectrum
+    results = generate_batch([(kind, params) for kind, params, _ in requests])
+
+    responses = []
+    for (kind, params, options), (processed, error, message) in zip(requests, results):
+        if error:
+            responses.append({"success": False, "text": message})
+        else:
+            responses.append(send_spectrum(params, options, processed[0], {"y": processed[1]}))
+
+    return {"success": True, "results": responses}
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job() -> dict[bool, str]:
+    # put incoming JSON into a dictionary
+    data = json.loads(request.data)
+
+    # verify user input is valid
+    spectrum, error, message = read_spectrum_request(data, request.headers.get("Accept", ""))
+    if not error and (not isinstance(data.get("priority", 0), int) or isinstance(data.get("priority"), bool)):
+        error, message = True, "The priority of a job must be a whole number."
+    if error:
+        return {"success": False, "text": message}
+
+    # any user may lower the priority of a job, but only an operator may raise it
+    priority = data.get("priority", 0)
+    if priority > 0 and not priority_allowed(request.headers.get(PRIORITY_HEADER)):
+        priority = 0
+
+    # perform (in a process of the job pool):
+    #   --> transmission spectrum of gas sample (calc_spectrum)
+    #   --> the processing of the spectrum
+    job = JOBS.submit(*spectrum, priority=priority)
+    if job is None:
+        return {
+            "success": False,
+            "text": "The server is busy. Please try again later.",
+        }
+
+    return {"success": True, **JOBS.status(job)}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str) -> dict[bool, str, float]:
+    job = wait_for_job()
+    if job is None:
+        return {"success": False, "text": "The job has expired or does not exist."}
+
+    return {"success": True, **JOBS.status(job)}
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id: str) -> dict[bool, list[float], list[float]] | Response:
+    job = wait_for_job()
+    if job is None:
+        return {"success": False, "text": "The job has expired or does not exist."}
+
+    if job.state != DONE:
+        return {
+            "success": False,
+            "text": job.message or "The job is %s." % job.state,
+            **JOBS.status(job),
+        }
+
+    return send_spectrum(job.params, job.options, job.result[0], {"y": job.result[1]}, job.downgraded)
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id: str) -> dict[bool, str]:
+    # a running job keeps its process until the calculation is done; only its result is thrown away
+    job = JOBS.cancel(job_id)
+    if job is None:
+        return {"success": False, "text": "The job has expired or does not exist."}
+
+    return {"success": True, **JOBS.status(job)}
+
+
+def wait_for_job() -> Job | None:
+    """
+    Looks up the job of the current request, waiting for it to finish for
+    up to 'wait' seconds (given in the query string, at most MAX_JOB_WAIT).
+
+        Returns:
+            the job, or None if there is no job with this id
+    """
+    wait = min(max(request.args.get("wait", 0, type=float), 0), MAX_JOB_WAIT)
+    return JOBS.wait(request.view_args["job_id"], wait)
 
 
 @app.route("/find_peaks", methods=["POST"])
 def handle_peaks() -> dict[bool, dict[float, float], str]:
     data = json.loads(request.data)
 
+    # a spectrum kept by /sample can be used instead of uploading x and y
+    if data.get("handle") is not None:
+        stored = SPECTRUM_STORE.get(data["handle"])
+        if stored is None:
+            return {
+                "success": False,
+                "peaks": None,
+                "text": "The spectrum has expired. Please collect it again and try again.",
+            }
+        data["x"], data["y"] = stored
+
     peaks, error = find_peaks(
         data["x"],
         data["y"],
         float(data["threshold"]),
+        data.get("lowerbound"),
+        data.get("upperbound"),
+        data.get("method", "numpy"),
     )
 
     if (peaks): 
@@ -0,0 +1,503 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    A thread-safe, least-recently-used cache with a size budget in bytes.
+
+    Values are tuples of NumPy arrays. Read-only views of the arrays are
+    stored, so any later processing has to copy them before changing them
+    and the cached value can never be modified through the cache. The
+    arrays of the caller stay writeable.
+
+    When a time-to-live is given, values also expire that many seconds after
+    they were stored.
+    """
+
+    def __init__(self, max_bytes: int, name: str = "cache", ttl: float = None) -> None:
+        """
+        Creates an empty cache.
+
+            Parameters:
+                max_bytes (int): the total size of the arrays the cache may hold
+                name (str): the name used when reporting the cache statistics
+                ttl (float): seconds a value is kept for, or None to keep values until evicted
+        """
+        self.max_bytes = max_bytes
+        self.name = name
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> tuple[np.ndarray, ...] | None:
+        """
+        Looks up a value and marks it as the most recently used.
+
+            Parameters:
+                key (Hashable): the key the value was stored under
+
+            Returns:
+                the stored value, or None if the key is not in the cache
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self.current_bytes -= self._entries.pop(key)[1]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: tuple[np.ndarray, ...]) -> tuple[np.ndarray, ...]:
+        """
+        Stores a value, evicting the least recently used values until it fits.
+        Values larger than the whole budget are returned without being stored.
+
+            Parameters:
+                key (Hashable): the key to store the value under
+                value (tuple[np.ndarray, ...]): the arrays to store
+
+            Returns:
+                read-only views of the arrays that were stored
+        """
+        # a view shares the memory of the array without copying it, and can be
+        # made read-only without changing the array of the caller
+        value = tuple(np.asarray(array).view() for array in value)
+        for array in value:
+            array.flags.writeable = False
+        size = sum(array.nbytes for array in value)
+
+        if size > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+            self._remove_expired()
+
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self._entries[key] = (value, size, expires)
+            self.current_bytes += size
+
+        return value
+
+    def _remove_expired(self) -> None:
+        """
+        Removes the values whose time-to-live has passed. Must be called with the lock held.
+        """
+        if self.ttl is None:
+            return
+
+        now = time.monotonic()
+        expired = [key for key, (_, _, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        """
+        Removes every value from the cache. The statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Reports how the cache is being used.
+
+            Returns:
+                a dictionary with the hits, misses, evictions, number of entries and bytes used
+        """
+        with self._lock:
+            self._remove_expired()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class SharedCache:
+    """
+    A least-recently-used store with a size budget in bytes and a
+    time-to-live, whose values every process on the machine can read (ex.
+    all gunicorn workers). Like the values SingleFlight shares across
+    processes, every value is a .npz file in a directory, named after its
+    key and replaced in one step, so it is never read half written. Keep the
+    directory on a memory-backed filesystem (ex. /dev/shm), so the values
+    are never written to disk.
+
+    A file is stored at its modification time and last used at its access
+    time, which 'get()' sets itself, so every process evicts the least
+    recently used values first. Storing a value holds an fcntl lock on the
+    directory, so two processes never evict for each other.
+
+    Like LRUCache, values are tuples of NumPy arrays and are returned
+    read-only. The hits, misses and evictions are counted per process.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, name: str = "shared", ttl: float = None) -> None:
+        """
+        Creates the directory of the store, if it does not exist.
+
+            Parameters:
+                directory (str): where the values are kept
+                max_bytes (int): the total size of the files the store may hold
+                name (str): the name used when reporting the statistics
+                ttl (float): seconds a value is kept for, or None to keep values until evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+        # only this user can read the values
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def get(self, key: Hashable) -> tuple[np.ndarray, ...] | None:
+        """
+        Looks up a value and marks it as the most recently used.
+
+            Parameters:
+                key (Hashable): the key the value was stored under
+
+            Returns:
+                the stored value, or None if the key is not in the store
+        """
+        path = self._path(key)
+        value = None
+        try:
+            stored_at = os.stat(path).st_mtime
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                os.remove(path)
+            else:
+                with np.load(path) as stored:
+                    value = tuple(stored[f"arr_{number}"] for number in range(len(stored.files)))
+                os.utime(path, (time.time(), stored_at))
+        except OSError:
+            # another process removed the value (ex. evicted it) in the meantime
+            pass
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        for array in value:
+            array.flags.writeable = False
+        return value
+
+    def put(self, key: Hashable, value: tuple[np.ndarray, ...]) -> tuple[np.ndarray, ...]:
+        """
+        Stores a value, evicting the least recently used values until it fits.
+        Values larger than the whole budget are returned without being stored.
+
+            Parameters:
+                key (Hashable): the key to store the value under
+                value (tuple[np.ndarray, ...]): the arrays to store
+
+            Returns:
+                read-only views of the arrays that were stored
+        """
+        value = tuple(np.asarray(array).view() for array in value)
+        for array in value:
+            array.flags.writeable = False
+        size = sum(array.nbytes for array in value)
+
+        if size > self.max_bytes:
+            return value
+
+        path = self._path(key)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        with self._lock, open(os.path.join(self.directory, "store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._make_room(size, path)
+
+                # the file is replaced in one step, so it is never read half written
+                with open(partial, "wb") as f:
+                    np.savez(f, *value)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return value
+
+    def _make_room(self, size: int, path: str) -> None:
+        """
+        Removes the values whose time-to-live has passed, then the least
+        recently used values until 'size' more bytes fit. Must be called with
+        the lock of the directory held.
+
+            Parameters:
+                size (int): the bytes of the value about to be stored
+                path (str): the file of the value about to be stored, which it replaces
+        """
+        entries = []
+        for file_path, stat in self._files():
+            if file_path != path and not self._expired(stat):
+                entries.append((stat.st_atime, stat.st_size, file_path))
+            else:
+                self._remove(file_path)
+
+        total = sum(file_size for _, file_size, _ in entries)
+        for _, file_size, file_path in sorted(entries):
+            if total + size <= self.max_bytes:
+                break
+            self._remove(file_path)
+            total -= file_size
+            self.evictions += 1
+
+    def _files(self) -> list[tuple[str, os.stat_result]]:
+        """
+        Lists the files of the stored values.
+
+            Returns:
+                the path and status of every file
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((path, os.stat(path)))
+                except OSError:
+                    pass
+        return files
+
+    def _expired(self, stat: os.stat_result) -> bool:
+        """
+        Checks whether the time-to-live of a stored value has passed.
+        """
+        return self.ttl is not None and time.time() - stat.st_mtime > self.ttl
+
+    def _remove(self, path: str) -> None:
+        """
+        Removes a file, unless another process already has.
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _path(self, key: Hashable) -> str:
+        """
+        Names the file of a key.
+        """
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest() + ".npz")
+
+    def clear(self) -> None:
+        """
+        Removes every value from the store. The statistics are kept.
+        """
+        for path, _ in self._files():
+            self._remove(path)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Reports how the store is being used. The entries and bytes are those
+        of all processes; the hits, misses and evictions those of this one.
+
+            Returns:
+                a dictionary with the hits, misses, evictions, number of entries and bytes used
+        """
+        files = [stat for _, stat in self._files() if not self._expired(stat)]
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(files),
+                "bytes": sum(stat.st_size for stat in files),
+                "max_bytes": self.max_bytes,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls that run at the same time. The first caller of
+    a key runs the function; callers of the same key that arrive while it
+    runs wait for it and get the same value (or the same exception) instead
+    of running the function again.
+
+    Within a process the callers wait on an event. When a directory is
+    given, calls are also coalesced across processes (ex. gunicorn workers):
+    the caller takes an exclusive fcntl lock on a file named after the key,
+    and the value is written next to it, so a caller from another process
+    that was waiting for the lock reads the value instead of calculating it.
+    Values on disk are used for 'ttl' seconds.
+
+    Like LRUCache, values are tuples of NumPy arrays.
+    """
+
+    def __init__(self, name: str = "single-flight", directory: str = None, ttl: float = 60) -> None:
+        """
+        Creates a single-flight group.
+
+            Parameters:
+                name (str): the name used when reporting the statistics
+                directory (str): where the lock and value files are kept, or None to only coalesce within this process
+                ttl (float): seconds a value on disk is used for
+        """
+        self.name = name
+        self.directory = directory
+        self.ttl = ttl
+
+        self.calls = 0
+        self.waited = 0
+        self.shared = 0
+
+        # key -> [event, value, exception] of the call that is running
+        self._running = {}
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def do(self, key: Hashable, function: Callable[[], tuple[np.ndarray, ...]]) -> tuple[np.ndarray, ...]:
+        """
+        Runs the function, unless a call of the same key is already running.
+
+            Parameters:
+                key (Hashable): the key of the call
+                function (Callable): calculates the value
+
+            Returns:
+                the value of the call
+        """
+        with self._lock:
+            call = self._running.get(key)
+            leader = call is None
+            if leader:
+                call = self._running[key] = [threading.Event(), None, None]
+                self.calls += 1
+            else:
+                self.waited += 1
+
+        if not leader:
+            call[0].wait()
+        else:
+            try:
+                call[1] = self._run(key, function)
+            except Exception as e:
+                call[2] = e
+            finally:
+                # the function was interrupted (ex. SystemExit when a worker is stopped), which only
+                # the running call re-raises. the callers waiting on it must not take None for a value
+                if call[1] is None and call[2] is None:
+                    call[2] = RuntimeError("calculation aborted")
+                with self._lock:
+                    del self._running[key]
+                call[0].set()
+
+        if call[2] is not None:
+            raise call[2]
+        return call[1]
+
+    def _run(self, key: Hashable, function: Callable[[], tuple[np.ndarray, ...]]) -> tuple[np.ndarray, ...]:
+        """
+        Runs the function, holding the lock of the key across processes when there is a directory.
+
+            Parameters:
+                key (Hashable): the key of the call
+                function (Callable): calculates the value
+
+            Returns:
+                the value, calculated or read from another process
+        """
+        if not self.directory:
+            return function()
+
+        path = os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest())
+
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            os.utime(path + ".lock")
+            try:
+                # another process may have calculated the value while this one waited for the lock
+                if os.path.exists(path + ".npz") and time.time() - os.path.getmtime(path + ".npz") < self.ttl:
+                    with np.load(path + ".npz") as stored:
+                        value = tuple(stored[f"arr_{number}"] for number in range(len(stored.files)))
+                    with self._lock:
+                        self.shared += 1
+                    return value
+
+                value = function()
+
+                # the file is replaced in one step, so it is never read half written
+                with open(path + ".partial", "wb") as f:
+                    np.savez(f, *value)
+                os.replace(path + ".partial", path + ".npz")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._remove_expired()
+        return value
+
+    def _remove_expired(self) -> None:
+        """
+        Removes the values on disk whose time-to-live has passed, and lock files
+        that have not been used for a while. Removing a lock file another
+        process is waiting on only means that the key may be calculated twice.
+        """
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                age = now - os.path.getmtime(path)
+                if (name.endswith(".npz") and age > self.ttl) or (name.endswith(".lock") and age > 10 * self.ttl):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> dict[str, int]:
+        """
+        Reports how the calls were coalesced.
+
+            Returns:
+                a dictionary with the calls that ran, the callers that waited for one and the values read from other processes
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "waited": self.waited,
+                "shared": self.shared,
+                "running": len(self._running),
+            }
@@ -0,0 +1,290 @@
+import base64
+import json
+import struct
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+from flask import Response
+
+# formats a spectrum response can be sent in
+#   json   --> x and y-values as JSON lists (the default)
+#   base64 --> little-endian binary x and y-values, base64 encoded inside JSON
+#   binary --> little-endian binary x and y-values as an application/octet-stream body
+FORMATS = ["json", "base64", "binary"]
+
+# numpy dtypes of the binary formats. both are little-endian
+DTYPES = {
+    "float32": "<f4",
+    "float64": "<f8",
+}
+
+# point count of the binary frame that reports an error in a streamed spectrum
+ERROR_FRAME = 0xFFFFFFFF
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def response_options(params: dict[str, object], accept: str = "") -> dict[str, object]:
+    """
+    Reads how the user wants a spectrum sent back. The request parameters win
+    over the Accept header, and JSON lists are used when neither is given.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            accept (str): the Accept header of the request
+
+        Returns:
+            a dictionary with the format, dtype, whether to send a grid descriptor instead of the x-values
+            and the most points to send
+    """
+    response_format = params.get("format")
+    if response_format is None:
+        response_format = "binary" if "application/octet-stream" in (accept or "") else "json"
+
+    dtype = params.get("dtype", "float64")
+
+    if response_format not in FORMATS:
+        raise ValueError(f"Unknown response format: {response_format}")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown response dtype: {dtype}")
+
+    # decimation keeps the lowest and highest point of every bucket, so it needs at least two
+    max_points = params.get("maxPoints")
+    if max_points is not None:
+        if isinstance(max_points, bool) or not isinstance(max_points, (int, float, str)):
+            raise ValueError(f"'maxPoints' must be a whole number: {max_points}")
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            raise ValueError(f"'maxPoints' must be a whole number: {max_points}")
+        if max_points < 2:
+            raise ValueError(f"'maxPoints' must be at least 2: {max_points}")
+
+    return {
+        "format": response_format,
+        "dtype": dtype,
+        "grid": bool(params.get("grid", False)),
+        "max_points": max_points,
+    }
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def grid_descriptor(x_value: np.ndarray) -> dict[str, float]:
+    """
+    Describes evenly spaced x-values by their first value, step and count.
+
+        Parameters:
+            x_value (np.ndarray): the evenly spaced x-values
+
+        Returns:
+            a dictionary with the start, step and count of the grid
+    """
+    count = len(x_value)
+    step = float(x_value[-1] - x_value[0]) / (count - 1) if count > 1 else 0.0
+
+    return {
+        "start": float(x_value[0]) if count else 0.0,
+        "step": step,
+        "count": count,
+    }
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def encode_spectrum(x_value: np.ndarray, series: dict[str, np.ndarray],
+                    options: dict[str, object], extra: dict[str, object] = None) -> dict | Response:
+    """
+    Builds the response for a spectrum in the format chosen by 'response_options()'.
+
+    The binary formats are built straight from the NumPy buffers: the arrays
+    are read through memoryviews and copied once into the response body (WSGI
+    servers only send bytes), and are only converted first when the dtype or
+    byte order has to change, without going through Python floats or decimal strings.
+
+        Parameters:
+            x_value (np.ndarray): the x-values of the spectrum
+            series (dict): the y-values to send, by name (ex. {"y": y_value}). 2D arrays are sent row by row
+            options (dict): the options from 'response_options()'
+            extra (dict): additional JSON fields to send with the spectrum. the binary format sends
+                          them as X-Spectrum-<key> headers, strings as they are and other values as JSON
+
+        Returns:
+            a dictionary for the JSON formats, or a Response for the binary format
+    """
+    extra = extra or {}
+
+    # the binary formats send stacked spectra (ex. a sweep) as their rows one after the other
+    rows = max([len(y_value) for y_value in series.values() if np.ndim(y_value) == 2], default=1)
+
+    match options["format"]:
+        case "json":
+            payload = {"success": True, **extra}
+            if options["grid"]:
+                payload["grid"] = grid_descriptor(x_value)
+            else:
+                payload["x"] = list(x_value)
+            for name, y_value in series.items():
+                # stacked spectra (ex. a sweep) are sent as one list per row
+                payload[name] = [list(map(str, row)) for row in y_value] if np.ndim(y_value) == 2 else list(map(str, y_value))
+            return payload
+
+        case "base64":
+            dtype = DTYPES[options["dtype"]]
+            payload = {"success": True, **extra, "encoding": "base64", "dtype": options["dtype"], "rows": rows}
+            if options["grid"]:
+                payload["grid"] = grid_descriptor(x_value)
+            else:
+                payload["x"] = __b64(x_value, dtype)
+            for name, y_value in series.items():
+                payload[name] = __b64(y_value, dtype)
+            return payload
+
+        case "binary":
+            dtype = DTYPES[options["dtype"]]
+            headers = {
+                "X-Spectrum-Dtype": options["dtype"],
+                "X-Spectrum-Count": str(len(x_value)),
+                "X-Spectrum-Rows": str(rows),
+            }
+            chunks = []
+            names = []
+            if options["grid"]:
+                grid = grid_descriptor(x_value)
+                headers["X-Spectrum-Grid"] = "%r,%r,%d" % (grid["start"], grid["step"], grid["count"])
+            else:
+                names.append("x")
+                chunks.append(__buffer(x_value, dtype))
+            for name, y_value in series.items():
+                names.append(name)
+                chunks.append(__buffer(y_value, dtype))
+            headers["X-Spectrum-Series"] = ",".join(names)
+            for key, value in extra.items():
+                headers[f"X-Spectrum-{key}"] = value if isinstance(value, str) else json.dumps(value)
+
+            return Response(b"".join(chunks), mimetype="application/octet-stream", headers=headers)
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def stream_spectrum(segments: Iterable[tuple[tuple[np.ndarray, np.ndarray], bool, str]],
+                    options: dict[str, object]) -> Response:
+    """
+    Builds a chunked response that sends each segment of a spectrum as soon
+    as it has been calculated.
+
+    The JSON formats send one JSON object per line (NDJSON), each one built
+    by 'encode_spectrum()' with its segment number. The binary format sends
+    one frame per segment: the number of points as a little-endian uint32,
+    then the x-values (or the start and step of the grid as two float64s
+    when 'grid' is set) and the y-values. An error ends the stream with an
+    {"success": false} line, or a frame with a point count of ERROR_FRAME
+    followed by the uint32 length of the UTF-8 message and the message.
+
+        Parameters:
+            segments (Iterable): the processed x and y-values of each segment, or the message text if an error occurs
+            options (dict): the options from 'response_options()'
+
+        Returns:
+            the streamed response
+    """
+    if options["format"] != "binary":
+        return Response(__ndjson_frames(segments, options), mimetype="application/x-ndjson")
+
+    headers = {
+        "X-Spectrum-Dtype": options["dtype"],
+        "X-Spectrum-Series": "y" if options["grid"] else "x,y",
+        "X-Spectrum-Stream": "frames",
+    }
+    return Response(__binary_frames(segments, options), mimetype="application/octet-stream", headers=headers)
+
+
+def __ndjson_frames(segments: Iterable[tuple[tuple[np.ndarray, np.ndarray], bool, str]],
+                    options: dict[str, object]) -> Iterator[str]:
+    """
+    Encodes each segment of a spectrum as a line of JSON.
+
+        Parameters:
+            segments (Iterable): the processed x and y-values of each segment, or the message text if an error occurs
+            options (dict): the options from 'response_options()'
+
+        Returns:
+            the lines of the response
+    """
+    for number, (processed, error, message) in enumerate(segments):
+        if error:
+            yield json.dumps({"success": False, "text": message}) + "\n"
+            return
+
+        x_value, y_value = processed
+        yield json.dumps(encode_spectrum(x_value, {"y": y_value}, options, {"segment": number})) + "\n"
+
+
+def __binary_frames(segments: Iterable[tuple[tuple[np.ndarray, np.ndarray], bool, str]],
+                    options: dict[str, object]) -> Iterator[bytes]:
+    """
+    Encodes each segment of a spectrum as a binary frame.
+
+        Parameters:
+            segments (Iterable): the processed x and y-values of each segment, or the message text if an error occurs
+            options (dict): the options from 'response_options()'
+
+        Returns:
+            the frames of the response
+    """
+    dtype = DTYPES[options["dtype"]]
+
+    for processed, error, message in segments:
+        if error:
+            text = message.encode("utf-8")
+            yield struct.pack("<II", ERROR_FRAME, len(text)) + text
+            return
+
+        x_value, y_value = processed
+        if options["grid"]:
+            grid = grid_descriptor(x_value)
+            frame = [struct.pack("<Idd", grid["count"], grid["start"], grid["step"])]
+        else:
+            frame = [struct.pack("<I", len(x_value)), __buffer(x_value, dtype)]
+        frame.append(__buffer(y_value, dtype))
+        yield b"".join(frame)
+
+
+def __little_endian(values: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Views the values as a contiguous little-endian array, only copying when
+    the dtype or memory layout has to change.
+
+        Parameters:
+            values (np.ndarray): the values to convert
+            dtype (str): the numpy dtype to convert to
+
+        Returns:
+            the converted values
+    """
+    return np.ascontiguousarray(values, dtype=dtype)
+
+
+def __buffer(values: np.ndarray, dtype: str) -> memoryview:
+    """
+    Views the bytes of the values as little-endian numbers without copying
+    them, unless the dtype or memory layout has to change.
+
+        Parameters:
+            values (np.ndarray): the values to view
+            dtype (str): the numpy dtype to view them as
+
+        Returns:
+            a flat memoryview of the bytes
+    """
+    return memoryview(__little_endian(values, dtype)).cast("B")
+
+
+def __b64(values: np.ndarray, dtype: str) -> str:
+    """
+    Base64 encodes the little-endian bytes of the values.
+
+        Parameters:
+            values (np.ndarray): the values to encode
+            dtype (str): the numpy dtype to encode them as
+
+        Returns:
+            the encoded values
+    """
+    return base64.b64encode(__buffer(values, dtype)).decode("ascii")
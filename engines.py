@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from linedb import ISOTOPES, LineDatabase, has_linedb, open_linedb
+from processing_utils import WAVEMIN, WAVEMAX, WING_MARGIN, calc_wstep
+
+# molecules whose line databases are loaded when the server starts (ex. "CO,CO2,H2O")
+WARM_MOLECULES = [molecule for molecule in os.environ.get("FTIR_WARM_MOLECULES", "").split(",") if molecule]
+
+# when set, molecules that were not warmed get an engine the first time they are requested
+LAZY_ENGINES = os.environ.get("FTIR_LAZY_ENGINES", "") not in ["", "0", "false"]
+
+# loaded engines, by molecule
+ENGINES = {}
+ENGINES_LOCK = threading.Lock()
+
+# boot time and resident memory of every engine, filled in by 'load_engine()'
+ENGINE_REPORT = {}
+
+# the version of radis engines were written and tested against
+RADIS_VERSION = "0.17.1"
+
+# private parts of SpectrumFactory an engine relies on: methods it calls and slots it sets
+# (see scripts/requirements.txt). when one of them is missing, no engines are loaded and
+# every spectrum goes through 'calc_spectrum()'
+RADIS_INTERNALS = {
+    "_reset_references": "method",
+    "_init_equilibrium_partition_functions": "method",
+    "_remove_unecessary_columns": "method",
+    "_wstep": "slot",
+    "_neighbour_lines": "slot",
+}
+
+# whether the installed radis has RADIS_INTERNALS, checked by 'engines_supported()'
+ENGINES_SUPPORTED = None
+
+logger = logging.getLogger(__name__)
+
+# radis is only imported when the first engine is loaded
+if TYPE_CHECKING:
+    from radis import Spectrum
+
+
+class Engine:
+    """
+    Calculates the ideal spectra of one molecule from a line database that
+    is loaded once.
+
+    'calc_spectrum()' builds a new SpectrumFactory and reads the HITRAN
+    files for every spectrum. An engine fetches the lines of the whole
+    WAVEMIN-WAVEMAX range (plus WING_MARGIN) into memory once, and keeps
+    one SpectrumFactory. For each spectrum the factory is pointed at the
+    requested window and given only the lines 'calc_spectrum()' would have
+    loaded for it, so the result is the same without any file access.
+
+    When the molecule has a line database converted by
+    'scripts/convert_hitran.py' ('linedb.py'), nothing is loaded up front:
+    the lines of each window are read from its memory-mapped columns.
+    An engine can also fetch only the lines of a narrower window, for the
+    segments of one streamed spectrum ('generate_segments()').
+
+    The factory is not thread-safe, so one spectrum of a molecule is
+    calculated at a time.
+    """
+
+    def __init__(self, molecule: str, database: LineDatabase = None,
+                 window: tuple[float, float] = (WAVEMIN, WAVEMAX)) -> None:
+        """
+        Loads the line database of a molecule.
+
+            Parameters:
+                molecule (str): the molecule, as the user gives it
+                database (LineDatabase): the converted line database of the molecule, or None to fetch the HITRAN files
+                window (tuple): the lowest and highest wavenumber of the spectra, when the HITRAN files are fetched
+        """
+        import radis
+        from radis import SpectrumFactory
+
+        self.molecule = molecule
+        self.database = database
+        self._lock = threading.Lock()
+
+        wstep = calc_wstep(1, 0)
+        self.factory = SpectrumFactory(
+            wavenum_min=window[0],
+            wavenum_max=window[1],
+            species=molecule,
+            isotope="1,2,3",
+            wstep=wstep,
+            neighbour_lines=WING_MARGIN,
+            cutoff=1e-27,
+            verbose=False,
+            warnings={
+                "AccuracyError": "ignore",
+                "AccuracyWarning": "ignore"},
+        )
+        self.factory.dataframe_type = radis.config["DATAFRAME_ENGINE"]
+
+        if database is not None:
+            # the lines are read from the memory-mapped columns for every spectrum,
+            # so only the partition functions fetch_databank() sets up are needed
+            self.factory.params.dbformat = "hitran"
+            self.factory._reset_references()
+            self.factory._init_equilibrium_partition_functions(None)
+            self.lines = None
+            return
+
+        self.factory.fetch_databank(
+            source="hitran",
+            load_columns="equilibrium",
+            load_energies=False,
+            parse_local_global_quanta=False,
+            levelsfmt=None,
+        )
+
+        # fetch_databank() sorts the lines by wavenumber
+        self.lines = self.factory.df0
+        self.wavenumbers = self.lines["wav"].to_numpy()
+
+    def __len__(self) -> int:
+        return len(self.database) if self.database is not None else len(self.lines)
+
+    def calc_spectrum(self, wave_min: float, wave_max: float, wstep: float, neighbour_lines: float,
+                      pressure: float, mole: float) -> Spectrum:
+        """
+        Calculates an ideal spectrum, with the same arguments 'generate_ideal()'
+        gives 'calc_spectrum()'.
+
+            Parameters:
+                wave_min (float): the lower wavenumber of the spectrum
+                wave_max (float): the upper wavenumber of the spectrum
+                wstep (float): the wstep of the grid
+                neighbour_lines (float): include the lines this far outside of the window
+                pressure (float): the pressure of the gas (bar)
+                mole (float): the mole fraction of the molecule
+
+            Returns:
+                the ideal spectrum
+        """
+        from radis.misc.warning import EmptyDatabaseError
+
+        # the lines fetch_databank() would load for this window
+        if self.database is not None:
+            lines = self.database.lines(wave_min - neighbour_lines, wave_max + neighbour_lines)
+        else:
+            low, high = np.searchsorted(self.wavenumbers, [wave_min - neighbour_lines, wave_max + neighbour_lines])
+            lines = self.lines.iloc[low:high].copy()
+
+        # a line database converted from the whole HITRAN cache may have lines of other isotopes,
+        # which the factory has no partition functions for
+        if "iso" in lines and not lines["iso"].isin(ISOTOPES).all():
+            lines = lines[lines["iso"].isin(ISOTOPES)]
+
+        if len(lines) == 0:
+            raise EmptyDatabaseError(
+                f"{self.molecule} has no lines on range {wave_min:.2f}-{wave_max:.2f} cm-1"
+            )
+
+        # like fetch_databank(), turn the id and iso columns into attributes when the window
+        # has a single value of them. Radis fails on such a column
+        self.factory._remove_unecessary_columns(lines)
+
+        with self._lock:
+            factory = self.factory
+            factory.input.wavenum_min = wave_min
+            factory.input.wavenum_max = wave_max
+            # the factory refuses to run when these differ from the ones it was created with,
+            # since it would need to reload its lines. the lines are given again just below
+            factory.params.wstep = factory._wstep = wstep
+            factory.params.neighbour_lines = factory._neighbour_lines = neighbour_lines
+            factory.df0 = lines
+            factory.misc.total_lines = len(lines)
+
+            try:
+                return factory.eq_spectrum(
+                    Tgas=294.15,
+                    pressure=pressure,
+                    mole_fraction=mole,
+                    path_length=10,
+                )
+            finally:
+                factory.df0 = self.lines
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def load_engine(molecule: str) -> Engine:
+    """
+    Loads the engine of a molecule, if it is not loaded yet, and records how
+    long it took and how much resident memory it added in ENGINE_REPORT.
+
+        Parameters:
+            molecule (str): the molecule
+
+        Returns:
+            the engine
+    """
+    with ENGINES_LOCK:
+        if molecule in ENGINES:
+            return ENGINES[molecule]
+
+        start, rss = time.perf_counter(), rss_bytes()
+        engine = Engine(molecule, open_linedb(molecule))
+        ENGINE_REPORT[molecule] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "rss_mb": round((rss_bytes() - rss) / 2**20, 1),
+            "lines": len(engine),
+        }
+        ENGINES[molecule] = engine
+
+    return engine
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def get_engine(molecule: str) -> Engine | None:
+    """
+    Finds the engine of a molecule.
+
+        Parameters:
+            molecule (str): the molecule
+
+        Returns:
+            the engine, or None if the molecule has no engine, no converted line database and LAZY_ENGINES is off
+    """
+    engine = ENGINES.get(molecule)
+    if engine is None and (LAZY_ENGINES or has_linedb(molecule)) and engines_supported():
+        engine = load_engine(molecule)
+    return engine
+
+
+def engines_supported() -> bool:
+    """
+    Checks once whether the installed radis has the private parts an engine
+    relies on (RADIS_INTERNALS): the methods have to be functions of
+    SpectrumFactory and the attributes its slots, since a factory cannot be
+    given attributes it has no slot for. They are not part of the public
+    API of radis, so a version other than RADIS_VERSION may rename or remove
+    them. A missing one is logged as an error, and one of the other version
+    as a warning.
+
+        Returns:
+            whether engines can be loaded
+    """
+    global ENGINES_SUPPORTED
+    if ENGINES_SUPPORTED is None:
+        import inspect
+        import types
+
+        import radis
+        from radis import SpectrumFactory
+
+        kinds = {"method": types.FunctionType, "slot": types.MemberDescriptorType}
+        missing = []
+        for name, kind in RADIS_INTERNALS.items():
+            try:
+                found = isinstance(inspect.getattr_static(SpectrumFactory, name), kinds[kind])
+            except AttributeError:
+                found = False
+            if not found:
+                missing.append(f"{kind} {name}")
+
+        if missing:
+            logger.error("radis %s lacks the SpectrumFactory %s engines rely on (written for radis %s), "
+                         "spectra are calculated with calc_spectrum() instead",
+                         radis.__version__, ", ".join(missing), RADIS_VERSION)
+        elif radis.__version__ != RADIS_VERSION:
+            logger.warning("engines were tested with radis %s, not the installed %s",
+                           RADIS_VERSION, radis.__version__)
+        ENGINES_SUPPORTED = not missing
+
+    return ENGINES_SUPPORTED
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def warm_start(molecules: list[str] = None) -> dict[str, object]:
+    """
+    Loads the engines of WARM_MOLECULES (or the given molecules). Called
+    when the server starts; with Gunicorn's --preload this happens once in
+    the master process, and the forked workers share the loaded lines.
+
+    A molecule that fails to load is reported and skipped; its spectra are
+    then calculated with 'calc_spectrum()' as usual. So are all of them when
+    the installed radis does not support engines ('engines_supported()').
+
+        Parameters:
+            molecules (list[str]): the molecules to load, defaults to WARM_MOLECULES
+
+        Returns:
+            the total boot time and resident memory, and ENGINE_REPORT
+    """
+    start = time.perf_counter()
+
+    for molecule in WARM_MOLECULES if molecules is None else molecules:
+        if not engines_supported():
+            ENGINE_REPORT[molecule] = {"error": "the installed radis does not support engines"}
+            continue
+        try:
+            load_engine(molecule)
+            logger.info("warm start: %s: %s", molecule, ENGINE_REPORT[molecule])
+        except Exception as e:
+            ENGINE_REPORT[molecule] = {"error": str(e)}
+            logger.warning("warm start: %s failed: %s", molecule, e)
+
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+        "molecules": ENGINE_REPORT,
+    }
+
+
+def rss_bytes() -> int:
+    """
+    Measures the resident memory of this process.
+
+        Returns:
+            the resident memory in bytes
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # the peak resident memory (in kilobytes), on systems without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
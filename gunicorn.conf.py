@@ -0,0 +1,26 @@
+# gunicorn reads this file from the working directory, ex.
+#   gunicorn wsgi:app
+#   FTIR_PRELOAD=1 WEB_CONCURRENCY=4 gunicorn wsgi:app
+import time
+
+from startup import PRELOAD, STARTUP_REPORT, startup_report
+
+bind = "0.0.0.0:5000"
+
+# with FTIR_PRELOAD=1 wsgi.py (and everything it imports) is loaded once in the master before
+# the workers are forked. otherwise every worker loads it after it is forked
+preload_app = PRELOAD
+
+
+def when_ready(server) -> None:
+    server.log.info(f"master ready: {startup_report()}")
+
+
+def post_fork(server, worker) -> None:
+    STARTUP_REPORT["forked"] = time.perf_counter()
+
+
+def post_worker_init(worker) -> None:
+    # the time from the fork until the worker can answer requests
+    STARTUP_REPORT["worker_boot_seconds"] = round(time.perf_counter() - STARTUP_REPORT.pop("forked"), 3)
+    worker.log.info(f"worker ready: {startup_report()}")
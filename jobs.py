@@ -0,0 +1,429 @@
+import heapq
+import hmac
+import itertools
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from admission import AdmissionController
+from processing import generate_processed
+
+# processes calculating jobs. each one keeps its own spectrum and component caches
+JOB_WORKERS = int(os.environ.get("FTIR_JOB_WORKERS", 2))
+
+# the most jobs that may wait for a free process
+JOB_QUEUE_SIZE = int(os.environ.get("FTIR_JOB_QUEUE", 100))
+
+# priorities are clamped to -JOB_MAX_PRIORITY..JOB_MAX_PRIORITY, so no job can be queued
+# beyond the reach of every other one
+JOB_MAX_PRIORITY = int(os.environ.get("FTIR_JOB_MAX_PRIORITY", 10))
+
+# seconds a finished job and its result are kept for
+JOB_TTL = float(os.environ.get("FTIR_JOB_TTL", 600))
+
+# the secret an operator sends in PRIORITY_HEADER to give a job a priority above 0. when
+# unset, no job can be raised above the others
+JOB_PRIORITY_TOKEN = os.environ.get("FTIR_JOB_PRIORITY_TOKEN", "")
+PRIORITY_HEADER = "X-Job-Priority-Token"
+
+# states of a job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = [DONE, FAILED, CANCELLED]
+
+# queue the pool processes send their progress on, set by '_init_worker()'
+_progress_queue = None
+
+
+class Job:
+    """
+    A sample or background spectrum that is calculated in the background.
+    """
+
+    def __init__(self, kind: str, params: dict[str, object], options: dict[str, object], priority: int) -> None:
+        """
+        Creates a queued job.
+
+            Parameters:
+                kind (str): "sample" or "background"
+                params (dict): The parameters provided by the user
+                options (dict): the options from 'response_options()'
+                priority (int): jobs with a higher priority run first
+        """
+        self.id = secrets.token_urlsafe(16)
+        self.kind = kind
+        self.params = params
+        self.options = options
+        self.priority = priority
+        self.order = 0
+
+        self.state = QUEUED
+        self.stage = QUEUED
+        self.progress = 0.0
+        self.result = None
+        self.message = None
+        self.finished = None
+
+        # the admission of the job while it runs, and what was changed to fit the budget
+        self.ticket = None
+        self.downgraded = None
+
+
+class JobQueue:
+    """
+    Runs jobs in a bounded pool of processes, highest priority first.
+
+    Jobs wait in a priority queue in this process and are only handed to the
+    pool when one of its processes is free, so a late high-priority job
+    overtakes the ones already waiting. The pool processes report their
+    progress back through a multiprocessing queue; no external broker is
+    needed.
+
+    The pool is only started when the first job is submitted. With an
+    admission controller, a job reserves its memory when it is handed to the
+    pool and releases it when it is done, like a request to the endpoints;
+    a job that is rejected fails with the message.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE, ttl: float = JOB_TTL,
+                 admission: AdmissionController = None) -> None:
+        """
+        Creates an empty job queue.
+
+            Parameters:
+                workers (int): the number of processes calculating jobs
+                max_queued (int): the most jobs that may wait for a free process
+                ttl (float): seconds a finished job is kept for
+                admission (AdmissionController): admits every job before it runs, or None
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.admission = admission
+
+        self._jobs = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._running = 0
+        self._condition = threading.Condition()
+        self._context = multiprocessing.get_context("spawn")
+        self._progress = None
+        self._pool = None
+
+    def submit(self, kind: str, params: dict[str, object], options: dict[str, object],
+               priority: int = 0) -> Job | None:
+        """
+        Queues a job.
+
+            Parameters:
+                kind (str): "sample" or "background"
+                params (dict): The parameters provided by the user
+                options (dict): the options from 'response_options()'
+                priority (int): jobs with a higher priority run first, clamped to JOB_MAX_PRIORITY
+
+            Returns:
+                the queued job, or None if the queue is full
+        """
+        priority = min(max(priority, -JOB_MAX_PRIORITY), JOB_MAX_PRIORITY)
+
+        with self._condition:
+            self._remove_expired()
+            if len(self._heap) >= self.max_queued:
+                return None
+
+            if self._pool is None:
+                self._start()
+
+            job = Job(kind, params, options, priority)
+            job.order = next(self._order)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (-priority, job.order, job))
+            self._condition.notify_all()
+
+        return job
+
+    def wait(self, job_id: str, timeout: float = 0) -> Job | None:
+        """
+        Looks up a job, waiting up to 'timeout' seconds for it to finish.
+
+            Parameters:
+                job_id (str): the id of the job
+                timeout (float): the most seconds to wait for
+
+            Returns:
+                the job, or None if there is no job with this id
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            self._remove_expired()
+            job = self._jobs.get(job_id)
+            while job is not None and job.state not in FINISHED:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+        return job
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancels a job. A queued job is removed from the queue. A running
+        calculation cannot be interrupted: its process keeps calculating it
+        (and counts as busy, so it takes no other job) until it is done, and
+        the result is then thrown away.
+
+            Parameters:
+                job_id (str): the id of the job
+
+            Returns:
+                the job, or None if there is no job with this id
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return job
+
+            if job.state == QUEUED:
+                self._heap = [entry for entry in self._heap if entry[2] is not job]
+                heapq.heapify(self._heap)
+
+            job.state = CANCELLED
+            job.stage = CANCELLED
+            job.finished = time.monotonic()
+            self._condition.notify_all()
+
+        return job
+
+    def status(self, job: Job) -> dict[str, object]:
+        """
+        Reports the state of a job.
+
+            Parameters:
+                job (Job): the job
+
+            Returns:
+                a dictionary with the id, state, stage, progress, place in the queue and error message of the job
+        """
+        with self._condition:
+            status = {
+                "id": job.id,
+                "state": job.state,
+                "stage": job.stage,
+                "progress": job.progress,
+            }
+            if job.state == QUEUED:
+                # the number of jobs that will run before this one
+                status["position"] = sum(1 for entry in self._heap if entry[:2] < (-job.priority, job.order))
+            if job.message:
+                status["message"] = job.message
+            return status
+
+    def stats(self) -> dict[str, int]:
+        """
+        Reports how the job queue is being used.
+
+            Returns:
+                a dictionary with the number of queued, running and kept jobs
+        """
+        with self._condition:
+            return {
+                "queued": len(self._heap),
+                "running": self._running,
+                "jobs": len(self._jobs),
+                "workers": self.workers,
+            }
+
+    def _start(self) -> None:
+        """
+        Starts the pool and the threads that feed it. Must be called with the lock held.
+        """
+        self._progress = self._context.Queue()
+        self._pool = self._new_pool()
+        threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True).start()
+        threading.Thread(target=self._listen, name="job-progress", daemon=True).start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        """
+        Creates the pool of processes calculating jobs.
+
+            Returns:
+                the pool
+        """
+        return ProcessPoolExecutor(
+            self.workers, mp_context=self._context, initializer=_init_worker, initargs=(self._progress,)
+        )
+
+    def _dispatch(self) -> None:
+        """
+        Hands the highest priority job to the pool whenever one of its processes is free.
+        """
+        while True:
+            with self._condition:
+                while not self._heap or self._running >= self.workers:
+                    self._condition.wait()
+
+                _, _, job = heapq.heappop(self._heap)
+                job.state = RUNNING
+                job.stage = RUNNING
+                self._running += 1
+
+            # an error here must only end this job. if it ended this thread, every queued job would wait forever
+            try:
+                future = self._submit(job)
+            except Exception:
+                if job.ticket is not None:
+                    job.ticket.release()
+                self._fail(job, "There was an issue starting the calculation.")
+                continue
+            if future is None:
+                continue
+
+            future.add_done_callback(lambda done, job=job: self._finish(job, done))
+
+    def _submit(self, job: Job) -> Future | None:
+        """
+        Admits a job and hands it to the pool.
+
+            Parameters:
+                job (Job): the job
+
+            Returns:
+                the future of the calculation, or None if the job was not admitted
+        """
+        if self.admission is not None:
+            # may wait for memory to be released, outside the lock so jobs can still be submitted
+            ticket, error, message = self.admission.admit(job.params, job.kind)
+            if error:
+                self._fail(job, message)
+                return None
+            job.ticket, job.params, job.downgraded = ticket, ticket.params, ticket.downgraded
+
+        try:
+            return self._pool.submit(_run_job, job.id, job.kind, job.params)
+        except BrokenProcessPool:
+            # a pool process died (ex. out of memory), so start a new pool
+            self._pool = self._new_pool()
+            return self._pool.submit(_run_job, job.id, job.kind, job.params)
+
+    def _listen(self) -> None:
+        """
+        Records the progress the pool processes report.
+        """
+        while True:
+            job_id, stage, progress = self._progress.get()
+            with self._condition:
+                job = self._jobs.get(job_id)
+                if job is not None and job.state == RUNNING:
+                    job.stage = stage
+                    job.progress = progress
+                    self._condition.notify_all()
+
+    def _finish(self, job: Job, future: Future) -> None:
+        """
+        Records the result of a job once its process is done with it.
+
+            Parameters:
+                job (Job): the job
+                future (Future): the future of the calculation
+        """
+        try:
+            result, error, message = future.result()
+        except Exception:
+            result, error, message = None, True, "There was an issue calculating the spectrum."
+
+        if job.ticket is not None:
+            job.ticket.release()
+
+        with self._condition:
+            self._running -= 1
+            if job.state == RUNNING:
+                job.state = FAILED if error else DONE
+                job.stage = job.state
+                job.progress = 1.0
+                job.result = result
+                job.message = message
+                job.finished = time.monotonic()
+            self._condition.notify_all()
+
+    def _fail(self, job: Job, message: str) -> None:
+        """
+        Ends a job that was not admitted to the pool.
+
+            Parameters:
+                job (Job): the job
+                message (str): why the job failed
+        """
+        with self._condition:
+            self._running -= 1
+            if job.state == RUNNING:
+                job.state = job.stage = FAILED
+                job.message = message
+                job.finished = time.monotonic()
+            self._condition.notify_all()
+
+    def _remove_expired(self) -> None:
+        """
+        Removes the finished jobs whose time-to-live has passed. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and job.finished + self.ttl <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def priority_allowed(token: str) -> bool:
+    """
+    Checks the token an operator sent to raise the priority of a job. Like
+    'profile_allowed()', the token is compared in constant time.
+
+        Parameters:
+            token (str): the value of PRIORITY_HEADER, or None
+
+        Returns:
+            whether the job may have a priority above 0
+    """
+    if not JOB_PRIORITY_TOKEN or not token:
+        return False
+
+    return hmac.compare_digest(token.encode(), JOB_PRIORITY_TOKEN.encode())
+
+
+def _init_worker(progress_queue: multiprocessing.Queue) -> None:
+    """
+    Runs once in every pool process.
+
+        Parameters:
+            progress_queue (multiprocessing.Queue): the queue to report progress on
+    """
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id: str, kind: str, params: dict[str, object]) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Calculates a job in a pool process.
+
+        Parameters:
+            job_id (str): the id of the job
+            kind (str): "sample" or "background"
+            params (dict): The parameters provided by the user
+
+        Returns:
+            the processed x and y-values, or the message text if an error occurs
+    """
+    def progress(stage: str, fraction: float) -> None:
+        _progress_queue.put((job_id, stage, fraction))
+
+    return generate_processed(kind, params, progress=progress)
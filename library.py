@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+
+from processing_utils import WAVEMIN, calc_grid
+
+# directory of the library built by 'scripts/build_library.py', or unset to always calculate spectra
+LIBRARY_DIR = os.environ.get("FTIR_LIBRARY")
+
+# the largest transmittance error an interpolated spectrum may have to be served
+LIBRARY_TOLERANCE = float(os.environ.get("FTIR_LIBRARY_TOLERANCE", 1e-3))
+
+# the file that describes every spectrum in the library
+INDEX_FILE = "index.json"
+
+
+class SpectrumLibrary:
+    """
+    Precomputed ideal spectra, stored on disk by 'scripts/build_library.py'.
+
+    For every molecule and wstep, the library holds the absorbance
+    (-ln(transmittance)) over the full WAVEMIN-WAVEMAX grid on a grid of
+    pressures and mole fractions, as a float32 .npy file of shape
+    (pressures, moles, points). The files are memory-mapped, so only the
+    pages of the requested window are read.
+
+    A request on a grid point is served as it is. A request between grid
+    points is interpolated bilinearly in absorbance, but only when the
+    error measured for that cell when the library was built is within the
+    tolerance. Anything else is left to the live calculation.
+    """
+
+    def __init__(self, directory: str, tolerance: float = LIBRARY_TOLERANCE) -> None:
+        """
+        Opens a library.
+
+            Parameters:
+                directory (str): the directory of the library
+                tolerance (float): the largest transmittance error an interpolated spectrum may have
+        """
+        self.directory = directory
+        self.tolerance = tolerance
+
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.entries = {
+            (entry["molecule"], round(entry["wstep"], 12)): entry for entry in self.index["entries"]
+        }
+        self._arrays = {}
+
+    def lookup(self, params: dict[str, object], wstep: float,
+               window: tuple[float, float]) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Finds the ideal spectrum for the user parameters in the library.
+
+            Parameters:
+                params (dict): The parameters provided by the user
+                wstep (float): the wstep of the grid
+                window (tuple): the lower and upper wavenumber from 'calc_window()'
+
+            Returns:
+                the x and y-values of the ideal spectrum, or None if the library cannot serve it
+        """
+        entry = self.entries.get((str(params["molecule"]), round(wstep, 12)))
+        if entry is None:
+            return None
+
+        pressure = self._bracket(entry["pressures"], float(params["pressure"]))
+        mole = self._bracket(entry["moles"], float(params["mole"]))
+        if pressure is None or mole is None:
+            return None
+
+        (p_low, p_high, p_weight), (m_low, m_high, m_weight) = pressure, mole
+        if (p_weight or m_weight) and not self._within_tolerance(entry, p_low, m_low):
+            return None
+
+        wave_number = calc_grid(*window, wstep)
+        first = int(round((window[0] - WAVEMIN) / wstep))
+        if first < 0 or first + len(wave_number) > entry["count"]:
+            return None
+
+        absorbance = self._array(entry)[:, :, first:first + len(wave_number)]
+
+        # bilinear interpolation in absorbance. weights of zero skip the neighbouring grid point
+        total = np.zeros(len(wave_number))
+        for p_index, p_part in [(p_low, 1 - p_weight), (p_high, p_weight)]:
+            for m_index, m_part in [(m_low, 1 - m_weight), (m_high, m_weight)]:
+                if p_part * m_part:
+                    total += p_part * m_part * absorbance[p_index, m_index]
+
+        return wave_number, np.exp(-total)
+
+    @staticmethod
+    def _bracket(grid: list[float], value: float) -> tuple[int, int, float] | None:
+        """
+        Finds the grid points on either side of a value.
+
+            Parameters:
+                grid (list[float]): the sorted grid
+                value (float): the value
+
+            Returns:
+                the lower and upper index and the weight of the upper one, or None if the value is outside of the grid
+        """
+        grid = np.asarray(grid, dtype=np.float64)
+        exact = np.flatnonzero(np.isclose(grid, value, rtol=1e-9, atol=0))
+        if len(exact):
+            return int(exact[0]), int(exact[0]), 0.0
+
+        if len(grid) < 2 or not grid[0] < value < grid[-1]:
+            return None
+
+        high = int(np.searchsorted(grid, value))
+        return high - 1, high, float((value - grid[high - 1]) / (grid[high] - grid[high - 1]))
+
+    def _within_tolerance(self, entry: dict[str, object], p_low: int, m_low: int) -> bool:
+        """
+        Checks the error measured for a cell of the pressure and mole fraction grid.
+
+            Parameters:
+                entry (dict): the entry of the index
+                p_low (int): the index of the lower pressure of the cell
+                m_low (int): the index of the lower mole fraction of the cell
+
+            Returns:
+                whether an interpolated spectrum of the cell may be served
+        """
+        errors = entry.get("errors")
+        if errors is None:
+            return False
+
+        # a grid point on the upper edge belongs to the last cell
+        p_cell = min(p_low, len(errors) - 1)
+        m_cell = min(m_low, len(errors[0]) - 1)
+        return errors[p_cell][m_cell] is not None and errors[p_cell][m_cell] <= self.tolerance
+
+    def _array(self, entry: dict[str, object]) -> np.ndarray:
+        """
+        Memory-maps the absorbance of an entry, the first time it is needed.
+
+            Parameters:
+                entry (dict): the entry of the index
+
+            Returns:
+                the read-only absorbance array
+        """
+        array = self._arrays.get(entry["file"])
+        if array is None:
+            array = np.load(os.path.join(self.directory, entry["file"]), mmap_mode="r")
+            self._arrays[entry["file"]] = array
+        return array
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def open_library(directory: str = LIBRARY_DIR) -> SpectrumLibrary | None:
+    """
+    Opens the library, if one is configured.
+
+        Parameters:
+            directory (str): the directory of the library
+
+        Returns:
+            the library, or None if there is none
+    """
+    if not directory or not os.path.exists(os.path.join(directory, INDEX_FILE)):
+        return None
+
+    return SpectrumLibrary(directory)
+
+
+# the library generate_ideal() serves spectra from
+LIBRARY = open_library()
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+# pandas is only needed once lines are read, so it is not imported with the server
+if TYPE_CHECKING:
+    import pandas as pd
+
+# directory of the line databases written by 'scripts/convert_hitran.py', or unset to read the HITRAN files
+LINEDB_DIR = os.environ.get("FTIR_LINEDB")
+
+# check the checksums of a line database when it is opened (reads every file once)
+LINEDB_VERIFY = os.environ.get("FTIR_LINEDB_VERIFY", "") not in ["", "0", "false"]
+
+# the file that describes the columns of a line database
+MANIFEST_FILE = "manifest.json"
+
+# the file of the wavenumber index, and the width of its bins (cm^-1)
+INDEX_FILE = "index.npy"
+INDEX_STEP = 1.0
+
+# the isotopes spectra are calculated with (isotope="1,2,3" in 'generate_ideal()' and engines.py).
+# Radis has no partition functions ready for the others, and fails on their lines
+ISOTOPES = [1, 2, 3]
+
+# the columns Radis needs for equilibrium spectra (see SpectrumFactory.columns_list_to_load("equilibrium"))
+EQUILIBRIUM_COLUMNS = ["id", "iso", "wav", "int", "A", "airbrd", "selbrd", "Tdpair", "Tdpsel", "Pshft", "El", "gp"]
+
+
+class LineDatabase:
+    """
+    The lines of one molecule, stored as one memory-mapped .npy file per
+    column and sorted by wavenumber.
+
+    A coarse wavenumber index gives the first line of every INDEX_STEP wide
+    bin, so the lines of a window are found by reading a handful of pages
+    and only those lines are copied into memory.
+    """
+
+    def __init__(self, directory: str, verify: bool = LINEDB_VERIFY) -> None:
+        """
+        Opens a line database.
+
+            Parameters:
+                directory (str): the directory of the molecule
+                verify (bool): check the checksum of every file first
+        """
+        self.directory = directory
+
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+
+        if verify:
+            damaged = self.verify()
+            if damaged:
+                raise ValueError(f"The line database in {directory} is damaged: {', '.join(damaged)}")
+
+        self.molecule = self.manifest["molecule"]
+        self.columns = {
+            name: np.load(os.path.join(directory, column["file"]), mmap_mode="r")
+            for name, column in self.manifest["columns"].items()
+        }
+        self.index = np.load(os.path.join(directory, INDEX_FILE))
+        self.index_start = self.manifest["index"]["start"]
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def lines(self, wave_min: float, wave_max: float) -> pd.DataFrame:
+        """
+        Reads the lines with wave_min <= wavenumber <= wave_max.
+
+            Parameters:
+                wave_min (float): the lowest wavenumber
+                wave_max (float): the highest wavenumber
+
+            Returns:
+                the lines, as the DataFrame Radis's fetch_databank() would give
+        """
+        import pandas as pd
+
+        low = self._position(wave_min, "left")
+        high = self._position(wave_max, "right")
+
+        lines = pd.DataFrame({name: np.array(values[low:high]) for name, values in self.columns.items()})
+        lines.attrs.update(self.manifest["attrs"])
+        return lines
+
+    def _position(self, wavenumber: float, side: str) -> int:
+        """
+        Finds where a wavenumber falls in the sorted lines with the index.
+
+            Parameters:
+                wavenumber (float): the wavenumber
+                side (str): "left" for the first line at or above it, "right" for the first line above it
+
+            Returns:
+                the position of the line
+        """
+        last_bin = len(self.index) - 2
+        bin_number = int(np.floor((wavenumber - self.index_start) / INDEX_STEP))
+        if bin_number < 0:
+            return 0
+        if bin_number > last_bin:
+            return len(self)
+
+        start, stop = int(self.index[bin_number]), int(self.index[bin_number + 1])
+        return start + int(np.searchsorted(self.columns["wav"][start:stop], wavenumber, side=side))
+
+    def verify(self) -> list[str]:
+        """
+        Checks every file against the checksums in the manifest.
+
+            Returns:
+                the files that are missing or do not match
+        """
+        files = {column["file"]: column["sha256"] for column in self.manifest["columns"].values()}
+        files[INDEX_FILE] = self.manifest["index"]["sha256"]
+
+        damaged = []
+        for name, checksum in files.items():
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) or file_checksum(path) != checksum:
+                damaged.append(name)
+        return damaged
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def open_linedb(molecule: str, directory: str = LINEDB_DIR) -> LineDatabase | None:
+    """
+    Opens the line database of a molecule, if there is one.
+
+        Parameters:
+            molecule (str): the molecule
+            directory (str): the directory of the line databases
+
+        Returns:
+            the line database, or None if there is none
+    """
+    if not has_linedb(molecule, directory):
+        return None
+
+    return LineDatabase(os.path.join(directory, molecule))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def has_linedb(molecule: str, directory: str = LINEDB_DIR) -> bool:
+    """
+    Checks whether a molecule has a line database.
+
+        Parameters:
+            molecule (str): the molecule
+            directory (str): the directory of the line databases
+
+        Returns:
+            whether the line database exists
+    """
+    return bool(directory) and os.path.exists(os.path.join(directory, molecule, MANIFEST_FILE))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def write_linedb(lines: pd.DataFrame, directory: str, molecule: str, cutoff: float = None,
+                 sources: list[str] = None) -> dict[str, object]:
+    """
+    Writes the lines of a molecule as a line database. Only the lines of
+    ISOTOPES are kept.
+
+        Parameters:
+            lines (pd.DataFrame): the lines, as loaded by Radis
+            directory (str): the directory of the line databases
+            molecule (str): the molecule
+            cutoff (float): drop the lines with a lower intensity (cm^-1/(molecule.cm^-2))
+            sources (list[str]): the files the lines were read from, kept in the manifest
+
+        Returns:
+            the manifest
+    """
+    if cutoff is not None:
+        lines = lines[lines["int"] >= cutoff]
+    if "iso" in lines:
+        lines = lines[lines["iso"].isin(ISOTOPES)]
+    elif lines.attrs.get("iso", ISOTOPES[0]) not in ISOTOPES:
+        lines = lines.iloc[:0]
+    lines = lines.sort_values("wav", kind="mergesort")
+
+    out = os.path.join(directory, molecule)
+    os.makedirs(out, exist_ok=True)
+
+    columns = {}
+    for name in [name for name in EQUILIBRIUM_COLUMNS if name in lines]:
+        values = np.ascontiguousarray(lines[name].to_numpy())
+        file = f"{name}.npy"
+        np.save(os.path.join(out, file), values)
+        columns[name] = {"file": file, "dtype": str(values.dtype), "sha256": file_checksum(os.path.join(out, file))}
+
+    # index[k] is the first line at or above index_start + k * INDEX_STEP
+    wavenumbers = lines["wav"].to_numpy()
+    start = float(np.floor(wavenumbers[0] / INDEX_STEP) * INDEX_STEP) if len(wavenumbers) else 0.0
+    bins = int(np.ceil((wavenumbers[-1] - start) / INDEX_STEP)) + 1 if len(wavenumbers) else 1
+    np.save(os.path.join(out, INDEX_FILE),
+            np.searchsorted(wavenumbers, start + np.arange(bins + 1) * INDEX_STEP).astype(np.int64))
+
+    # numpy scalars (ex. the isotope of a single isotope database) are not JSON serializable
+    attrs = {key: value.item() if isinstance(value, np.generic) else value for key, value in lines.attrs.items()}
+
+    manifest = {
+        "molecule": molecule,
+        "rows": len(lines),
+        "wavenumber_range": [float(wavenumbers[0]), float(wavenumbers[-1])] if len(wavenumbers) else None,
+        "cutoff": cutoff,
+        "sources": sources or [],
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "attrs": attrs,
+        "columns": columns,
+        "index": {"start": start, "step": INDEX_STEP, "sha256": file_checksum(os.path.join(out, INDEX_FILE))},
+    }
+
+    # the manifest is written last, so a database is never opened half written
+    with open(os.path.join(out, MANIFEST_FILE + ".partial"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(out, MANIFEST_FILE + ".partial"), os.path.join(out, MANIFEST_FILE))
+
+    return manifest
+
+
+def file_checksum(path: str) -> str:
+    """
+    Calculates the SHA-256 checksum of a file.
+
+        Parameters:
+            path (str): the file
+
+        Returns:
+            the checksum, in hexadecimal
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,203 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from cache import LRUCache
+
+# set FTIR_METRICS=1 to time the stages of every request. when unset, 'stage()' does nothing
+METRICS_ENABLED = os.environ.get("FTIR_METRICS", "") not in ["", "0", "false"]
+
+# the upper bounds of the histogram buckets
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+POINTS_BUCKETS = [1e2, 1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7]
+BYTES_BUCKETS = [1e3, 1e4, 1e5, 1e6, 3e6, 1e7, 3e7, 1e8]
+
+# the stages timed during the current request, as (name, seconds). None outside of a request,
+# and in threads the request did not start (ex. the threads of a batch)
+REQUEST_TIMINGS = contextvars.ContextVar("request_timings", default=None)
+
+# returned by 'stage()' when the metrics are turned off
+NO_STAGE = contextlib.nullcontext()
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus histogram, optionally split by one label.
+    """
+
+    def __init__(self, name: str, description: str, buckets: list[float], label: str = None) -> None:
+        """
+        Creates an empty histogram.
+
+            Parameters:
+                name (str): the name of the metric
+                description (str): the help text of the metric
+                buckets (list[float]): the sorted upper bounds of the buckets
+                label (str): the name of the label the observations are split by, or None
+        """
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+
+        # label value -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        """
+        Adds an observation.
+
+            Parameters:
+                value (float): the observed value
+                label_value (str): the value of the label
+        """
+        if not METRICS_ENABLED:
+            return
+
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        """
+        Formats the histogram in the Prometheus text format.
+
+            Returns:
+                the lines of the histogram
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        with self._lock:
+            series = {label_value: list(values) for label_value, values in self._series.items()}
+
+        for label_value, values in sorted(series.items()):
+            labels = f'{self.label}="{label_value}",' if self.label else ""
+            total = 0
+            for bound, count in zip(self.buckets, values):
+                total += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound:g}"}} {total}')
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {values[-1]}')
+
+            labels = f'{{{labels[:-1]}}}' if labels else ""
+            lines.append(f"{self.name}_sum{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+
+        return lines
+
+
+STAGE_SECONDS = Histogram("ftir_stage_seconds", "Time spent in each stage of a request.", SECONDS_BUCKETS, "stage")
+REQUEST_SECONDS = Histogram("ftir_request_seconds", "Time spent on each request.", SECONDS_BUCKETS, "endpoint")
+GRID_POINTS = Histogram("ftir_grid_points", "Points of the processed spectra.", POINTS_BUCKETS, "endpoint")
+PAYLOAD_BYTES = Histogram("ftir_payload_bytes", "Size of the response bodies.", BYTES_BUCKETS, "endpoint")
+HISTOGRAMS = [STAGE_SECONDS, REQUEST_SECONDS, GRID_POINTS, PAYLOAD_BYTES]
+
+
+class Stage:
+    """
+    Times a stage of a request, as a context manager. The time is added to
+    STAGE_SECONDS and to the Server-Timing header of the current request.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(seconds, self.name)
+
+        timings = REQUEST_TIMINGS.get()
+        if timings is not None:
+            timings.append((self.name, seconds))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def stage(name: str) -> Stage | contextlib.nullcontext:
+    """
+    Times a stage of a request, ex.
+        with stage("calc_spectrum"):
+            ...
+
+        Parameters:
+            name (str): the name of the stage
+
+        Returns:
+            the context manager, which does nothing when the metrics are turned off
+    """
+    return Stage(name) if METRICS_ENABLED else NO_STAGE
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def start_request() -> None:
+    """
+    Starts collecting the stage timings of a new request.
+    """
+    REQUEST_TIMINGS.set([])
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def server_timing(total: float) -> str:
+    """
+    Formats the stage timings of the current request as a Server-Timing header.
+    Stages that ran more than once are added up.
+
+        Parameters:
+            total (float): the seconds spent on the whole request
+
+        Returns:
+            the value of the header
+    """
+    stages = {}
+    for name, seconds in REQUEST_TIMINGS.get() or []:
+        stages[name] = stages.get(name, 0) + seconds
+    stages["total"] = total
+
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items())
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def render_metrics(caches: list[LRUCache], gauges: dict[str, float] = None) -> str:
+    """
+    Formats the histograms, the statistics of the caches and some gauges in
+    the Prometheus text format.
+
+        Parameters:
+            caches (list[LRUCache]): the caches to report
+            gauges (dict): other values to report, by metric name
+
+        Returns:
+            the body of the /metrics response
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    stats = {cache.name: cache.stats() for cache in caches}
+    for key, kind, description in [
+        ("hits", "counter", "Lookups that found a value."),
+        ("misses", "counter", "Lookups that did not find a value."),
+        ("evictions", "counter", "Values removed to make room."),
+        ("entries", "gauge", "Values held."),
+        ("bytes", "gauge", "Bytes held."),
+    ]:
+        name = f"ftir_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{cache}"}} {values[key]}' for cache, values in stats.items()]
+
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
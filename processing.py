@@ -1,12 +1,58 @@
-import radis
-from radis import SerialSlabs, Spectrum, calc_spectrum, MergeSlabs
-from specutils.fitting import find_lines_threshold
-from processing_utils import zeroY, calc_wstep, multiscan, get_component_spectra
+from __future__ import annotations
+
+import os
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+from cache import LRUCache, SingleFlight
+from engines import Engine, engines_supported, get_engine
+from library import LIBRARY
+from metrics import stage
+from processing_utils import (
+    WAVEMIN,
+    WAVEMAX,
+    WING_MARGIN,
+    zeroY,
+    calc_wstep,
+    calc_window,
+    calc_grid,
+    spectrum_key,
+    multiscan,
+    add_noise,
+    apply_zoom,
+    select_components,
+    get_component,
+    get_component_spectra
+)
 
 from pydantic import ConfigDict, validate_arguments
 
-WAVEMIN = 400
-WAVEMAX = 12500
+# radis and specutils (and astropy through them) take seconds to import, so they are only
+# imported by the functions that use them, the first time they run. the background, the
+# offline library and the numpy peak finder never need them
+if TYPE_CHECKING:
+    from radis import Spectrum
+
+# ideal spectra already calculated by this worker, keyed by 'spectrum_key()'
+SPECTRUM_CACHE = LRUCache(
+    int(os.environ.get("FTIR_SPECTRUM_CACHE_MB", 256)) * 2**20, name="spectrum"
+)
+
+# identical ideal spectra requested at the same time (ex. a whole class running the same
+# sample) are calculated once. set FTIR_SINGLE_FLIGHT_DIR to also coalesce them across workers
+IN_FLIGHT = SingleFlight(
+    "ideal",
+    os.environ.get("FTIR_SINGLE_FLIGHT_DIR"),
+    float(os.environ.get("FTIR_SINGLE_FLIGHT_TTL", 60)),
+)
+
+# threads used to spread the independent work of a batch
+BATCH_WORKERS = int(os.environ.get("FTIR_BATCH_WORKERS", os.cpu_count() or 1))
+
+# the most points in each segment of a streamed spectrum
+STREAM_POINTS = int(os.environ.get("FTIR_STREAM_POINTS", 50000))
 
 # ------------------------------
 # ----- Spectrum Processing -----
@@ -38,8 +84,9 @@ def process_spectrum(params: dict[str, object], raw_spectrum: Spectrum) -> Spect
     #   https://radis.readthedocs.io/en/latest/source/radis.spectrum.spectrum.html#radis.spectrum.spectrum.Spectrum.get_wavenumber
     wave_number = raw_spectrum.get_wavenumber()
 
-    spec_sPlanck, spec_AR_ZnSe, spec_AR_CaF2, spec_CaF2, spec_ZnSe, spec_sapphire, \
-        spec_MCT, spec_InSb = get_component_spectra(wave_number, int(params["source"]))
+    # the components are normalized over the full grid, so a windowed raw spectrum
+    # is scaled the same way as one calculated over WAVEMIN-WAVEMAX
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
 
     # list of spectra to multiply
     slabs = []
@@ -47,59 +94,169 @@ def process_spectrum(params: dict[str, object], raw_spectrum: Spectrum) -> Spect
     # ----- a.) transmission spectrum of gas sample -----
     slabs.append(raw_spectrum)
 
-    # ----- b.) blackbody spectrum of source -----
-    slabs.append(spec_sPlanck)
-
-    # ----- c.) transmission spectrum of windows/beamsplitter -----
-    # ----- c.1) Beamsplitter -----
-    match params["beamsplitter"]:
-        case "AR_ZnSe":
-            slabs.append(spec_AR_ZnSe)
-        case "AR_CaF2":
-            slabs.append(spec_AR_CaF2)
-
-    # ----- c.2) cell windows -----
-    match params["window"]:
-        case "CaF2":
-            slabs.extend([spec_CaF2, spec_CaF2])
-        case "ZnSe":
-            slabs.extend([spec_ZnSe, spec_ZnSe])
-
-    # ----- d.) detector response spectrum -----
-    match params["detector"]:
-        case "MCT":
-            # spec_MCT = multiscan(spec_MCT, params["scan"])
-            slabs.extend([spec_ZnSe, spec_MCT])
-        case "InSb":
-            # spec_InSb = multiscan(spec_InSb, params["scan"])
-            slabs.extend([spec_sapphire, spec_InSb])
+    # ----- b.) - d.) source, beamsplitter, cell windows and detector -----
+    # only the selected components are calculated
+    with stage("components"):
+        slabs.extend(
+            get_component_spectra(wave_number, select_components(params), int(params["source"]), wstep)
+        )
 
     # SerialSlabs() multiplies the transmittance values (y-values) of the selected spectra
     #   https://radis.readthedocs.io/en/latest/source/radis.los.slabs.html#radis.los.slabs.SerialSlabs
-    spectrum = SerialSlabs(*slabs, modify_inputs="True")
-    spectrum = multiscan(spectrum, int(params["scan"]))
-    spectrum.crop(float(params["waveMin"]), float(params["waveMax"]), inplace=True)
+    from radis import SerialSlabs
+
+    with stage("serialslabs"):
+        spectrum = SerialSlabs(*slabs, modify_inputs="True")
+    with stage("multiscan"):
+        spectrum = multiscan(spectrum, int(params["scan"]))
+    with stage("crop"):
+        spectrum.crop(float(params["waveMin"]), float(params["waveMax"]), inplace=True)
     # return processed spectrum
     return spectrum
 
 
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
-def generate_background(raw_spectrum: Spectrum) -> Spectrum:
+def process_arrays(params: dict[str, object], wave_number: np.ndarray, transmittance: np.ndarray = None,
+                   rng: np.random.Generator = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Array version of 'process_spectrum()'. Every step only works point by point,
+    so the spectrum is cropped to 'waveMin'-'waveMax' first, and the component
+    products, normalization and noise are then applied in place to a single
+    buffer, without building any Spectrum objects.
+
+    'process_spectrum()' is kept as the reference implementation.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            wave_number (np.ndarray): the x-values of the ideal spectrum
+            transmittance (np.ndarray): the y-values of the ideal spectrum, or None
+                                        for a background (all y-values of one)
+            rng (np.random.Generator): the generator the noise is drawn from (see 'add_noise()')
+
+        Returns:
+            the x and y-values of the processed spectrum
+    """
+
+    # crop() keeps the points with waveMin <= x <= waveMax
+    with stage("crop"):
+        low = np.searchsorted(wave_number, float(params["waveMin"]), side="left")
+        high = np.searchsorted(wave_number, float(params["waveMax"]), side="right")
+        x_value = wave_number[low:high]
+
+        # ----- a.) transmission spectrum of gas sample -----
+        if transmittance is None:
+            y_value = np.ones(len(x_value))
+        else:
+            y_value = np.array(transmittance[low:high], dtype=np.float64)
+
+    # the components are normalized over the full grid, so a windowed raw spectrum
+    # is scaled the same way as one calculated over WAVEMIN-WAVEMAX
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+    source_temp = int(params["source"])
+
+    # ----- b.) - d.) source, beamsplitter, cell windows and detector -----
+    with stage("components"):
+        for component in select_components(params):
+            y_value *= get_component(component, x_value, source_temp, wstep)
+
+    with stage("noise"):
+        add_noise(y_value, int(params["scan"]), rng)
+
+    return x_value, y_value
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def process_pair(params: dict[str, object], wave_number: np.ndarray, transmittance: np.ndarray,
+                 rng: np.random.Generator = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Processes a sample and its background together. They share the grid, so
+    the spectrum is cropped and the response of the source, beamsplitter,
+    cell windows and detector is calculated once. The sample is the ideal
+    transmittance times that response, the background is the response
+    itself, and each one gets its own noise, the same way 'process_arrays()'
+    processes them one at a time.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            wave_number (np.ndarray): the x-values of the ideal spectrum
+            transmittance (np.ndarray): the y-values of the ideal spectrum
+            rng (np.random.Generator): the generator the noise is drawn from (see 'add_noise()')
+
+        Returns:
+            the x-values and the y-values of the sample and of the background
+    """
+
+    # crop() keeps the points with waveMin <= x <= waveMax
+    with stage("crop"):
+        low = np.searchsorted(wave_number, float(params["waveMin"]), side="left")
+        high = np.searchsorted(wave_number, float(params["waveMax"]), side="right")
+        x_value = wave_number[low:high]
+
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+    source_temp = int(params["source"])
+
+    # ----- b.) - d.) source, beamsplitter, cell windows and detector, once -----
+    with stage("components"):
+        background = np.ones(len(x_value))
+        for component in select_components(params):
+            background *= get_component(component, x_value, source_temp, wstep)
+
+    # ----- a.) transmission spectrum of gas sample -----
+    sample = transmittance[low:high] * background
+
+    # independent noise for each spectrum, as two separate measurements would have
+    with stage("noise"):
+        add_noise(sample, int(params["scan"]), rng)
+        add_noise(background, int(params["scan"]), rng)
+
+    return x_value, sample, background
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_background_grid(params: dict[str, object]) -> np.ndarray:
+    """
+    Builds the wavenumber grid of a background for the given parameters.
+
+    The grid is fully determined by 'resolution', 'zeroFill' and the window,
+    so it is built directly instead of calculating a spectrum with
+    'calc_spectrum()'. The x-values are the same as those of the spectrum
+    'generate_spectrum()' returns for the same parameters.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+
+        Return:
+            The x-values of the background
+    """
+
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+
+    return calc_grid(
+        *calc_window(float(params["waveMin"]), float(params["waveMax"]), wstep), wstep
+    )
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_background(params: dict[str, object]) -> Spectrum:
     """
-    Accepts a spectrum generated using 'generate_spectrum()'.
+    Builds a background spectrum for the given parameters.
     A background by default has all y-values of one.
 
         Parameters:
-            raw_spectrum (Spectrum object): The spectrum generated from 'calc_spectrum()'
+            params (dict): The parameters provided by the user
 
         Return:
             The processed background sample with y-values of one
     """
 
+    from radis import Spectrum
+
+    wave_number = generate_background_grid(params)
+
     spec_zeroY = Spectrum(
         {
-            "wavenumber": raw_spectrum.get_wavenumber(),
-            "transmittance_noslit": zeroY(raw_spectrum.get_wavenumber()),
+            "wavenumber": wave_number,
+            "transmittance_noslit": zeroY(wave_number),
         },
         wunit="cm-1",
         units={"transmittance_noslit": ""},
@@ -110,7 +267,7 @@ def generate_background(raw_spectrum: Spectrum) -> Spectrum:
 
 
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
-def generate_spectrum(params: dict[str, object]) -> tuple[Spectrum, bool, str]:
+def generate_spectrum(params: dict[str, object], windowed: bool = True) -> tuple[Spectrum, bool, str]:
     """
     Generates a spectrum using Radis's 'calc_spectrum()' function based
     on user parameters. That spectrum is then processed by
@@ -120,27 +277,189 @@ def generate_spectrum(params: dict[str, object]) -> tuple[Spectrum, bool, str]:
 
         Parameters:
             params (dict): The parameters provided by the user
+            windowed (bool): calculate only the requested window instead of WAVEMIN-WAVEMAX
 
         Return:
             The raw spectrum, or the message text if an error occurs
     """
 
+    ideal, error, message = generate_ideal(params, windowed)
+    if error:
+        return None, True, message
+
+    return (__ideal_spectrum(*ideal), False, None)
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_ideal(params: dict[str, object],
+                   windowed: bool = True) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Calculates the x and y-values of the ideal transmittance spectrum for the
+    user parameters with Radis's 'calc_spectrum()' function.
+
+    By default only the part of the grid between 'waveMin' and 'waveMax' is
+    calculated. Lines within WING_MARGIN of the window are still included, and
+    the x-values are the same as those of a spectrum over WAVEMIN-WAVEMAX.
+
+    Spectra in the offline library ('library.py') are read from it instead
+    of being calculated. Results are kept in SPECTRUM_CACHE, and identical
+    spectra requested while one is being calculated wait for it (IN_FLIGHT).
+    A gas mixture ('molecule' is the mole fraction of every molecule) is the
+    product of the spectra of its molecules ('__generate_mixture()').
+    The returned arrays are read-only.
+
+    If there is an issue with the Radis library, the error message is returned.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            windowed (bool): calculate only the requested window instead of WAVEMIN-WAVEMAX
+
+        Return:
+            The x and y-values, or the message text if an error occurs
+    """
+
     # resolution of wavenumber grid (cm^-1)
     #   https://radis.readthedocs.io/en/latest/source/radis.lbl.calc.html#radis.lbl.calc.calc_spectrum:~:text=wstep%20(float%20(,%27auto%27)
     wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
 
+    if windowed:
+        wave_min, wave_max = calc_window(float(params["waveMin"]), float(params["waveMax"]), wstep)
+        neighbour_lines = WING_MARGIN
+    else:
+        wave_min, wave_max = WAVEMIN, WAVEMAX
+        neighbour_lines = 0
+
+    # a cached spectrum skips loading the line database and calculating the lineshapes
+    key = spectrum_key(params, wstep, (wave_min, wave_max))
+    cached = SPECTRUM_CACHE.get(key)
+    if cached is not None:
+        return cached, False, None
+
+    # a mixture is made of the spectra of its molecules, which are cached on their own
+    if isinstance(params["molecule"], dict):
+        return __generate_mixture(params, windowed, key)
+
+    # a spectrum precomputed by 'scripts/build_library.py' skips the calculation entirely
+    if LIBRARY is not None:
+        with stage("library"):
+            stored = LIBRARY.lookup(params, wstep, (wave_min, wave_max))
+        if stored is not None:
+            return SPECTRUM_CACHE.put(key, stored), False, None
+
     try:
-        # ----- a.) transmission spectrum of gas sample -----
-        #   https://radis.readthedocs.io/en/latest/source/radis.lbl.calc.html#radis.lbl.calc.calc_spectrum
+        # requests for the same spectrum that arrive while it is calculated wait for it.
+        # the noise is added to every request separately afterwards
+        with stage("calc_spectrum"):
+            ideal = IN_FLIGHT.do(
+                key, lambda: __calc_ideal(params, wave_min, wave_max, wstep, neighbour_lines)
+            )
+    except Exception as e:
+        return None, True, __ideal_message(e)
+
+    return (SPECTRUM_CACHE.put(key, ideal), False, None)
+
+
+def __ideal_message(error: Exception) -> str:
+    """
+    Turns an error of Radis into the message text sent to the user.
+
+        Parameters:
+            error (Exception): the error raised while calculating an ideal spectrum
+
+        Return:
+            the message text
+    """
+    from radis.misc.warning import EmptyDatabaseError
+
+    if isinstance(error, EmptyDatabaseError):
+        return "There were not enough data points in the requested Wavenumber Range. Please expand your range and try again."
+
+    match str(error):
+        case "Failed to retrieve data for given parameters.":
+            return "There was an issue processing the data for the given parameters. Please adjust some settings and try again."
+        case other:
+            return other
+
+
+def __generate_mixture(params: dict[str, object], windowed: bool,
+                       key: tuple) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Calculates the ideal transmittance spectrum of a gas mixture.
+
+    Radis calculates a mixture one molecule at a time and merges them with
+    'MergeSlabs()': in one cell the absorbances of the molecules add up, so
+    the transmittance of the mixture is the product of their transmittances.
+    Each molecule goes through 'generate_ideal()' at its own mole fraction,
+    so the line broadening by itself and by the rest of the gas is the same,
+    and it uses the cache, the library and the warm engine of that molecule.
+    The molecules are calculated in parallel, on the same grid.
+
+        Parameters:
+            params (dict): The parameters provided by the user, with the mixture as 'molecule'
+            windowed (bool): calculate only the requested window instead of WAVEMIN-WAVEMAX
+            key (tuple): the key the mixture is cached under
+
+        Return:
+            The x and y-values, or the message text if an error occurs
+    """
+    molecules = [
+        {**params, "molecule": molecule, "mole": mole} for molecule, mole in params["molecule"].items()
+    ]
+
+    with ThreadPoolExecutor(min(len(molecules), BATCH_WORKERS)) as pool:
+        ideals = list(pool.map(lambda molecule: generate_ideal(molecule, windowed), molecules))
+
+    for ideal, error, message in ideals:
+        if error:
+            return None, True, message
+
+    wave_number, transmittance = ideals[0][0]
+    transmittance = np.array(transmittance, dtype=np.float64)
+    for ideal, _, _ in ideals[1:]:
+        transmittance *= ideal[1]
+
+    return SPECTRUM_CACHE.put(key, (wave_number, transmittance)), False, None
+
+
+def __calc_ideal(params: dict[str, object], wave_min: float, wave_max: float, wstep: float,
+                 neighbour_lines: float, engine: Engine = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculates an ideal spectrum with a warm engine or Radis's 'calc_spectrum()'.
+    Errors are raised, for 'generate_ideal()' to turn into messages.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            wave_min (float): the lower wavenumber of the spectrum
+            wave_max (float): the upper wavenumber of the spectrum
+            wstep (float): the wstep of the grid
+            neighbour_lines (float): include the lines this far outside of the window
+            engine (Engine): the engine to calculate with, or None for the warm engine of the molecule
+
+        Return:
+            The x and y-values
+    """
+    from radis import calc_spectrum
+
+    # a warm engine already has the line database of the molecule in memory
+    engine = engine or get_engine(params["molecule"])
+
+    # ----- a.) transmission spectrum of gas sample -----
+    #   https://radis.readthedocs.io/en/latest/source/radis.lbl.calc.html#radis.lbl.calc.calc_spectrum
+    if engine is not None:
+        spectrum = engine.calc_spectrum(
+            wave_min, wave_max, wstep, neighbour_lines, params["pressure"], params["mole"]
+        )
+    else:
         spectrum = calc_spectrum(
-            WAVEMIN,
-            WAVEMAX,
+            wave_min,
+            wave_max,
             molecule=params["molecule"],
             isotope="1,2,3",
             pressure=params["pressure"],
             Tgas=294.15,
             path_length=10,
             wstep=wstep,
+            neighbour_lines=neighbour_lines,
             databank="hitran",
             verbose=False,
             warnings={
@@ -148,31 +467,408 @@ def generate_spectrum(params: dict[str, object]) -> tuple[Spectrum, bool, str]:
                 "AccuracyWarning": "ignore"},
             mole_fraction={params["molecule"]: params["mole"]},
         )
-    except radis.misc.warning.EmptyDatabaseError:
-        return None, True, "There were not enough data points in the requested Wavenumber Range. Please expand your range and try again."
+
+    return spectrum.get("transmittance_noslit")
+
+
+def __ideal_spectrum(wave_number: np.ndarray, transmittance: np.ndarray) -> Spectrum:
+    """
+    Wraps the cached x and y-values of an ideal spectrum in a new Spectrum.
+    The Spectrum constructor copies both arrays, so 'SerialSlabs()' can modify
+    the spectrum without changing the cached values.
+
+        Parameters:
+            wave_number (np.ndarray): the x-values of the ideal spectrum
+            transmittance (np.ndarray): the y-values of the ideal spectrum
+
+        Return:
+            The ideal spectrum
+    """
+
+    from radis import Spectrum
+
+    return Spectrum(
+        {"wavenumber": wave_number, "transmittance_noslit": transmittance},
+        wunit="cm-1",
+        units={"transmittance_noslit": ""},
+        name="Sample",
+    )
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def ideal_key(params: dict[str, object], windowed: bool = True) -> tuple:
+    """
+    Builds the key 'generate_ideal()' caches the ideal spectrum for the
+    user parameters under. Requests with the same key share an ideal spectrum.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            windowed (bool): calculate only the requested window instead of WAVEMIN-WAVEMAX
+
+        Return:
+            the key of the ideal spectrum
+    """
+
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+
+    if windowed:
+        window = calc_window(float(params["waveMin"]), float(params["waveMax"]), wstep)
+    else:
+        window = (WAVEMIN, WAVEMAX)
+
+    return spectrum_key(params, wstep, window)
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_processed(kind: str, params: dict[str, object], ideal: tuple = None,
+                       progress: Callable[[str, float], None] = None) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Generates and processes a single sample or background spectrum, the same
+    way the /sample and /background endpoints do.
+
+        Parameters:
+            kind (str): "sample" or "background"
+            params (dict): The parameters provided by the user
+            ideal (tuple): the result of 'generate_ideal()' when it is already known
+            progress (Callable): called with the name of each stage and the fraction of the work done
+
+        Return:
+            the processed x and y-values, or the message text if an error occurs
+    """
+    progress = progress or (lambda stage, fraction: None)
+
+    if kind == "background":
+        try:
+            arrays = (generate_background_grid(params),)
+        except:
+            return None, True, "There was an issue collecting the background spectra."
+    else:
+        if ideal is None:
+            progress("calculating", 0.0)
+            ideal = generate_ideal(params)
+
+        arrays, error, message = ideal
+        if error:
+            return None, True, message
+
+    progress("processing", 0.9)
+    return process_arrays(apply_zoom(params), *arrays), False, None
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_pair(params: dict[str, object],
+                  ratio: str = None) -> tuple[tuple[np.ndarray, dict[str, np.ndarray]], bool, str]:
+    """
+    Generates a sample and its background in one pass with 'process_pair()',
+    and optionally the spectrum the user would otherwise derive from them.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            ratio (str): None, "transmittance" (sample / background) or "absorbance" (-log10 of it)
+
+        Return:
+            the x-values and the y-values by name, or the message text if an error occurs
+    """
+    ideal, error, message = generate_ideal(params)
+    if error:
+        return None, True, message
+
+    x_value, sample, background = process_pair(apply_zoom(params), *ideal)
+    series = {"sample": sample, "background": background}
+
+    # noise can push a point to or below zero, which has no absorbance (NaN)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        match ratio:
+            case "transmittance":
+                series["transmittance"] = sample / background
+            case "absorbance":
+                quotient = sample / background
+                series["absorbance"] = -np.log10(np.where(quotient > 0, quotient, np.nan))
+
+    return (x_value, series), False, None
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def process_sweep(params: dict[str, object], wave_number: np.ndarray, transmittances: list[np.ndarray],
+                  rng: np.random.Generator = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Processes the ideal spectra of a sweep together. They share the grid and
+    the instrument, so the spectra are cropped and the response of the
+    source, beamsplitter, cell windows and detector is calculated once.
+    Every step is its ideal transmittance times that response, with its own
+    noise, the same way 'process_arrays()' processes them one at a time.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            wave_number (np.ndarray): the x-values of the ideal spectra
+            transmittances (list[np.ndarray]): the y-values of the ideal spectrum of every step
+            rng (np.random.Generator): the generator the noise is drawn from (see 'add_noise()')
+
+        Returns:
+            the x-values, and the y-values of every step stacked in rows
+    """
+
+    # crop() keeps the points with waveMin <= x <= waveMax
+    with stage("crop"):
+        low = np.searchsorted(wave_number, float(params["waveMin"]), side="left")
+        high = np.searchsorted(wave_number, float(params["waveMax"]), side="right")
+        x_value = wave_number[low:high]
+
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+    source_temp = int(params["source"])
+
+    # ----- b.) - d.) source, beamsplitter, cell windows and detector, once -----
+    with stage("components"):
+        response = np.ones(len(x_value))
+        for component in select_components(params):
+            response *= get_component(component, x_value, source_temp, wstep)
+
+    # ----- a.) transmission spectrum of gas sample, one row per step -----
+    y_values = np.empty((len(transmittances), len(x_value)))
+    for row, transmittance in zip(y_values, transmittances):
+        np.multiply(transmittance[low:high], response, out=row)
+
+    with stage("noise"):
+        for row in y_values:
+            add_noise(row, int(params["scan"]), rng)
+
+    return x_value, y_values
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_sweep(params: dict[str, object], steps: list[tuple[float, float]],
+                   exact: bool = True) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Generates the spectra of a sweep over pressure and/or mole fraction,
+    for one molecule and instrument.
+
+    By default ('exact') every step is calculated. Without 'exact', only one
+    ideal spectrum is calculated for each pressure, at its smallest mole
+    fraction, and the other mole fractions are scaled from it, as Radis's
+    'Spectrum.rescale_mole_fraction()' does: the absorbance
+    (-ln(transmittance)) is proportional to the mole fraction as long as the
+    shape of the lines stays the same. This leaves out how the mole fraction
+    changes the self-broadening of the lines, which is small for dilute
+    gases but not for concentrated ones (ex. about 18% at a mole fraction
+    of 1), so the result is only an approximation. Scaling up from the
+    smallest mole fraction keeps saturated lines saturated.
+
+    The ideal spectra go through 'generate_ideal()', so they use its cache,
+    the library and a warm engine (whose lines are loaded once for all
+    steps), and are calculated in parallel. They are then processed
+    together with 'process_sweep()'.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            steps (list[tuple[float, float]]): the pressure and mole fraction of every step, from 'sweep_steps()'
+            exact (bool): calculate every mole fraction instead of scaling it (approximate)
+
+        Return:
+            the x-values and the y-values of every step stacked in rows, or the message text if an error occurs
+    """
+
+    # the mole fraction the reference spectrum of each pressure (or step) is calculated at
+    references = {}
+    for pressure, mole in steps:
+        group = (pressure, mole) if exact else pressure
+        references[group] = min(references.get(group, mole), mole)
+
+    def reference(group: float | tuple[float, float]) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+        pressure = group[0] if exact else group
+        return generate_ideal({**params, "pressure": pressure, "mole": references[group]})
+
+    with ThreadPoolExecutor(min(len(references), BATCH_WORKERS)) as pool:
+        ideals = dict(zip(references, pool.map(reference, references)))
+
+    for ideal, error, message in ideals.values():
+        if error:
+            return None, True, message
+
+    # the absorbance of a reference is only calculated when a step is scaled from it
+    absorbances = {}
+    transmittances = []
+    with stage("rescale"):
+        for pressure, mole in steps:
+            group = (pressure, mole) if exact else pressure
+            wave_number, transmittance = ideals[group][0]
+            if mole == references[group]:
+                transmittances.append(transmittance)
+                continue
+
+            if group not in absorbances:
+                with np.errstate(divide="ignore"):
+                    absorbances[group] = -np.log(transmittance)
+            transmittances.append(np.exp(-absorbances[group] * (mole / references[group])))
+
+    return process_sweep(apply_zoom(params), wave_number, transmittances), False, None
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def generate_segments(params: dict[str, object],
+                      max_points: int = None) -> Iterator[tuple[tuple[np.ndarray, np.ndarray], bool, str]]:
+    """
+    Generates and processes a sample spectrum in contiguous wavenumber
+    segments, lowest wavenumbers first, so it can be sent while the rest is
+    still being calculated. Only one segment is held in memory at a time.
+
+    Each segment is calculated over its own window of the full grid, so its
+    x-values are those of the matching part of the whole spectrum. When the
+    ideal spectrum of the whole window is already cached (or in the library),
+    it is only sliced. Otherwise the lines of every molecule are loaded once
+    for the whole stream (its warm engine, or an Engine fetching only the
+    lines of this window), and the segments are not cached. Without engine
+    support ('engines_supported()') each segment uses 'calc_spectrum()'.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            max_points (int): the most points in a segment, defaults to STREAM_POINTS
+
+        Return:
+            the processed x and y-values of each segment, or the message text if an error occurs
+    """
+    wstep = calc_wstep(float(params["resolution"]), int(params["zeroFill"]))
+    window = calc_window(float(params["waveMin"]), float(params["waveMax"]), wstep)
+    zoomed = apply_zoom(params)
+
+    # the x-values of the whole processed spectrum, cropped the same way as in 'process_arrays()'
+    grid = calc_grid(*window, wstep)
+    low = np.searchsorted(grid, float(zoomed["waveMin"]), side="left")
+    high = np.searchsorted(grid, float(zoomed["waveMax"]), side="right")
+
+    if high <= low:
+        yield generate_processed("sample", params)
+        return
+
+    # the mole fraction of every molecule. a mixture is the product of their spectra
+    molecules = params["molecule"] if isinstance(params["molecule"], dict) else {params["molecule"]: params["mole"]}
+
+    cached = SPECTRUM_CACHE.get(ideal_key(params))
+    if cached is None and LIBRARY is not None and not isinstance(params["molecule"], dict):
+        cached = LIBRARY.lookup(params, wstep, window)
+
+    engines = {}
+    if cached is None:
+        try:
+            for molecule in molecules:
+                engines[molecule] = get_engine(molecule)
+                if engines[molecule] is None and engines_supported():
+                    engines[molecule] = Engine(molecule, window=(grid[low] - wstep, grid[high - 1] + wstep))
+        except Exception as e:
+            yield None, True, __ideal_message(e)
+            return
+
+    # segments of (nearly) equal size, so the last one is never tiny
+    count = -(-(high - low) // (max_points or STREAM_POINTS))
+    edges = np.linspace(low, high, count + 1).astype(int)
+
+    for start, stop in zip(edges[:-1], edges[1:]):
+        # the bounds sit half a step past the first and last point, so rounding
+        # can never move a point into the wrong segment
+        segment = {key: value for key, value in params.items() if key not in ["zoomMin", "zoomMax"]}
+        segment["waveMin"] = grid[start] - wstep / 2
+        segment["waveMax"] = grid[stop - 1] + wstep / 2
+
+        if cached is not None:
+            ideal = (cached, False, None)
+        else:
+            # 'calc_window()' rounds outwards, so the window is given half a step inside the points
+            ideal = __segment_ideal(
+                segment, molecules, engines, calc_window(grid[start] + wstep / 2, grid[stop - 1] - wstep / 2, wstep), wstep
+            )
+
+        processed = generate_processed("sample", segment, ideal)
+        yield processed
+        if processed[1]:
+            return
+
+
+def __segment_ideal(params: dict[str, object], molecules: dict[str, float], engines: dict[str, Engine],
+                    window: tuple[float, float], wstep: float) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+    """
+    Calculates the ideal transmittance spectrum of one segment of a stream
+    with the engines of the stream. Like a mixture in 'generate_ideal()', the
+    transmittance of several molecules is the product of theirs.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            molecules (dict): the mole fraction of every molecule
+            engines (dict): the engine of every molecule, or None for 'calc_spectrum()'
+            window (tuple): the lower and upper wavenumber from 'calc_window()'
+            wstep (float): the wstep of the grid
+
+        Return:
+            The x and y-values, or the message text if an error occurs
+    """
+    transmittance = None
+    try:
+        for molecule, mole in molecules.items():
+            wave_number, y_value = __calc_ideal(
+                {**params, "molecule": molecule, "mole": mole}, *window, wstep, WING_MARGIN, engines[molecule]
+            )
+            transmittance = y_value if transmittance is None else transmittance * y_value
     except Exception as e:
-        match str(e):
-            case "Failed to retrieve data for given parameters.":
-                return (
-                    None,
-                    True,
-                    "There was an issue processing the data for the given parameters. Please adjust some settings and try again.",
-                )
-            case other:
-                return None, True, str(e)
+        return None, True, __ideal_message(e)
 
-    return (spectrum, False, None)
+    return (wave_number, transmittance), False, None
 
 
+# ------------------------------
+# ------ Batch Processing ------
+# ------------------------------
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
-def find_peaks(x_data: list[float], y_data: list[float], threshold: float = 0) -> tuple[dict[float, float], str]:
+def generate_batch(requests: list[tuple[str, dict[str, object]]],
+                   max_workers: int = None) -> list[tuple[tuple[np.ndarray, np.ndarray], bool, str]]:
+    """
+    Generates and processes a list of sample and background spectra at once.
+
+    Requests are grouped by their physical inputs ('ideal_key()'), so each
+    unique ideal spectrum is calculated once, and the components are shared
+    through their cache. The independent calculations are spread across a
+    pool of threads.
+
+        Parameters:
+            requests (list): (kind, params) pairs, where kind is "sample" or "background"
+            max_workers (int): the number of threads, defaults to BATCH_WORKERS
+
+        Return:
+            the processed x and y-values, or the message text if an error occurs, for every request in order
+    """
+
+    # the first request of each group calculates the ideal spectrum for all of them
+    groups = {}
+    for kind, params in requests:
+        if kind == "sample":
+            groups.setdefault(ideal_key(params), params)
+
+    with ThreadPoolExecutor(max_workers or BATCH_WORKERS) as pool:
+        ideals = dict(zip(groups, pool.map(generate_ideal, groups.values())))
+
+        def process(request: tuple[str, dict[str, object]]) -> tuple[tuple[np.ndarray, np.ndarray], bool, str]:
+            kind, params = request
+            return generate_processed(kind, params, ideals.get(ideal_key(params)) if kind == "sample" else None)
+
+        return list(pool.map(process, requests))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def find_peaks(x_data: list[float], y_data: list[float], threshold: float = 0,
+               lowerbound: float = None, upperbound: float = None,
+               method: str = "numpy") -> tuple[dict[float, float], str]:
     '''
     Finds the peaks in provided data within a certain range and threshold.
 
+    The default "numpy" method finds the same emission lines as specutils'
+    'find_lines_threshold()' with array operations. The "specutils" method
+    calls specutils itself and is kept for comparison. Both map peak
+    positions back to the data with sorted-index lookups.
+
         Parameters:
             x_data (list[float]): the x-values of the data to analyze
             y_data (list[float]): the y-values of the data to analyze
             threshold (float): the lowest y-value to concider a peak
+            lowerbound (float): the lowest x-value to analyze, or None for no lower bound
+            upperbound (float): the highest x-value to analyze, or None for no upper bound
+            method (str): "numpy" or "specutils"
 
         Returns:
             a tuple containing a dictionary of x and y-values of the peaks
@@ -180,25 +876,98 @@ def find_peaks(x_data: list[float], y_data: list[float], threshold: float = 0) -
             been encountered
     '''
     try:
-        # Make a spectrum out of the provided x and y-values
-        spectrum = Spectrum.from_array(
-            x_data, y_data, "absorbance_noslit", wunit="cm-1", unit=""
-        )
-        new_spec = (
-            spectrum.to_specutils()
-        )
-        # Gets all the peaks data found in the spectrum
-        lines = find_lines_threshold(new_spec, noise_factor=1)
+        x_value = np.asarray(x_data, dtype=np.float64)
+        y_value = np.asarray(y_data, dtype=np.float64)
+
+        # sorted-index lookups need ascending x-values
+        if np.any(x_value[1:] < x_value[:-1]):
+            order = np.argsort(x_value, kind="stable")
+            x_value = x_value[order]
+            y_value = y_value[order]
+
+        # only analyze the lowerbound-upperbound range
+        low = 0 if lowerbound is None else np.searchsorted(x_value, float(lowerbound), side="left")
+        high = len(x_value) if upperbound is None else np.searchsorted(x_value, float(upperbound), side="right")
+        x_value = x_value[low:high]
+        y_value = y_value[low:high]
+
+        match method:
+            case "numpy":
+                indices = __local_maxima(y_value)
+            case "specutils":
+                indices = __specutils_peaks(x_value, y_value)
+            case other:
+                return None, f"Unknown peak finding method: {other}"
     except:
         return None, "Unable to find peaks with the given data and settings. Please adjust your settings and try again."
 
-    # Checks the data in lines and pulls out the data that matches our specifications
-    peaks = {}
-    for num, peak_type, _ in lines:
-        index = x_data.index(float(num.value))
-        # Makes sure the peak is an emmission peak and is at or obove our threshold
-        if peak_type == "emission" and y_data[index] >= threshold:
-            peaks[round(float(num.value), 4)] = round(y_data[index], 4)
+    # Makes sure the peak is at or above our threshold
+    indices = indices[y_value[indices] >= threshold]
 
     # Return the data that matches our specifications
+    peaks = {
+        round(float(x), 4): round(float(y), 4) for x, y in zip(x_value[indices], y_value[indices])
+    }
     return peaks, None
+
+
+def __local_maxima(y_value: np.ndarray) -> np.ndarray:
+    '''
+    Finds the emission lines of the y-values the way specutils'
+    'find_lines_threshold()' does with a noise factor of 1 and no
+    uncertainty: every run of consecutive positive points is one line, at
+    the first of its highest points.
+
+        Parameters:
+            y_value (np.ndarray): the y-values to analyze
+
+        Returns:
+            the indices of the emission lines
+    '''
+    positive = np.flatnonzero(y_value > 0)
+    if len(positive) == 0:
+        return positive
+
+    # a new run starts wherever the positive points are not consecutive
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(positive) != 1) + 1))
+    run = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(positive))))
+    highest = np.maximum.reduceat(y_value[positive], starts)
+
+    # the first point of every run that reaches its highest value
+    hits = np.flatnonzero(y_value[positive] == highest[run])
+    _, first = np.unique(run[hits], return_index=True)
+
+    return positive[hits[first]]
+
+
+def __specutils_peaks(x_value: np.ndarray, y_value: np.ndarray) -> np.ndarray:
+    '''
+    Finds the emission lines of the data with specutils' 'find_lines_threshold()'.
+
+        Parameters:
+            x_value (np.ndarray): the ascending x-values to analyze
+            y_value (np.ndarray): the y-values to analyze
+
+        Returns:
+            the indices of the emission lines
+    '''
+    from radis import Spectrum
+    from specutils.fitting import find_lines_threshold
+
+    # Make a spectrum out of the provided x and y-values
+    spectrum = Spectrum.from_array(
+        x_value, y_value, "absorbance_noslit", wunit="cm-1", unit=""
+    )
+    new_spec = (
+        spectrum.to_specutils()
+    )
+    # Gets all the peaks data found in the spectrum
+    lines = find_lines_threshold(new_spec, noise_factor=1)
+
+    # Makes sure the peak is an emmission peak
+    centers = [float(num.value) for num, peak_type, _ in lines if peak_type == "emission"]
+
+    # the line centers are x-values of the data, so a sorted-index lookup finds them
+    indices = np.searchsorted(x_value, centers)
+
+    return np.minimum(indices, len(x_value) - 1).astype(int)
@@ -1,8 +1,17 @@
+from __future__ import annotations
+
+import os
 import numpy as np
 import warnings
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from cache import LRUCache
 
-from radis.spectrum.operations import add_array
-from radis import Spectrum
+# radis (and astropy through it) takes seconds to import, so it is only imported by
+# the functions that build Spectrum objects, the first time they run
+if TYPE_CHECKING:
+    from radis import Spectrum
 
 from pydantic import ConfigDict, validate_arguments
 
@@ -10,6 +19,61 @@ from pydantic import ConfigDict, validate_arguments
 warnings.filterwarnings("ignore", message="invalid value encountered in power")
 warnings.filterwarnings("ignore", message="overflow encountered in power")
 
+# full wavenumber range (cm^-1) of the virtual spectrometer
+WAVEMIN = 400
+WAVEMAX = 12500
+
+# extra range (cm^-1) on each side of a window whose lines are still included
+# in the calculation. matches the default lineshape truncation used by radis
+WING_MARGIN = 50
+
+# parameters every spectrum request has to include
+REQUIRED_PARAMS = [
+    "beamsplitter",
+    "detector",
+    "medium",
+    "mole",
+    "molecule",
+    "pressure",
+    "resolution",
+    "scan",
+    "source",
+    "waveMax",
+    "waveMin",
+    "window",
+    "zeroFill",
+]
+
+# the most molecules a gas mixture may have
+MAX_MIXTURE = int(os.environ.get("FTIR_MIXTURE_MAX", 8))
+
+# parameters a spectrum request may include to change how the response is built
+OPTIONAL_PARAMS = [
+    "format",
+    "dtype",
+    "grid",
+    "maxPoints",
+    "zoomMin",
+    "zoomMax",
+    "handle",
+    "stream",
+    "ratio",
+    "downgrade",
+    "pressures",
+    "moles",
+    "exact",
+]
+
+# random number generator used for the noise. set FTIR_NOISE_SEED to reproduce runs
+NOISE_RNG = np.random.default_rng(
+    int(os.environ["FTIR_NOISE_SEED"]) if os.environ.get("FTIR_NOISE_SEED") else None
+)
+
+# component spectra already calculated by this worker, see 'get_component()'
+COMPONENT_CACHE = LRUCache(
+    int(os.environ.get("FTIR_COMPONENT_CACHE_MB", 128)) * 2**20, name="component"
+)
+
 # -------------------------------------
 # ------------- blackbody -------------
 # -------------------------------------
@@ -247,36 +311,87 @@ def param_check(params: dict[str, object]) -> bool:
             True if params are good. Else, returns False
     """
 
-    # check if number of parameters is correct
-    if len(params) != 13:
-        print("  incorrect amount of params. total params: %s" % (len(params)))
+    # a mixture gives the mole fraction of every molecule instead of 'mole'
+    mixture = isinstance(params.get("molecule"), dict)
+    if mixture and not mixture_check(params["molecule"]):
+        print(f"  error with mixture: {params['molecule']}")
         return False
 
-    # check if parameter names are correct
-    valid_params = [
-        "beamsplitter",
-        "detector",
-        "medium",
-        "mole",
-        "molecule",
-        "pressure",
-        "resolution",
-        "scan",
-        "source",
-        "waveMax",
-        "waveMin",
-        "window",
-        "zeroFill",
-    ]
+    # check if all of the required parameters are given
+    for key in REQUIRED_PARAMS:
+        if key not in params and not (mixture and key == "mole"):
+            print(f"  missing param: {key}")
+            return False
 
+    # check if parameter names are correct
     for key, value in params.items():
-        if (key not in valid_params) or (params[key] is None):
+        if (key not in REQUIRED_PARAMS and key not in OPTIONAL_PARAMS) or (params[key] is None):
             print(f"  error with key: {key}. Value is: {value}")
             return False
 
+    # check that the window, and the zoom when given, cover some wavenumbers
+    if not range_check(params):
+        print(f"  error with range: {params['waveMin']}-{params['waveMax']}, zoom: "
+              f"{params.get('zoomMin')}-{params.get('zoomMax')}")
+        return False
+
     return True
 
 
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def range_check(params: dict[str, object]) -> bool:
+    """
+    Checks that 'waveMin' is below 'waveMax', and that the optional
+    'zoomMin'-'zoomMax' sub-range overlaps the window.
+
+    Like 'float()', numbers may be given as strings (ex. "2000"). The
+    converted numbers are written back into params, so the rest of the
+    processing gets floats.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+
+        Returns:
+            True if the range is good. Else, returns False
+    """
+    for key in ["waveMin", "waveMax", "zoomMin", "zoomMax"]:
+        if params.get(key) is None:
+            continue
+        if isinstance(params[key], bool):
+            return False
+        try:
+            value = float(params[key])
+        except (TypeError, ValueError):
+            return False
+        if not np.isfinite(value):
+            return False
+        params[key] = value
+
+    zoomed = apply_zoom(params)
+    return params["waveMin"] < params["waveMax"] and zoomed["waveMin"] < zoomed["waveMax"]
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def mixture_check(mixture: dict[str, object]) -> bool:
+    """
+    Checks the molecules of a gas mixture and their mole fractions.
+
+        Parameters:
+            mixture (dict): the mole fraction of every molecule (ex. {"CO": 0.1, "CO2": 0.05})
+
+        Returns:
+            True if the mixture is good. Else, returns False
+    """
+    if not 0 < len(mixture) <= MAX_MIXTURE:
+        return False
+
+    for molecule, mole in mixture.items():
+        if not isinstance(mole, (int, float)) or isinstance(mole, bool) or not 0 < mole <= 1:
+            return False
+
+    return sum(mixture.values()) <= 1
+
+
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
 def calc_wstep(resolution: float, zero_fill: int) -> float:
     """
@@ -357,147 +472,482 @@ def calc_wstep(resolution: float, zero_fill: int) -> float:
 
     return wstep
 
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def calc_window(wave_min: float, wave_max: float, wstep: float) -> tuple[float, float]:
+    """
+    Snaps a requested wavenumber range onto the full WAVEMIN-WAVEMAX grid so a
+    spectrum calculated over just that window has the same x-values as the
+    matching part of a spectrum calculated over the full range.
+
+        Parameters:
+            wave_min (float): the lowest wavenumber requested
+            wave_max (float): the highest wavenumber requested
+            wstep (float): the wstep of the grid
+
+        Returns:
+            the lower and upper wavenumber to pass to 'calc_spectrum()'
+    """
+    # radis builds its grid with np.arange(wavenum_min, wavenum_max + wstep, wstep)
+    last_index = int(np.ceil((WAVEMAX + wstep - WAVEMIN) / wstep)) - 1
+
+    first = min(max(int(np.floor((wave_min - WAVEMIN) / wstep)), 0), last_index - 1)
+    last = max(min(int(np.ceil((wave_max - WAVEMIN) / wstep)), last_index), first + 1)
+
+    # the upper bound sits half a step below the last grid point so rounding
+    # inside np.arange can never add an extra point to the end of the grid
+    return WAVEMIN + first * wstep, WAVEMIN + (last - 0.5) * wstep
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def calc_grid(wave_min: float, wave_max: float, wstep: float) -> np.ndarray:
+    """
+    Builds the wavenumber grid 'calc_spectrum()' uses for the given range,
+    without calculating a spectrum.
+
+        Parameters:
+            wave_min (float): the lower wavenumber passed to 'calc_spectrum()'
+            wave_max (float): the upper wavenumber passed to 'calc_spectrum()'
+            wstep (float): the wstep of the grid
+
+        Returns:
+            the x-values of the spectrum
+    """
+    #   https://github.com/radis/radis/blob/develop/radis/lbl/factory.py (_generate_wavenumber_range)
+    return np.arange(wave_min, wave_max + wstep, wstep)
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def spectrum_key(params: dict[str, object], wstep: float, window: tuple[float, float]) -> tuple:
+    """
+    Builds the key an ideal spectrum is cached under. Values are normalized so
+    requests that only differ in formatting (ex. "1" and 1.0) share an entry.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            wstep (float): the wstep of the grid
+            window (tuple[float, float]): the wavenumber range passed to 'calc_spectrum()'
+
+        Returns:
+            a hashable key for the ideal spectrum
+    """
+    # a mixture is keyed by its molecules and their mole fractions, in any order
+    if isinstance(params["molecule"], dict):
+        return (
+            tuple(sorted((str(molecule).strip(), round(float(mole), 9)) for molecule, mole in params["molecule"].items())),
+            round(float(params["pressure"]), 9),
+            None,
+            round(wstep, 12),
+            round(window[0], 9),
+            round(window[1], 9),
+        )
+
+    return (
+        str(params["molecule"]).strip(),
+        round(float(params["pressure"]), 9),
+        round(float(params["mole"]), 9),
+        round(wstep, 12),
+        round(window[0], 9),
+        round(window[1], 9),
+    )
+
+
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
-def multiscan(spectrum: Spectrum, num_scans: int) -> Spectrum:
+@lru_cache(maxsize=64)
+def __grid_max(component: str, wstep: float, source_temp: int) -> float:
+    """
+    Finds the maximum of a normalized component over the full WAVEMIN-WAVEMAX
+    grid, so windowed spectra are normalized the same way as full spectra.
+
+        Parameters:
+            component (str): the name of the component (sPlanck, MCT or InSb)
+            wstep (float): the wstep of the grid
+            source_temp (int): the source temperature for the blackbody spectrum
+
+        Returns:
+            the maximum y-value of the component
+    """
+    w = calc_grid(WAVEMIN, WAVEMAX, wstep)
+
+    # evaluates the grid in chunks to keep the temporary arrays small
+    chunk_size = 2**20
+    maximum = -np.inf
+    for start in range(0, len(w), chunk_size):
+        chunk = w[start:start + chunk_size]
+        match component:
+            case "sPlanck":
+                y_value = __sPlanck(chunk, source_temp)
+            case "MCT":
+                y_value = __MCT(chunk)
+            case "InSb":
+                y_value = __InSb(chunk)
+        maximum = max(maximum, np.nanmax(y_value))
+
+    return maximum
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def apply_zoom(params: dict[str, object]) -> dict[str, object]:
+    """
+    Narrows the processed range to the optional 'zoomMin'-'zoomMax' sub-range.
+    Only 'waveMin' and 'waveMax' change, so the ideal spectrum of the full
+    window is reused and the sub-range keeps its full resolution.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+
+        Returns:
+            the parameters to process the spectrum with
+    """
+    if params.get("zoomMin") is None and params.get("zoomMax") is None:
+        return params
+
+    zoomed = dict(params)
+    zoomed["waveMin"] = max(float(params["waveMin"]), float(params.get("zoomMin", params["waveMin"])))
+    zoomed["waveMax"] = min(float(params["waveMax"]), float(params.get("zoomMax", params["waveMax"])))
+
+    return zoomed
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def sweep_steps(params: dict[str, object], max_steps: int) -> list[tuple[float, float]]:
+    """
+    Reads the steps of a sweep: the 'pressures' and/or 'moles' lists. When
+    both are given they are stepped together, so they must have the same
+    length; otherwise the other one stays at 'pressure' or 'mole'. A
+    mixture keeps the mole fractions of its molecules, so only its pressure
+    can be swept.
+
+        Parameters:
+            params (dict): The parameters provided by the user
+            max_steps (int): the most steps a sweep may have
+
+        Returns:
+            the pressure and mole fraction of every step
+    """
+    pressures, moles = params.get("pressures"), params.get("moles")
+    if pressures is None and moles is None:
+        raise ValueError("A sweep needs a list of 'pressures' and/or 'moles'.")
+    if moles is not None and isinstance(params["molecule"], dict):
+        raise ValueError("The mole fractions of a mixture cannot be swept. Please sweep 'pressures' instead.")
+
+    lists = [values for values in [pressures, moles] if values is not None]
+    for values in lists:
+        if not isinstance(values, list) or not values:
+            raise ValueError("'pressures' and 'moles' must be lists of numbers.")
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 for value in values):
+            raise ValueError("Every pressure and mole fraction of a sweep must be a number above zero.")
+    # like 'mixture_check()', a mole fraction is at most 1
+    if moles is not None and not all(value <= 1 for value in moles):
+        raise ValueError("Every mole fraction of a sweep must be at most 1.")
+    if len({len(values) for values in lists}) > 1:
+        raise ValueError("'pressures' and 'moles' must have the same length when both are given.")
+    if len(lists[0]) > max_steps:
+        raise ValueError(f"A sweep may have at most {max_steps} steps.")
+
+    # a mixture has no 'mole'. its steps all get 1, so none of them is scaled (see 'generate_sweep()')
+    count = len(lists[0])
+    return list(zip(
+        [float(value) for value in pressures] if pressures is not None else [float(params["pressure"])] * count,
+        [float(value) for value in moles] if moles is not None else [float(params.get("mole", 1))] * count,
+    ))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def decimate(x_value: np.ndarray, y_value: np.ndarray, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reduces a spectrum to at most 'max_points' points for display.
+
+    The points are split into max_points / 2 buckets of neighbouring points, and
+    the lowest and highest point of each bucket are kept (min/max decimation).
+    A narrow absorption line is the minimum of its bucket, so it is never
+    aliased away the way it would be by keeping every n-th point.
+
+        Parameters:
+            x_value (np.ndarray): the x-values of the spectrum
+            y_value (np.ndarray): the y-values of the spectrum
+            max_points (int): the most points to return
+
+        Returns:
+            the x and y-values of the kept points, in their original order
+    """
+    if len(y_value) <= max_points:
+        return x_value, y_value
+
+    indices = decimation_indices(y_value, max_points)
+    return x_value[indices], y_value[indices]
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def decimation_indices(y_value: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Finds the points 'decimate()' keeps. Several spectra on the same grid are
+    decimated together by keeping the union of their points.
+
+        Parameters:
+            y_value (np.ndarray): the y-values of the spectrum
+            max_points (int): the most points to keep
+
+        Returns:
+            the sorted indices of the kept points
+    """
+    length = len(y_value)
+    if length <= max_points:
+        return np.arange(length)
+
+    buckets = max(max_points // 2, 1)
+    bucket_size = -(-length // buckets)
+
+    # the last bucket is padded with its last value so every bucket has the same size
+    padded = np.pad(y_value, (0, buckets * bucket_size - length), mode="edge").reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+
+    indices = np.concatenate((offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)))
+    return np.unique(np.minimum(indices, length - 1))
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def set_noise_seed(seed: int = None) -> None:
     '''
-    Adds noise to the provided spectrum in chunks to optimize memory usage.
+    Replaces the random number generator used for the noise, so runs can be
+    reproduced and benchmarked.
+
+        Parameters:
+            seed (int): the seed of the new generator, or None for a random seed
+    '''
+    global NOISE_RNG
+    NOISE_RNG = np.random.default_rng(seed)
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def scan_noise(length: int, num_scans: int, rng: np.random.Generator = None) -> np.ndarray:
+    '''
+    Generates the noise left after averaging the given number of scans.
+
+    Each scan adds normally distributed noise (standard deviation 0.005), and
+    the scans are averaged. The average of n such scans is itself normally
+    distributed with a standard deviation of 0.005 / sqrt(n), so it is drawn
+    directly and the cost does not depend on the number of scans.
+
+        Parameters:
+            length (int): the number of points in the spectrum
+            num_scans (int): the number of scans being run on the sample
+            rng (np.random.Generator): the generator to draw from. defaults to NOISE_RNG
+
+        Returns:
+            the noise to add to the y-values
+    '''
+    if rng is None:
+        rng = NOISE_RNG
+
+    high = 0.005
+
+    noise = rng.standard_normal(length)
+    noise *= high / np.sqrt(num_scans)
+
+    return noise
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def multiscan(spectrum: Spectrum, num_scans: int, rng: np.random.Generator = None) -> Spectrum:
+    '''
+    Adds the noise of the averaged scans to the provided spectrum.
 
         Parameters:
             spectrum (Spectrum): the spectrum to add noise to
             num_scans (int): the number of scans being run on the sample
+            rng (np.random.Generator): the generator to draw from. defaults to NOISE_RNG
 
         Returns:
             the spectrum with appropriate noise added
     '''
+    from radis.spectrum.operations import add_array
+
+    if num_scans < 1:
+        return spectrum
+
     # add random noise to spectrum
     #   https://radis.readthedocs.io/en/latest/source/radis.spectrum.operations.html#radis.spectrum.operations.add_array
     w = spectrum.get_wavenumber()
 
-    # the maximum scans done per iteration
-    scans_per_group = 10
-    # how many maximized iterations
-    groups = num_scans // scans_per_group
+    return add_array(
+        spectrum,
+        scan_noise(len(w), num_scans, rng),
+        var="transmittance_noslit",
+    )
 
-    low = 0
-    high = 0.005
 
-    # Adds noise in chunks to save memory space
-    for _ in range(groups):
-        spectrum = add_array(
-            spectrum,
-            sum(np.random.normal(low, high, (scans_per_group, len(w)))) / num_scans,
-            var="transmittance_noslit",
-        )
-    
-    # does the remaining scans when the number of scans does not evenly divide into 10 (scans_per_group)
-    # ex. 115 scans -> the first 110 are done above; the last 5 are done here
-    if scans_per_group * groups < num_scans:
-        # the number of scans done above == scans_per_group * groups
-        # diff == the number of scans remaining
-        diff = num_scans - (scans_per_group * groups)
-        spectrum = add_array(
-            spectrum,
-            sum(np.random.normal(low, high, (diff, len(w)))) / num_scans,
-            var="transmittance_noslit",
-        ) 
-
-    return spectrum
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def add_noise(y_value: np.ndarray, num_scans: int, rng: np.random.Generator = None) -> np.ndarray:
+    '''
+    Array version of 'multiscan()'. Adds the noise to the y-values in place.
+
+        Parameters:
+            y_value (np.ndarray): the y-values to add noise to
+            num_scans (int): the number of scans being run on the sample
+            rng (np.random.Generator): the generator to draw from. defaults to NOISE_RNG
+
+        Returns:
+            the y-values with appropriate noise added
+    '''
+    if num_scans < 1:
+        return y_value
+
+    y_value += scan_noise(len(y_value), num_scans, rng)
+
+    return y_value
+
 
 # @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
-def get_component_spectra(w: np.ndarray, source_temp: int) -> tuple[Spectrum, Spectrum, 
-                                                                     Spectrum, Spectrum, 
-                                                                     Spectrum, Spectrum, 
-                                                                     Spectrum, Spectrum]:
+def select_components(params: dict[str, object]) -> list[str]:
     '''
-    Calculates the spectra for the components of the spectrometer.
+    Lists the components the user's spectrometer is built from, in the order
+    their spectra are multiplied into the sample spectrum.
 
         Parameters:
-            w (np.ndarray): the x-values for all of the spectra
+            params (dict): The parameters provided by the user
+
+        Returns:
+            the names of the selected components. a component used twice is listed twice
+    '''
+    # ----- b.) blackbody spectrum of source -----
+    components = ["sPlanck"]
+
+    # ----- c.) transmission spectrum of windows/beamsplitter -----
+    # ----- c.1) Beamsplitter -----
+    match params["beamsplitter"]:
+        case "AR_ZnSe":
+            components.append("AR_ZnSe")
+        case "AR_CaF2":
+            components.append("AR_CaF2")
+
+    # ----- c.2) cell windows -----
+    match params["window"]:
+        case "CaF2":
+            components.extend(["CaF2", "CaF2"])
+        case "ZnSe":
+            components.extend(["ZnSe", "ZnSe"])
+
+    # ----- d.) detector response spectrum -----
+    match params["detector"]:
+        case "MCT":
+            components.extend(["ZnSe", "MCT"])
+        case "InSb":
+            components.extend(["sapphire", "InSb"])
+
+    return components
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def get_component(component: str, w: np.ndarray, source_temp: int, wstep: float = None) -> np.ndarray:
+    '''
+    Calculates the y-values of a single component of the spectrometer.
+
+    Results are memoized per grid, component and source temperature, so
+    requests on the same grid reuse the arrays instead of evaluating the
+    component functions again. The returned array is read-only. An empty
+    grid (ex. a zoom narrower than one step) gives an empty array.
+
+        Parameters:
+            component (str): the name of the component
+            w (np.ndarray): the x-values of the spectrum
             source_temp (int): the source temperature for the blackbody spectrum
+            wstep (float): the wstep of the full grid 'w' was taken from. when given,
+                           the normalized components use the maximum of the full grid
+                           instead of the maximum of 'w'
 
         Returns:
-            a tuple containing all of the component spectra
+            the y-values of the component
     '''
-    # processing for blackbody spectrum (sPlanck)
-    spec_sPlanck = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __sPlanck(w, source_temp)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="sPlanck",
-    )
-    # Normalize the blackbody spectrum to 1
-    spec_sPlanck.normalize(normalize_how="max", inplace=True, force=True)
-
-    # processing for anti-reflective zinc selenide (AR_ZnSe) beamsplitter
-    spec_AR_ZnSe = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __AR_ZnSe(w) ** (3/5)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="AR_ZnSe",
+    if len(w) == 0:
+        return np.empty(0)
+
+    # an evenly spaced grid is fully defined by its bounds and number of points
+    key = (
+        (len(w), float(w[0]), float(w[-1])),
+        component,
+        source_temp if component == "sPlanck" else None,
+        wstep,
     )
+    cached = COMPONENT_CACHE.get(key)
+    if cached is not None:
+        return cached[0]
+
+    match component:
+        case "sPlanck":
+            # Normalize the blackbody spectrum to 1
+            y_value = __sPlanck(w, source_temp)
+            y_value /= __component_max(component, y_value, wstep, source_temp)
+        case "AR_ZnSe":
+            y_value = __AR_ZnSe(w) ** (3/5)
+        case "AR_CaF2":
+            y_value = __AR_CaF2(w) ** (3/5)
+        case "CaF2":
+            y_value = __CaF2(w) ** (2/5)
+        case "ZnSe":
+            y_value = __ZnSe(w) ** (2/5)
+        case "sapphire":
+            y_value = __sapphire(w) ** (1/5)
+        case "MCT":
+            # Normalize the MCT spectrum to 1
+            y_value = __MCT(w)
+            y_value /= __component_max(component, y_value, wstep, source_temp)
+        case "InSb":
+            # Normalize the InSb spectrum to 2
+            y_value = __InSb(w)
+            y_value *= 2 / __component_max(component, y_value, wstep, source_temp)
+        case other:
+            raise ValueError(f"Unknown component: {other}")
+
+    return COMPONENT_CACHE.put(key, (y_value,))[0]
 
-    # processing for anti-reflective calcium fluoride (AR_CaF2) beamsplitter
-    spec_AR_CaF2 = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __AR_CaF2(w) ** (3/5)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="AR_CaF2",
-    )
 
-    # processing for calcium fluoride (CaF2) cell window
-    spec_CaF2 = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __CaF2(w) ** (2/5)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="CaF2",
-    )
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def __component_max(component: str, y_value: np.ndarray, wstep: float, source_temp: int) -> float:
+    '''
+    Finds the value a component is normalized by.
 
-    # processing for zinc selenide (ZnSe) cell window
-    spec_ZnSe = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __ZnSe(w) ** (2/5)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="ZnSe",
-    )
+        Parameters:
+            component (str): the name of the component
+            y_value (np.ndarray): the y-values of the component before normalization
+            wstep (float): the wstep of the full grid, or None to use the maximum of 'y_value'
+            source_temp (int): the source temperature for the blackbody spectrum
 
-    # processing for sapphire window before detector
-    spec_sapphire = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __sapphire(w) ** (1/5)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="sapphire",
-    )
+        Returns:
+            the maximum of the component
+    '''
+    if wstep is None:
+        return np.nanmax(y_value)
 
-    # processing for Mercury-Cadmium-Telluride (MCT) detector
-    spec_MCT = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __MCT(w)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="MCT",
-    )
-    # Normalize the MCT spectrum to 1
-    spec_MCT.normalize(normalize_how="max", inplace=True, force=True)
-
-    # processing for indium antimonide (InSb) detector
-    spec_InSb = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": __InSb(w)},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="InSb",
-    )
-    # Normalize the InSb spectrum to 2
-    spec_InSb.normalize(normalize_how="max", inplace=True, force=True)
+    return __grid_max(component, wstep, source_temp)
 
-    _, y_value = spec_InSb.get("transmittance_noslit")
-    y_value *= 2
 
-    spec_InSb = Spectrum(
-        {"wavenumber": w, "transmittance_noslit": y_value},
-        wunit="cm-1",
-        units={"transmittance_noslit": ""},
-        name="InSb",
-    )
-    # End InSb Normalization
-    
-    return (spec_sPlanck, spec_AR_ZnSe, spec_AR_CaF2, spec_CaF2, spec_ZnSe, 
-            spec_sapphire, spec_MCT, spec_InSb)
\ No newline at end of file
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def get_component_spectra(w: np.ndarray, components: list[str], source_temp: int,
+                          wstep: float = None) -> list[Spectrum]:
+    '''
+    Calculates the spectra for the selected components of the spectrometer.
+    Only the listed components are evaluated.
+
+        Parameters:
+            w (np.ndarray): the x-values for all of the spectra
+            components (list[str]): the names of the components, from 'select_components()'
+            source_temp (int): the source temperature for the blackbody spectrum
+            wstep (float): the wstep of the full grid 'w' was taken from (see 'get_component()')
+
+        Returns:
+            a list containing the component spectra, in the same order as 'components'
+    '''
+    from radis import Spectrum
+
+    spectra = {}
+    for component in components:
+        if component not in spectra:
+            spectra[component] = Spectrum(
+                {"wavenumber": w, "transmittance_noslit": get_component(component, w, source_temp, wstep)},
+                wunit="cm-1",
+                units={"transmittance_noslit": ""},
+                name=component,
+            )
+
+    return [spectra[component] for component in components]
@@ -0,0 +1,294 @@
+import cProfile
+import collections
+import datetime
+import hmac
+import json
+import os
+import pstats
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# the secret an operator sends in PROFILE_HEADER to profile a request. when unset, profiling is off
+PROFILE_TOKEN = os.environ.get("FTIR_PROFILE_TOKEN", "")
+
+# where the profiles are stored
+PROFILE_DIR = os.environ.get("FTIR_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ftir-profiles"))
+
+# the most profiles kept in PROFILE_DIR, and the seconds one is kept for (0 for no limit). older
+# ones are removed whenever a profile is stored
+PROFILE_KEEP = int(os.environ.get("FTIR_PROFILE_KEEP", 50))
+PROFILE_TTL = float(os.environ.get("FTIR_PROFILE_TTL", 7 * 24 * 3600))
+
+# seconds between the stacks taken by the sampling profiler
+SAMPLE_INTERVAL = float(os.environ.get("FTIR_PROFILE_INTERVAL", 0.005))
+
+# the request headers that turn profiling on and pick the profiler ("cprofile" or "sample")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_MODE_HEADER = "X-Profile-Mode"
+
+# the endpoints that may be profiled
+PROFILED_ENDPOINTS = ["sample", "background", "handle_peaks"]
+
+# functions and allocations reported in the summary of a profile
+TOP_ENTRIES = 30
+
+# tracemalloc traces the whole process, so only one request is profiled at a time
+PROFILE_LOCK = threading.Lock()
+
+
+class StackSampler:
+    """
+    A sampling profiler. A background thread records the stack of the
+    profiled thread every SAMPLE_INTERVAL seconds, so the request runs at
+    close to its normal speed. The stacks are kept in the folded format
+    flame graph tools read ("outer;inner;leaf count").
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        """
+        Creates a sampler for the calling thread.
+
+            Parameters:
+                interval (float): seconds between samples
+        """
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def enable(self) -> None:
+        self._thread.start()
+
+    def disable(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        """
+        Records the stack of the profiled thread until the sampler is disabled.
+        """
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def summary(self) -> list[dict[str, object]]:
+        """
+        Adds up the samples by the function they were taken in.
+
+            Returns:
+                the functions with the most samples, with their own and total samples
+        """
+        own, total = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            functions = stack.split(";")
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+
+        return [
+            {"function": function, "total": count, "own": own[function]}
+            for function, count in total.most_common(TOP_ENTRIES)
+        ]
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """
+    Profiles one request, from 'start()' in the before_request hook to
+    'stop()' in the after_request hook (or the teardown_request hook when
+    the request failed), and stores the profile with the allocation
+    statistics of the request in PROFILE_DIR.
+    """
+
+    def __init__(self, endpoint: str, mode: str = "cprofile") -> None:
+        """
+        Creates a profile.
+
+            Parameters:
+                endpoint (str): the endpoint of the request
+                mode (str): "cprofile" for the deterministic profiler, "sample" for the sampling one
+        """
+        self.endpoint = endpoint
+        self.mode = mode if mode in ["cprofile", "sample"] else "cprofile"
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(4)}"
+        self.profiler = cProfile.Profile() if self.mode == "cprofile" else StackSampler()
+
+    def start(self) -> None:
+        tracemalloc.start(25)
+        self.start_time = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self) -> str:
+        """
+        Stops profiling and stores the profile.
+
+            Returns:
+                the id of the profile
+        """
+        self.profiler.disable()
+        seconds = time.perf_counter() - self.start_time
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.profile_id)
+
+        if self.mode == "cprofile":
+            self.profiler.dump_stats(base + ".pstats")
+            functions = self._functions()
+        else:
+            self.profiler.dump(base + ".folded")
+            functions = self.profiler.summary()
+
+        # allocations made by the profiler itself are left out
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+        summary = {
+            "id": self.profile_id,
+            "endpoint": self.endpoint,
+            "mode": self.mode,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "seconds": seconds,
+            "functions": functions,
+            "allocations": {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {"where": str(statistic.traceback[0]), "bytes": statistic.size, "count": statistic.count}
+                    for statistic in snapshot.statistics("lineno")[:TOP_ENTRIES]
+                ],
+            },
+        }
+        with open(base + ".json", "w") as f:
+            json.dump(summary, f, indent=1)
+
+        prune_profiles()
+        return self.profile_id
+
+    def _functions(self) -> list[dict[str, object]]:
+        """
+        Lists the functions that took the longest, including the functions they called.
+
+            Returns:
+                the functions with their calls, own and cumulative seconds
+        """
+        stats = pstats.Stats(self.profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_ENTRIES]
+
+        return [
+            {
+                "function": f"{name} ({os.path.basename(file)}:{line})",
+                "calls": calls,
+                "own": own_time,
+                "total": total_time,
+            }
+            for (file, line, name), (_, calls, own_time, total_time, _) in functions
+        ]
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def profile_allowed(token: str) -> bool:
+    """
+    Checks the token an operator sent. Profiling is only possible when
+    FTIR_PROFILE_TOKEN is set on the server, and the token is compared in
+    constant time so it cannot be guessed from the response times.
+
+        Parameters:
+            token (str): the value of PROFILE_HEADER, or None
+
+        Returns:
+            whether the request may be profiled
+    """
+    if not PROFILE_TOKEN or not token:
+        return False
+
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def profile_path(profile_id: str, extension: str) -> str | None:
+    """
+    Finds a stored profile.
+
+        Parameters:
+            profile_id (str): the id of the profile
+            extension (str): ".json", ".pstats" or ".folded"
+
+        Returns:
+            the file, or None if the id is invalid or the file does not exist
+    """
+    if not re.fullmatch(r"[0-9]{8}-[0-9]{6}-[0-9a-f]{8}", profile_id):
+        return None
+
+    path = os.path.join(PROFILE_DIR, profile_id + extension)
+    return path if os.path.exists(path) else None
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def prune_profiles(keep: int = None, ttl: float = None) -> list[str]:
+    """
+    Removes the profiles older than 'ttl' seconds, then the oldest ones
+    beyond the newest 'keep', with all of their files.
+
+        Parameters:
+            keep (int): the most profiles to keep, defaults to PROFILE_KEEP
+            ttl (float): the seconds a profile is kept for, defaults to PROFILE_TTL
+
+        Returns:
+            the ids of the removed profiles
+    """
+    keep = PROFILE_KEEP if keep is None else keep
+    ttl = PROFILE_TTL if ttl is None else ttl
+
+    # the files of every profile, by id, and when the profile was last written
+    profiles = collections.defaultdict(list)
+    written = collections.defaultdict(float)
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        profile_id, extension = os.path.splitext(name)
+        if extension not in [".json", ".pstats", ".folded"] or profile_path(profile_id, extension) is None:
+            continue
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            written[profile_id] = max(written[profile_id], os.stat(path).st_mtime)
+        except FileNotFoundError:
+            continue
+        profiles[profile_id].append(path)
+
+    newest = sorted(profiles, key=lambda profile_id: written[profile_id], reverse=True)
+    now = time.time()
+    removed = [
+        profile_id for rank, profile_id in enumerate(newest)
+        if (keep and rank >= keep) or (ttl and now - written[profile_id] > ttl)
+    ]
+    for profile_id in removed:
+        for path in profiles[profile_id]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    return removed
@@ -0,0 +1,261 @@
+# this script times the endpoints and processing functions on a synthetic line list, so it runs
+# offline and gives the same spectra on every machine. ex.
+#   python scripts/benchmark.py --out results.json
+#   python scripts/benchmark.py --out results.json --baseline baseline.json
+# compare a change by saving a run of the old code as the baseline. the script exits with 1 when
+# a case got slower than --threshold times its baseline
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from synthetic import synthetic_lines
+
+# the resolutions and zero fills of 'calc_wstep()'
+RESOLUTIONS = [1, 0.5, 0.25, 0.125, 0.0625, 0.03125, 0.015625]
+ZERO_FILLS = [0, 1, 2]
+
+# window widths (cm^-1), centred on the fundamental band of the synthetic CO
+WIDTHS = [10, 100, 1000, 4000]
+
+SCANS = [1, 10, 100, 1000]
+DETECTORS = ["MCT", "InSb"]
+WINDOWS = ["CaF2", "ZnSe"]
+
+# the parameters every case starts from
+BASE_PARAMS = {
+    "beamsplitter": "AR_ZnSe",
+    "detector": "MCT",
+    "medium": "Air",
+    "mole": 0.1,
+    "molecule": "CO",
+    "pressure": 1,
+    "resolution": 1,
+    "scan": 1,
+    "source": 3100,
+    "waveMax": 2300,
+    "waveMin": 1900,
+    "window": "CaF2",
+    "zeroFill": 0,
+}
+
+
+def setup_environment() -> str:
+    """
+    Points the server at a new temporary line database, turns off the caches
+    so every repeat does the work again, and seeds the noise. Must be called
+    before the modules of the server are imported, since they read these
+    settings when they are imported.
+
+        Returns:
+            the temporary directory of the line database
+    """
+    os.environ.setdefault("FTIR_SPECTRUM_CACHE_MB", "0")
+    os.environ.setdefault("FTIR_COMPONENT_CACHE_MB", "0")
+    os.environ.setdefault("FTIR_NOISE_SEED", "0")
+    os.environ["FTIR_LINEDB"] = tempfile.mkdtemp(prefix="ftir-benchmark-")
+    os.environ.pop("FTIR_LIBRARY", None)
+    os.environ.pop("FTIR_WARM_MOLECULES", None)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+    return os.environ["FTIR_LINEDB"]
+
+
+def time_case(run, repeat: int) -> dict[str, object]:
+    """
+    Times a case, after one run to warm it up.
+
+        Parameters:
+            run (Callable): runs the case once and returns whether it succeeded
+            repeat (int): the number of timed runs
+
+        Returns:
+            the median, fastest and slowest time in seconds, or the error
+    """
+    try:
+        if not run():
+            return {"error": "the case did not succeed"}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    return {"median": statistics.median(times), "min": min(times), "max": max(times), "repeat": repeat}
+
+
+def build_cases() -> dict[str, object]:
+    """
+    Lists the cases: the processing functions directly and the endpoints
+    through the Flask test client.
+
+        Returns:
+            the cases, by name
+    """
+    from app import app
+    from processing import generate_ideal, process_arrays
+    from processing_utils import calc_wstep
+
+    client = app.test_client()
+
+    def post(route: str, body: dict[str, object]):
+        return lambda: client.post(route, data=json.dumps(body)).get_json()["success"]
+
+    def ideal(params: dict[str, object]):
+        return lambda: not generate_ideal(params)[1]
+
+    cases = {}
+
+    # ----- the wstep table, over the same window -----
+    for resolution in RESOLUTIONS:
+        for zero_fill in ZERO_FILLS:
+            params = {**BASE_PARAMS, "resolution": resolution, "zeroFill": zero_fill}
+            cases[f"ideal/wstep={calc_wstep(resolution, zero_fill)}/res={resolution}/zf={zero_fill}"] = ideal(params)
+
+    # ----- window widths -----
+    for width in WIDTHS:
+        params = {**BASE_PARAMS, "waveMin": 2143 - width / 2, "waveMax": 2143 + width / 2}
+        cases[f"ideal/width={width}"] = ideal(params)
+        cases[f"sample/width={width}"] = post("/sample", params)
+
+    # ----- detectors and cell windows, on one ideal spectrum -----
+    spectrum, error, message = generate_ideal(BASE_PARAMS)
+    if error:
+        raise RuntimeError(message)
+    for detector in DETECTORS:
+        for window in WINDOWS:
+            params = {**BASE_PARAMS, "detector": detector, "window": window}
+            cases[f"process/detector={detector}/window={window}"] = (
+                lambda params=params: len(process_arrays(params, *spectrum)[0]) > 0
+            )
+            cases[f"sample/detector={detector}/window={window}"] = post("/sample", params)
+            cases[f"background/detector={detector}/window={window}"] = post("/background", params)
+            cases[f"sample_background/detector={detector}/window={window}"] = post(
+                "/sample_background", {**params, "ratio": "absorbance"}
+            )
+
+    # ----- scans -----
+    for scan in SCANS:
+        cases[f"sample/scan={scan}"] = post("/sample", {**BASE_PARAMS, "scan": scan})
+
+    # ----- sweeps -----
+    for name, steps in [("moles", {"moles": [0.02 * i for i in range(1, 11)]}),
+                        ("scaled_moles", {"moles": [0.02 * i for i in range(1, 11)], "exact": False}),
+                        ("pressures", {"pressures": [0.25 * i for i in range(1, 11)]})]:
+        cases[f"sweep/{name}=10"] = post("/sweep", {**BASE_PARAMS, **steps})
+
+    # ----- response formats -----
+    for params in [{"format": "base64"}, {"format": "binary"}, {"maxPoints": 2000}]:
+        name = ",".join(f"{key}={value}" for key, value in params.items())
+        body = {**BASE_PARAMS, "resolution": 0.0625, "waveMin": 1800, "waveMax": 2500, **params}
+        cases[f"sample/{name}"] = lambda body=body: client.post("/sample", data=json.dumps(body)).status_code == 200
+
+    # ----- peaks of a sample spectrum -----
+    sample = client.post("/sample", data=json.dumps(BASE_PARAMS)).get_json()
+    background = client.post("/background", data=json.dumps(BASE_PARAMS)).get_json()
+    absorbance = -np.log10(np.clip(np.asarray(sample["y"], dtype=float) / np.asarray(background["y"], dtype=float),
+                                   1e-6, None))
+    for method in ["numpy", "specutils"]:
+        cases[f"find_peaks/method={method}"] = post("/find_peaks", {
+            "x": sample["x"],
+            "y": absorbance.tolist(),
+            "threshold": 0.1,
+            "lowerbound": BASE_PARAMS["waveMin"],
+            "upperbound": BASE_PARAMS["waveMax"],
+            "method": method,
+        })
+
+    return cases
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """
+    Compares the median times of the cases in both runs.
+
+        Parameters:
+            results (dict): the cases of this run
+            baseline (dict): the cases of the baseline run
+            threshold (float): the ratio of the medians above which a case is a regression
+
+        Returns:
+            the names of the cases that got slower
+    """
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None or "median" not in old or "median" not in result:
+            continue
+
+        ratio = result["median"] / old["median"] if old["median"] else float("inf")
+        result["baseline"] = old["median"]
+        result["ratio"] = ratio
+        if ratio > threshold:
+            regressions.append(name)
+        print(f"  {name}: {old['median'] * 1000:.1f}ms -> {result['median'] * 1000:.1f}ms ({ratio:.2f}x)"
+              + (" REGRESSION" if ratio > threshold else ""))
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the endpoints and processing functions offline.")
+    parser.add_argument("--out", required=True, help="the JSON file to write the results to")
+    parser.add_argument("--baseline", help="a JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="report a case as a regression when it is this many times slower than the baseline")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of every case")
+    parser.add_argument("--cases", default="", help="only run the cases whose name contains this text")
+    parser.add_argument("--lines", type=int, default=20000, help="random lines in the synthetic line list")
+    args = parser.parse_args()
+
+    linedb_dir = setup_environment()
+    from linedb import write_linedb
+
+    write_linedb(synthetic_lines(args.lines), linedb_dir, "CO")
+
+    results = {}
+    for name, run in build_cases().items():
+        if args.cases in name:
+            results[name] = time_case(run, args.repeat)
+            print(f"{name}: " + (f"{results[name]['median'] * 1000:.1f}ms" if "median" in results[name]
+                                 else results[name]["error"]))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"compared to {args.baseline}:")
+        regressions = compare(results, baseline["cases"], args.threshold)
+
+    import radis
+    with open(args.out, "w") as f:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "radis": radis.__version__,
+            "machine": platform.platform(),
+            "cpus": os.cpu_count(),
+            "lines": args.lines,
+            "cases": results,
+            "regressions": regressions,
+        }, f, indent=1)
+    shutil.rmtree(linedb_dir, ignore_errors=True)
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
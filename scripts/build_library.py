@@ -0,0 +1,194 @@
+# this script precomputes ideal spectra for the offline library that library.py serves them from.
+# run it from anywhere once the HITRAN data is downloaded (see download_hitran.py), ex.
+#   python scripts/build_library.py --out library --molecules CO,CO2 --pressures 0.5,1,2 --moles 0.05,0.1,0.2 --validate
+# then start the server with FTIR_LIBRARY=library
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# every spectrum is only calculated once, so there is no point in caching them
+os.environ.setdefault("FTIR_SPECTRUM_CACHE_MB", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from library import INDEX_FILE
+from processing import generate_ideal
+from processing_utils import WAVEMIN, WAVEMAX, calc_grid, calc_wstep
+
+# the resolutions and zero fills of 'calc_wstep()'
+RESOLUTIONS = [1, 0.5, 0.25, 0.125, 0.0625, 0.03125, 0.015625]
+ZERO_FILLS = [0, 1, 2]
+
+
+def absorbance(task: tuple[str, float, int, float, float]) -> np.ndarray:
+    """
+    Calculates the absorbance of an ideal spectrum over WAVEMIN-WAVEMAX.
+
+        Parameters:
+            task (tuple): the molecule, resolution, zero fill, pressure and mole fraction
+
+        Returns:
+            the absorbance, -ln(transmittance)
+    """
+    molecule, resolution, zero_fill, pressure, mole = task
+    params = {
+        "molecule": molecule,
+        "resolution": resolution,
+        "zeroFill": zero_fill,
+        "pressure": pressure,
+        "mole": mole,
+    }
+
+    ideal, error, message = generate_ideal(params, windowed=False)
+    if error:
+        raise RuntimeError(f"{molecule} at {pressure} bar and mole fraction {mole}: {message}")
+
+    return -np.log(np.maximum(ideal[1], np.finfo(np.float64).tiny))
+
+
+def build_entry(pool: ProcessPoolExecutor, out: str, molecule: str, resolution: float, zero_fill: int,
+                pressures: list[float], moles: list[float], validate: bool) -> dict[str, object]:
+    """
+    Calculates the spectra of one molecule and wstep and writes them to a .npy file.
+
+        Parameters:
+            pool (ProcessPoolExecutor): the processes to calculate the spectra in
+            out (str): the directory of the library
+            molecule (str): the molecule
+            resolution (float): the resolution
+            zero_fill (int): the zero fill
+            pressures (list[float]): the pressures of the grid
+            moles (list[float]): the mole fractions of the grid
+            validate (bool): measure the interpolation error in every cell of the grid
+
+        Returns:
+            the entry of the index
+    """
+    wstep = calc_wstep(resolution, zero_fill)
+    count = len(calc_grid(WAVEMIN, WAVEMAX, wstep))
+    name = f"{molecule}_{wstep:.9f}.npy"
+
+    tasks = [(molecule, resolution, zero_fill, pressure, mole) for pressure in pressures for mole in moles]
+    partial = os.path.join(out, name + ".partial")
+    array = np.lib.format.open_memmap(partial, mode="w+", dtype=np.float32,
+                                      shape=(len(pressures), len(moles), count))
+    for number, values in enumerate(pool.map(absorbance, tasks)):
+        if len(values) != count:
+            raise RuntimeError(f"{molecule}: expected {count} points, got {len(values)}")
+        array[number // len(moles), number % len(moles)] = values
+    array.flush()
+
+    errors = None
+    if validate and (len(pressures) > 1 or len(moles) > 1):
+        errors = validate_entry(pool, array, molecule, resolution, zero_fill, pressures, moles)
+
+    del array
+    os.replace(partial, os.path.join(out, name))
+
+    return {
+        "molecule": molecule,
+        "wstep": wstep,
+        "resolution": resolution,
+        "zeroFill": zero_fill,
+        "pressures": pressures,
+        "moles": moles,
+        "count": count,
+        "file": name,
+        "errors": errors,
+    }
+
+
+def validate_entry(pool: ProcessPoolExecutor, array: np.ndarray, molecule: str, resolution: float, zero_fill: int,
+                   pressures: list[float], moles: list[float]) -> list[list[float]]:
+    """
+    Measures the error of the bilinear interpolation at the centre of every
+    cell of the grid, where it is largest, by calculating the spectrum there.
+
+        Parameters:
+            pool (ProcessPoolExecutor): the processes to calculate the spectra in
+            array (np.ndarray): the absorbance of the grid
+            molecule (str): the molecule
+            resolution (float): the resolution
+            zero_fill (int): the zero fill
+            pressures (list[float]): the pressures of the grid
+            moles (list[float]): the mole fractions of the grid
+
+        Returns:
+            the largest transmittance error of every cell
+    """
+    # a single value on one axis means no interpolation along it
+    p_cells = [(i, min(i + 1, len(pressures) - 1)) for i in range(max(len(pressures) - 1, 1))]
+    m_cells = [(j, min(j + 1, len(moles) - 1)) for j in range(max(len(moles) - 1, 1))]
+
+    cells = [(p_cell, m_cell) for p_cell in p_cells for m_cell in m_cells]
+    tasks = [
+        (molecule, resolution, zero_fill, (pressures[p0] + pressures[p1]) / 2, (moles[m0] + moles[m1]) / 2)
+        for (p0, p1), (m0, m1) in cells
+    ]
+
+    errors = [[None] * len(m_cells) for _ in p_cells]
+    for ((p0, p1), (m0, m1)), exact in zip(cells, pool.map(absorbance, tasks)):
+        interpolated = (array[p0, m0].astype(np.float64) + array[p0, m1] + array[p1, m0] + array[p1, m1]) / 4
+        errors[p0][m0] = float(np.max(np.abs(np.exp(-interpolated) - np.exp(-exact))))
+
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute ideal spectra for the offline library.")
+    parser.add_argument("--out", required=True, help="directory of the library")
+    parser.add_argument("--molecules", required=True, help="comma separated molecules, ex. CO,CO2")
+    parser.add_argument("--pressures", required=True, help="comma separated pressures (bar)")
+    parser.add_argument("--moles", required=True, help="comma separated mole fractions")
+    parser.add_argument("--resolutions", default=",".join(map(str, RESOLUTIONS)), help="comma separated resolutions")
+    parser.add_argument("--zero-fills", default=",".join(map(str, ZERO_FILLS)), help="comma separated zero fills")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to calculate spectra in")
+    parser.add_argument("--validate", action="store_true",
+                        help="measure the interpolation error of every cell, so spectra between grid points can be served")
+    args = parser.parse_args()
+
+    pressures = sorted(float(value) for value in args.pressures.split(","))
+    moles = sorted(float(value) for value in args.moles.split(","))
+
+    # resolutions and zero fills that share a wstep share their spectra
+    wsteps = {}
+    for resolution in [float(value) for value in args.resolutions.split(",")]:
+        for zero_fill in [int(value) for value in args.zero_fills.split(",")]:
+            wsteps.setdefault(calc_wstep(resolution, zero_fill), (resolution, zero_fill))
+
+    os.makedirs(args.out, exist_ok=True)
+    index_path = os.path.join(args.out, INDEX_FILE)
+    index = {"entries": []}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        for molecule in args.molecules.split(","):
+            for wstep, (resolution, zero_fill) in sorted(wsteps.items(), reverse=True):
+                start = time.perf_counter()
+                entry = build_entry(pool, args.out, molecule, resolution, zero_fill, pressures, moles, args.validate)
+
+                # replace an older entry of the same molecule and wstep
+                index["entries"] = [
+                    old for old in index["entries"]
+                    if (old["molecule"], round(old["wstep"], 12)) != (molecule, round(wstep, 12))
+                ] + [entry]
+                index.update({"wavemin": WAVEMIN, "wavemax": WAVEMAX})
+
+                # the index is replaced in one step, so the server never reads half of it
+                with open(index_path + ".partial", "w") as f:
+                    json.dump(index, f, indent=1)
+                os.replace(index_path + ".partial", index_path)
+
+                errors = [error for row in entry["errors"] or [] for error in row]
+                print(f"{molecule} wstep={wstep}: {entry['count']} points in {time.perf_counter() - start:.1f}s"
+                      + (f", largest interpolation error {max(errors):.2e}" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# this script measures the peak memory and CPU time of spectra of different sizes and fits the
+# cost models admission.py predicts them with. ex.
+#   python scripts/calibrate_admission.py --out calibration.json --molecules CO,CO2,H2O
+#   python scripts/calibrate_admission.py --out calibration.json --synthetic
+# then start the server with FTIR_ADMISSION_CALIBRATION=calibration.json. every run is measured in
+# a new process, through the endpoint, so imports and earlier runs do not count
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# every run should do the work again, and is never turned away
+os.environ["FTIR_SPECTRUM_CACHE_MB"] = "0"
+os.environ["FTIR_COMPONENT_CACHE_MB"] = "0"
+os.environ.pop("FTIR_LIBRARY", None)
+os.environ.pop("FTIR_WORKER_BUDGET_MB", None)
+os.environ.pop("FTIR_SINGLE_FLIGHT_DIR", None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from admission import grid_points, model_key
+
+# the endpoint of every kind of request
+ENDPOINTS = {"sample": "/sample", "background": "/background", "pair": "/sample_background"}
+
+# the settings every run is measured with, from coarse to fine. together with WIDTHS
+# they spread the runs from a few hundred to a few million grid points
+SETTINGS = [(1, 0), (0.25, 1), (0.0625, 1), (0.015625, 0), (0.015625, 2)]
+
+# window widths (cm^-1), centred on CENTRE
+WIDTHS = [100, 1000, 4000]
+CENTRE = 2150
+
+# the parameters every run starts from
+BASE_PARAMS = {
+    "beamsplitter": "AR_ZnSe",
+    "detector": "MCT",
+    "medium": "Air",
+    "mole": 0.1,
+    "pressure": 1,
+    "scan": 1,
+    "source": 3100,
+    "window": "CaF2",
+}
+
+
+def memory() -> tuple[int, int]:
+    """
+    Reads the resident memory of this process and its peak.
+
+        Returns:
+            the resident memory and the peak resident memory, in bytes
+    """
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                values[line.split(":")[0]] = int(line.split()[1]) * 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def measure(kind: str, params: dict[str, object]) -> dict[str, float]:
+    """
+    Sends one request in this process and measures it. The same request on
+    a narrow window is sent first, so the imports and the line database are
+    loaded before the measurement starts.
+
+        Parameters:
+            kind (str): "sample", "background" or "pair"
+            params (dict): the parameters of the request
+
+        Returns:
+            the peak memory the request added in bytes, and its CPU and wall seconds
+    """
+    from app import app
+
+    client = app.test_client()
+    client.post(ENDPOINTS[kind], data=json.dumps({**params, "waveMin": CENTRE - 1, "waveMax": CENTRE + 1}))
+
+    # writing 5 resets the peak resident memory (Linux 4.0+)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    rss, _ = memory()
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    response = client.post(ENDPOINTS[kind], data=json.dumps(params))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+    _, peak = memory()
+    body = response.get_json()
+    return {
+        "memory_bytes": peak - rss,
+        "cpu_seconds": cpu,
+        "wall_seconds": wall,
+        "error": None if body.get("success") else body.get("text"),
+    }
+
+
+def fit(points: np.ndarray, values: np.ndarray) -> dict[str, float]:
+    """
+    Fits a fixed part plus a part per grid point to measured values, and
+    the margin that makes the model cover every one of them.
+
+        Parameters:
+            points (np.ndarray): the grid points of the runs
+            values (np.ndarray): the measured values of the runs
+
+        Returns:
+            the coefficients of the model
+    """
+    values = np.maximum(values, 1e-12)
+    per_point, base = 0, np.max(values)
+    if len(set(points)) > 1:
+        # weighted by 1 / value, so small and large runs are fitted with the same relative error
+        per_point, base = np.polyfit(points, values, 1, w=1 / values)
+        if base < 0 or per_point < 0:
+            per_point, base = np.median(values / points), 0
+
+    predicted = np.maximum(base + per_point * points, 1e-12)
+    return {
+        "base": float(base),
+        "per_point": float(per_point),
+        "margin": float(max(np.max(values / predicted), 1)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit the cost models of admission.py to measured runs.")
+    parser.add_argument("--out", required=True, help="the JSON file to write the calibration to")
+    parser.add_argument("--molecules", default="CO", help="comma separated molecules to calibrate")
+    parser.add_argument("--kinds", default="sample,background,pair", help="comma separated kinds of requests")
+    parser.add_argument("--max-points", type=int, default=2_000_000, help="skip runs with more grid points")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="calibrate CO on the synthetic line list of scripts/synthetic.py")
+    parser.add_argument("--lines", type=int, default=20000, help="random lines in the synthetic line list")
+    args = parser.parse_args()
+
+    linedb_dir = None
+    if args.synthetic:
+        # sets FTIR_LINEDB to a temporary directory, which the runs inherit
+        from benchmark import setup_environment
+        from linedb import write_linedb
+        from synthetic import synthetic_lines
+
+        linedb_dir = setup_environment()
+        write_linedb(synthetic_lines(args.lines), linedb_dir, "CO")
+        args.molecules = "CO"
+
+    runs = []
+    for kind in args.kinds.split(","):
+        for molecule in args.molecules.split(",") if kind != "background" else [args.molecules.split(",")[0]]:
+            for (resolution, zero_fill) in SETTINGS:
+                for width in WIDTHS:
+                    params = {
+                        **BASE_PARAMS,
+                        "molecule": molecule,
+                        "resolution": resolution,
+                        "zeroFill": zero_fill,
+                        "waveMin": CENTRE - width / 2,
+                        "waveMax": CENTRE + width / 2,
+                    }
+                    points = grid_points(params)
+                    if points > args.max_points:
+                        continue
+
+                    # a new process for every run, so nothing is left from the one before
+                    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                        run = pool.submit(measure, kind, params).result()
+
+                    run.update({"model": model_key(params, kind), "points": points,
+                                "resolution": resolution, "zeroFill": zero_fill, "width": width})
+                    runs.append(run)
+                    print(f"{run['model']} {points} points: {run['memory_bytes'] / 2**20:.1f}MB, "
+                          f"{run['cpu_seconds']:.3f}s cpu" + (f" ({run['error']})" if run["error"] else ""))
+
+    models = {}
+    for key in sorted({run["model"] for run in runs}):
+        measured = [run for run in runs if run["model"] == key and run["error"] is None]
+        if not measured:
+            continue
+
+        points = np.array([run["points"] for run in measured], dtype=float)
+        models[key] = {
+            name: fit(points, np.array([run[name] for run in measured], dtype=float))
+            for name in ["memory_bytes", "cpu_seconds"]
+        }
+
+    # molecules that were not calibrated are predicted with the most expensive calibrated one
+    for kind in ["sample", "pair"]:
+        calibrated = [model for key, model in models.items() if key.startswith(f"{kind}:")]
+        if calibrated:
+            models[f"{kind}:*"] = {
+                name: max((model[name] for model in calibrated), key=lambda c: c["base"] + c["per_point"] * 1e6)
+                for name in ["memory_bytes", "cpu_seconds"]
+            }
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "synthetic": args.synthetic,
+            "models": models,
+            "runs": runs,
+        }, f, indent=1)
+
+    if linedb_dir:
+        shutil.rmtree(linedb_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# this script converts the HITRAN data downloaded by download_hitran.py into the memory-mapped
+# line databases read by linedb.py. it never downloads anything: molecules that have not been
+# downloaded yet are skipped. ex.
+#   python scripts/convert_hitran.py --out linedb --molecules CO,CO2 --cutoff 1e-27
+# then start the server with FTIR_LINEDB=linedb
+import argparse
+import os
+import sys
+import time
+
+from radis.api.dbmanager import getDatabankEntries
+from radis.io.hitran import fetch_hitran
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from linedb import EQUILIBRIUM_COLUMNS, LineDatabase, write_linedb
+
+
+def local_files(molecule: str) -> list[str]:
+    """
+    Finds the downloaded HITRAN files of a molecule.
+
+        Parameters:
+            molecule (str): the molecule
+
+        Returns:
+            the files, or an empty list if the molecule has not been downloaded
+    """
+    try:
+        files = getDatabankEntries(f"HITRAN-{molecule}")["path"]
+    except Exception:
+        return []
+
+    files = [files] if isinstance(files, str) else list(files)
+    return files if files and all(os.path.exists(file) for file in files) else []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert downloaded HITRAN data into memory-mapped line databases.")
+    parser.add_argument("--out", required=True, help="directory of the line databases")
+    parser.add_argument("--molecules", required=True, help="comma separated molecules, ex. CO,CO2")
+    parser.add_argument("--cutoff", type=float, default=None,
+                        help="drop the lines with a lower intensity (cm-1/(molecule.cm-2))")
+    parser.add_argument("--verify", action="store_true", help="only check the checksums of existing line databases")
+    args = parser.parse_args()
+
+    for molecule in args.molecules.split(","):
+        if args.verify:
+            damaged = LineDatabase(os.path.join(args.out, molecule), verify=False).verify()
+            print(f"{molecule}: " + (f"damaged: {', '.join(damaged)}" if damaged else "ok"))
+            continue
+
+        files = local_files(molecule)
+        if not files:
+            print(f"{molecule}: not downloaded, skipped (run download_hitran.py first)")
+            continue
+
+        start = time.perf_counter()
+        # the files exist, so fetch_hitran() only reads them. it loads every isotope, and
+        # write_linedb() keeps those the spectra are calculated with (ISOTOPES)
+        lines = fetch_hitran(molecule, columns=EQUILIBRIUM_COLUMNS, verbose=False)
+        manifest = write_linedb(lines, args.out, molecule, args.cutoff, files)
+        print(f"{molecule}: {manifest['rows']} of {len(lines)} lines in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
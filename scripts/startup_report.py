@@ -0,0 +1,108 @@
+# this script starts gunicorn with lazy and with preloaded imports and reports how long it takes
+# until every worker answers, and the memory of the master and of every worker. ex.
+#   python scripts/startup_report.py --workers 4
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from startup import process_memory
+
+
+def get(url: str) -> dict[str, object] | None:
+    """
+    Sends a GET request to the server.
+
+        Parameters:
+            url (str): the URL
+
+        Returns:
+            the JSON response, or None if the server did not answer
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
+
+
+def measure(mode: str, workers: int, port: int, timeout: float) -> dict[str, object]:
+    """
+    Starts gunicorn in one mode, waits until every worker has answered
+    GET /startup and measures the memory of its processes.
+
+        Parameters:
+            mode (str): "lazy" or "preload"
+            workers (int): the number of workers
+            port (int): the port to listen on
+            timeout (float): the most seconds to wait for the workers
+
+        Returns:
+            the seconds until the first and the last worker answered, and the report of every process
+    """
+    env = {**os.environ, "FTIR_PRELOAD": "1" if mode == "preload" else "0"}
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        ["gunicorn", "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        reports, first = {}, None
+        while len(reports) < workers and time.perf_counter() - start < timeout:
+            # every request is answered by whichever worker accepts it first
+            report = get(f"http://127.0.0.1:{port}/startup")
+            if report is None:
+                time.sleep(0.05)
+                continue
+            first = first or time.perf_counter() - start
+            reports[report["startup"]["pid"]] = report["startup"]
+        last = time.perf_counter() - start if len(reports) == workers else None
+
+        # memory of the workers after they started, measured from outside
+        for pid, report in reports.items():
+            report.update(process_memory(pid))
+
+        return {
+            "mode": mode,
+            "first_answer_seconds": round(first, 3) if first else None,
+            "all_workers_seconds": round(last, 3) if last else None,
+            "master": process_memory(server.pid),
+            "workers": list(reports.values()),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare gunicorn startup with lazy and preloaded imports.")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--port", type=int, default=5055, help="port to start gunicorn on")
+    parser.add_argument("--timeout", type=float, default=120, help="most seconds to wait for the workers")
+    parser.add_argument("--out", help="a JSON file to write the results to")
+    args = parser.parse_args()
+
+    results = [measure(mode, args.workers, args.port, args.timeout) for mode in ["lazy", "preload"]]
+
+    for result in results:
+        print(f"{result['mode']}: first answer {result['first_answer_seconds']}s, "
+              f"all {args.workers} workers {result['all_workers_seconds']}s, master {result['master']}")
+        for worker in result["workers"]:
+            print(f"  worker {worker['pid']}: boot {worker.get('worker_boot_seconds')}s, "
+                  f"rss {worker.get('rss_mb')}MB, shared {worker.get('shared_mb')}MB, pss {worker.get('pss_mb')}MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# the synthetic CO line list the benchmarks, the tests and the admission calibration run on, so
+# they work offline and calculate the same spectra on every machine. importing this module does
+# not change any setting of the server
+import numpy as np
+import pandas as pd
+
+
+def synthetic_lines(count: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds a CO line list: the P and R branches of the fundamental and first
+    overtone bands, plus weak random lines over the whole spectrometer range
+    so every window has lines.
+
+        Parameters:
+            count (int): the number of random lines
+            seed (int): the seed of the random lines
+
+        Returns:
+            the lines, with the columns Radis loads for equilibrium spectra
+    """
+    rng = np.random.default_rng(seed)
+
+    # rigid rotor bands, with the Boltzmann population of the lower level at 296 K
+    j = np.arange(0, 60)
+    b, hc_k = 1.9225, 1.4388
+    el = b * j * (j + 1)
+    population = (2 * j + 1) * np.exp(-hc_k * el / 296)
+    wav, strength, lower = [], [], []
+    for origin, peak in [(2143.27, 1e-19), (4260.06, 1e-21)]:
+        wav += [origin + 2 * b * (j + 1), origin - 2 * b * (j + 1)]
+        strength += [peak * population / population.max()] * 2
+        lower += [el, el + 2 * b * (j + 1)]
+
+    wav = np.concatenate(wav + [rng.uniform(400, 12500, count)])
+    lines = pd.DataFrame({
+        "id": np.full(len(wav), 5, dtype=np.int64),
+        "iso": np.full(len(wav), 1, dtype=np.int64),
+        "wav": wav,
+        "int": np.concatenate(strength + [10 ** rng.uniform(-26, -22, count)]),
+        "A": rng.uniform(1, 40, len(wav)),
+        "airbrd": rng.uniform(0.04, 0.08, len(wav)),
+        "selbrd": rng.uniform(0.05, 0.09, len(wav)),
+        "Tdpair": np.full(len(wav), 0.7),
+        "Tdpsel": np.full(len(wav), 0.7),
+        "Pshft": np.full(len(wav), -0.003),
+        "El": np.concatenate(lower + [rng.uniform(0, 3000, count)]),
+        "gp": np.concatenate([2 * j + 3, 2 * j + 1] * 2 + [rng.integers(1, 120, count)]).astype(np.float64),
+    })
+    lines.attrs.update({"id": 5, "iso": 1})
+    return lines
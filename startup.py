@@ -0,0 +1,76 @@
+import importlib
+import os
+import sys
+import time
+
+# set FTIR_PRELOAD=1 to import everything in the gunicorn master (see gunicorn.conf.py), so the
+# forked workers share the imported modules copy-on-write and answer their first request at once.
+# otherwise each worker imports the heavy modules the first time an endpoint needs them
+PRELOAD = os.environ.get("FTIR_PRELOAD", "") not in ["", "0", "false"]
+
+# the modules that take seconds to import (radis, specutils and astropy through them)
+HEAVY_MODULES = ["radis", "specutils.fitting"]
+
+# how this process started, filled in by wsgi.py and the gunicorn hooks
+STARTUP_REPORT = {"mode": "preload" if PRELOAD else "lazy"}
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def preload() -> float:
+    """
+    Imports HEAVY_MODULES now instead of on first use.
+
+        Returns:
+            the seconds the imports took
+    """
+    start = time.perf_counter()
+    for module in HEAVY_MODULES:
+        importlib.import_module(module)
+
+    STARTUP_REPORT["preload_seconds"] = round(time.perf_counter() - start, 3)
+    return STARTUP_REPORT["preload_seconds"]
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def process_memory(pid: int | str = "self") -> dict[str, float]:
+    """
+    Measures the memory of a process. The proportional set size (PSS)
+    splits every shared page between the processes sharing it, so unlike
+    the resident memory it shows what a forked worker really costs.
+
+        Parameters:
+            pid (int | str): the process, defaults to this one
+
+        Returns:
+            the resident, shared and proportional memory in MB (PSS only on Linux 4.14+)
+    """
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident, shared = [int(value) * os.sysconf("SC_PAGE_SIZE") for value in f.read().split()[1:3]]
+        memory.update({"rss_mb": round(resident / 2**20, 1), "shared_mb": round(shared / 2**20, 1)})
+
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_mb"] = round(int(line.split()[1]) / 2**10, 1)
+    except (OSError, ValueError):
+        pass
+
+    return memory
+
+
+# @validate_arguments(config=ConfigDict(strict=True, arbitrary_types_allowed=True))
+def startup_report() -> dict[str, object]:
+    """
+    Reports how this process started and how much memory it uses now.
+
+        Returns:
+            the startup mode and times, the heavy modules already imported and the memory
+    """
+    return {
+        **STARTUP_REPORT,
+        "pid": os.getpid(),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in sys.modules],
+        **process_memory(),
+    }
@@ -0,0 +1,68 @@
+# the tests run offline on the synthetic CO line list of scripts/synthetic.py, which is written to
+# a temporary line database before the first test. the directory is removed after the last test
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+# the modules of the server read these when they are imported, so they are set first. the
+# caches are turned off, so every test calculates its spectra
+TEMP_DIR = tempfile.mkdtemp(prefix="ftir-tests-")
+os.environ["FTIR_LINEDB"] = os.path.join(TEMP_DIR, "linedb")
+os.environ["FTIR_PROFILE_DIR"] = os.path.join(TEMP_DIR, "profiles")
+os.environ["FTIR_HANDLE_DIR"] = os.path.join(TEMP_DIR, "handles")
+os.environ["FTIR_SPECTRUM_CACHE_MB"] = "0"
+os.environ["FTIR_COMPONENT_CACHE_MB"] = "0"
+for name in ["FTIR_LIBRARY", "FTIR_WARM_MOLECULES", "FTIR_WORKER_BUDGET_MB", "FTIR_SINGLE_FLIGHT_DIR"]:
+    os.environ.pop(name, None)
+
+from benchmark import BASE_PARAMS as BENCHMARK_PARAMS  # noqa: E402
+from linedb import LINEDB_DIR, write_linedb  # noqa: E402
+from synthetic import synthetic_lines  # noqa: E402
+
+# the parameters every test starts from, on a window the synthetic CO has lines in
+BASE_PARAMS = {**BENCHMARK_PARAMS, "waveMin": 2000, "waveMax": 2200}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def linedb():
+    write_linedb(synthetic_lines(2000), LINEDB_DIR, "CO")
+
+    # a second molecule (for mixtures) with only the lines of the CO fundamental band, so a
+    # window away from it has no lines and cannot be calculated
+    lines = synthetic_lines(0)
+    band = lines[(lines["wav"] > 1950) & (lines["wav"] < 2350)].assign(id=2)
+    band.attrs.update({"id": 2, "iso": 1})
+    write_linedb(band, LINEDB_DIR, "CO2")
+
+    yield LINEDB_DIR
+    shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def params():
+    return dict(BASE_PARAMS)
+
+
+@pytest.fixture
+def client():
+    from app import app
+
+    return app.test_client()
+
+
+def post(client, endpoint: str, params: dict[str, object], seed: int = 0):
+    """
+    Sends a request with the noise seeded, so the same request gives the same spectrum.
+    """
+    from processing_utils import set_noise_seed
+
+    set_noise_seed(seed)
+    return client.post(endpoint, data=json.dumps(params))
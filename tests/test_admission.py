@@ -0,0 +1,107 @@
+import json
+import time
+
+import pytest
+
+import app
+from admission import AdmissionController, CostEstimator, grid_points
+from conftest import post
+from jobs import FAILED, JobQueue
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    def install(worker_mb: float, wait: float = 0.2) -> AdmissionController:
+        controller = AdmissionController(int(worker_mb * 2**20), wait=wait)
+        monkeypatch.setattr(app, "ADMISSION", controller)
+        return controller
+
+    return install
+
+
+def test_stream_is_admitted_for_one_segment(client, params, admission, monkeypatch):
+    monkeypatch.setattr("admission.STREAM_POINTS", 100)
+    controller = admission(100)
+    params.update({"stream": True, "resolution": 0.0625, "zeroFill": 2})
+
+    response = post(client, "/sample", params)
+    assert response.mimetype == "application/x-ndjson"
+    # the memory stays reserved until the last segment has been sent
+    assert controller.stats()["running"] == 1
+    response.get_data()
+    response.close()
+    assert controller.stats()["running"] == 0
+    assert controller.admitted == 1
+
+    estimator = CostEstimator()
+    assert estimator.estimate(params, "stream")["points"] == 100 < grid_points(params)
+
+
+def test_stream_too_large_is_rejected(client, params, admission):
+    admission(1)
+    response = post(client, "/sample", {**params, "stream": True}).get_json()
+    assert response["success"] is False
+
+
+def test_batch_reserves_the_sum(client, params, admission):
+    spectra = [params, {**params, "type": "background"}, {**params, "pressure": 0.5}]
+    estimator = CostEstimator()
+    total = sum(estimator.estimate(spectrum, spectrum.get("type", "sample"))["memory_bytes"] for spectrum in spectra)
+
+    # every spectrum fits on its own, but not all of them together
+    admission(total / 2**20 * 0.9)
+    response = client.post("/batch", data=json.dumps({"spectra": spectra})).get_json()
+    assert response["success"] is False
+
+    controller = admission(total / 2**20 * 1.1)
+    response = client.post("/batch", data=json.dumps({"spectra": spectra})).get_json()
+    assert response["success"] is True and all(result["success"] for result in response["results"])
+    assert controller.admitted == 1 and controller.stats()["reserved_bytes"] == 0
+
+
+def test_jobs_are_admitted_when_dispatched(params):
+    controller = AdmissionController(2**20, wait=0.2)
+    queue = JobQueue(workers=1, admission=controller)
+    job = queue.submit("sample", {**params, "downgrade": False}, {})
+
+    deadline = time.monotonic() + 10
+    while job.state != FAILED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.state == FAILED and "MB" in job.message
+    assert controller.rejected == 1
+
+
+def test_admitted_job_releases_its_memory(params):
+    controller = AdmissionController(2**30, wait=0.2)
+    queue = JobQueue(workers=1, admission=controller)
+    job = queue.submit("sample", params, {})
+
+    assert queue.wait(job.id, 60).state == "done"
+    assert controller.admitted == 1 and controller.stats()["reserved_bytes"] == 0
+
+
+def test_mixture_costs_the_sum_of_its_molecules(params, tmp_path):
+    calibration = tmp_path / "calibration.json"
+    calibration.write_text(json.dumps({"models": {
+        f"sample:{molecule}": {
+            "memory_bytes": {"base": base, "per_point": 100, "margin": 1},
+            "cpu_seconds": {"base": 0.1, "per_point": 1e-6, "margin": 1},
+        } for molecule, base in [("CO", 2**20), ("CO2", 2**21)]
+    }}))
+    estimator = CostEstimator(str(calibration))
+
+    mixture = {**params, "molecule": {"CO": 0.1, "CO2": 0.05}}
+    mixture.pop("mole")
+    cost = estimator.estimate(mixture, "sample")
+    co = estimator.estimate({**params, "molecule": "CO"}, "sample")
+    co2 = estimator.estimate({**params, "molecule": "CO2"}, "sample")
+
+    # each molecule is predicted with its own calibration
+    assert co["memory_bytes"] != co2["memory_bytes"]
+    assert cost["points"] == co["points"]
+    assert cost["memory_bytes"] == pytest.approx(co["memory_bytes"] + co2["memory_bytes"])
+    assert cost["cpu_seconds"] == pytest.approx(co["cpu_seconds"] + co2["cpu_seconds"])
+
+    sweep = estimator.estimate({**mixture, "pressures": [1, 2]}, "sweep")
+    assert sweep["memory_bytes"] > cost["memory_bytes"]
+    assert estimator.estimate(mixture, "background") == estimator.estimate(params, "background")
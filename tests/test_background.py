@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from conftest import post
+from processing import generate_background_grid, generate_ideal
+
+
+@pytest.mark.parametrize("resolution, zero_fill, wave_min, wave_max", [
+    (1, 0, 2000, 2200),
+    (0.25, 2, 2050.3, 2051.7),
+    (0.0625, 1, 400, 450),
+    (0.5, 1, 12400, 12500),
+])
+def test_background_grid_matches_calc_spectrum(params, resolution, zero_fill, wave_min, wave_max):
+    params.update({"resolution": resolution, "zeroFill": zero_fill, "waveMin": wave_min, "waveMax": wave_max})
+    (wave_number, _), error, message = generate_ideal(params)
+    assert not error, message
+
+    grid = generate_background_grid(params)
+    assert len(grid) == len(wave_number)
+    np.testing.assert_allclose(grid, wave_number, rtol=0, atol=1e-9)
+
+
+def test_background_has_the_x_values_of_the_sample(client, params):
+    sample = post(client, "/sample", params).get_json()
+    background = post(client, "/background", params).get_json()
+    assert background["x"] == sample["x"]
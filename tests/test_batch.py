@@ -0,0 +1,46 @@
+import base64
+import json
+
+import numpy as np
+
+from conftest import post
+
+WINDOWS = [(2000, 2100), (2050, 2200), (5000, 5100), (2100, 2150)]
+
+
+def test_batch_keeps_the_order_and_reports_errors_per_spectrum(client, params):
+    spectra = [
+        {**params, "waveMin": WINDOWS[0][0], "waveMax": WINDOWS[0][1]},
+        {**params, "waveMin": WINDOWS[1][0], "waveMax": WINDOWS[1][1], "type": "background"},
+        # CO2 only has lines around 2150 cm^-1
+        {**params, "waveMin": WINDOWS[2][0], "waveMax": WINDOWS[2][1], "molecule": "CO2"},
+        {**params, "waveMin": WINDOWS[3][0], "waveMax": WINDOWS[3][1], "format": "base64"},
+    ]
+    response = post(client, "/batch", {"spectra": spectra}).get_json()
+
+    assert response["success"] is True
+    results = response["results"]
+    assert [result["success"] for result in results] == [True, True, False, True]
+    assert "not enough data points" in results[2]["text"]
+
+    # every result is the spectrum of its own window
+    results[3]["x"] = np.frombuffer(base64.b64decode(results[3]["x"]), dtype="<f8")
+    for index in [0, 1, 3]:
+        wave_min, wave_max = WINDOWS[index]
+        assert wave_min <= results[index]["x"][0] and results[index]["x"][-1] <= wave_max
+
+
+def test_batch_matches_single_requests(client, params):
+    quiet = {**params, "scan": 10000}
+    results = post(client, "/batch", {"spectra": [quiet, {**quiet, "type": "background"}, quiet]}).get_json()["results"]
+
+    for kind, result in zip(["/sample", "/background", "/sample"], results):
+        single = post(client, kind, quiet).get_json()
+        assert result["x"] == single["x"]
+        np.testing.assert_allclose(np.array(result["y"], dtype=float), np.array(single["y"], dtype=float), atol=5e-4)
+
+
+def test_invalid_batch_is_rejected(client, params):
+    for spectra in [[], [{**params, "type": "unknown"}], [{**params, "format": "binary"}], "sample"]:
+        response = client.post("/batch", data=json.dumps({"spectra": spectra})).get_json()
+        assert response["success"] is False
@@ -0,0 +1,152 @@
+import threading
+import time
+
+import numpy as np
+
+import pytest
+
+from cache import LRUCache, SingleFlight
+
+
+def value(number: int, size: int = 10) -> tuple[np.ndarray, ...]:
+    return (np.full(size, number, dtype=np.float64),)
+
+
+def run_threads(target, count: int) -> None:
+    threads = [threading.Thread(target=target, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_bytes=3 * 80)
+    for key in "abc":
+        cache.put(key, value(ord(key)))
+
+    cache.get("a")
+    cache.put("d", value(4))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+    assert not cache.get("a")[0].flags.writeable
+
+
+def test_lru_leaves_the_arrays_of_the_caller_writeable():
+    cache = LRUCache(max_bytes=80)
+    array = np.zeros(10)
+    stored = cache.put("a", (array,))[0]
+
+    array[0] = 1
+    assert not stored.flags.writeable
+    assert cache.get("a")[0] is stored
+
+
+def test_lru_stays_within_budget_under_concurrency():
+    cache = LRUCache(max_bytes=20 * 80)
+    errors = []
+
+    def work(number):
+        try:
+            for i in range(200):
+                key = (number * 7 + i) % 50
+                stored = cache.get(key)
+                if stored is None:
+                    cache.put(key, value(key))
+                else:
+                    assert stored[0][0] == key
+        except Exception as e:
+            errors.append(e)
+
+    run_threads(work, 16)
+
+    stats = cache.stats()
+    assert not errors
+    assert stats["bytes"] == stats["entries"] * 80 <= stats["max_bytes"]
+    assert stats["hits"] + stats["misses"] == 16 * 200
+
+
+def wait_for_callers(flight: SingleFlight, count: int) -> None:
+    # the running call waits until the other callers are waiting on it
+    deadline = time.monotonic() + 5
+    while flight.stats()["waited"] < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_single_flight_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    calls, results = [], [None] * 8
+
+    def calculate():
+        calls.append(1)
+        wait_for_callers(flight, 7)
+        return value(1)
+
+    def work(number):
+        results[number] = flight.do("key", calculate)
+
+    run_threads(work, 8)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 1, "waited": 7, "shared": 0, "running": 0}
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight()
+    errors = []
+
+    def calculate():
+        wait_for_callers(flight, 3)
+        raise ValueError("failed")
+
+    def work(number):
+        with pytest.raises(ValueError):
+            flight.do("key", calculate)
+        errors.append(number)
+
+    run_threads(work, 4)
+
+    assert len(errors) == 4
+    assert flight.stats()["calls"] == 1
+    # a later call runs the function again
+    assert flight.do("key", lambda: value(2))[0][0] == 2
+
+
+def test_single_flight_fails_waiters_when_interrupted():
+    flight = SingleFlight()
+    leaders, errors = [], []
+
+    class Interrupted(BaseException):
+        pass
+
+    def calculate():
+        wait_for_callers(flight, 3)
+        raise Interrupted()
+
+    def work(number):
+        try:
+            flight.do("key", calculate)
+        except Interrupted:
+            leaders.append(number)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    run_threads(work, 4)
+
+    assert len(leaders) == 1
+    assert errors == ["calculation aborted"] * 3
+    assert flight.stats()["running"] == 0
+
+
+def test_single_flight_shares_values_across_processes(tmp_path):
+    first = SingleFlight(directory=str(tmp_path))
+    second = SingleFlight(directory=str(tmp_path))
+
+    first.do("key", lambda: value(3))
+    shared = second.do("key", lambda: pytest.fail("the value should be read from disk"))
+
+    np.testing.assert_array_equal(shared[0], value(3)[0])
+    assert second.stats()["shared"] == 1
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import processing_utils
+from cache import LRUCache
+from processing_utils import calc_grid, calc_wstep, get_component, select_components
+
+
+@pytest.fixture
+def component_cache(monkeypatch):
+    # the tests turn the caches off, so this one gets its own
+    cache = LRUCache(2**24, name="component")
+    monkeypatch.setattr(processing_utils, "COMPONENT_CACHE", cache)
+    return cache
+
+
+def test_component_is_memoized_per_grid(params, component_cache):
+    wstep = calc_wstep(1, 0)
+    grid = calc_grid(2000, 2200, wstep)
+
+    for component in select_components(params):
+        first = get_component(component, grid, 3100, wstep)
+        # an equal grid in a new array has the same key
+        assert get_component(component, grid.copy(), 3100, wstep) is first
+        assert not first.flags.writeable
+
+    # every component is calculated once, even the ones used twice
+    components = select_components(params)
+    stats = component_cache.stats()
+    assert stats["misses"] == stats["entries"] == len(set(components))
+    assert stats["hits"] == 2 * len(components) - len(set(components))
+
+
+def test_component_key_tells_grids_and_sources_apart(component_cache):
+    wstep = calc_wstep(1, 0)
+    grid = calc_grid(2000, 2200, wstep)
+
+    planck = get_component("sPlanck", grid, 3100, wstep)
+    assert get_component("sPlanck", grid, 1200, wstep) is not planck
+    assert get_component("sPlanck", grid[:-1], 3100, wstep) is not planck
+    # only the blackbody depends on the source temperature
+    assert get_component("CaF2", grid, 1200, wstep) is get_component("CaF2", grid, 3100, wstep)
+
+
+def test_memoized_component_matches_a_new_calculation(params, component_cache):
+    wstep = calc_wstep(0.25, 1)
+    grid = calc_grid(2000, 2200, wstep)
+
+    for component in set(select_components({**params, "detector": "InSb"})):
+        cached = get_component(component, grid, 3100, wstep)
+        component_cache.clear()
+        np.testing.assert_array_equal(get_component(component, grid, 3100, wstep), cached)
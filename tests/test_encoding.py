@@ -0,0 +1,68 @@
+import json
+import struct
+
+import numpy as np
+
+from conftest import post
+from encoding import encode_spectrum, response_options, stream_spectrum
+
+
+def test_binary_matches_json(client, params):
+    spectrum = post(client, "/sample", params).get_json()
+    response = post(client, "/sample", {**params, "format": "binary"})
+
+    assert response.mimetype == "application/octet-stream"
+    assert response.headers["X-Spectrum-Series"] == "x,y"
+    count = int(response.headers["X-Spectrum-Count"])
+    values = np.frombuffer(response.data, dtype="<f8")
+    np.testing.assert_array_equal(values[:count], np.array(spectrum["x"], dtype=float))
+    np.testing.assert_array_equal(values[count:], np.array(spectrum["y"], dtype=float))
+
+
+def test_binary_converts_byte_order_and_dtype():
+    x_value = np.linspace(0, 1, 5).astype(">f8")
+    y_value = np.arange(10, dtype=np.float64).reshape(2, 5)[:, ::-1]
+    for dtype in ["float32", "float64"]:
+        response = encode_spectrum(x_value, {"y": y_value}, response_options({"format": "binary", "dtype": dtype}))
+        values = np.frombuffer(response.get_data(), dtype="<f4" if dtype == "float32" else "<f8")
+        np.testing.assert_allclose(values[:5], x_value.astype(float))
+        np.testing.assert_allclose(values[5:], y_value.ravel())
+
+
+def test_binary_frames():
+    x_value = np.linspace(2000, 2001, 4)
+    segments = [((x_value, x_value * 2), False, ""), (None, True, "failed")]
+    response = stream_spectrum(segments, response_options({"format": "binary"}))
+    data = response.get_data()
+
+    assert struct.unpack_from("<I", data)[0] == 4
+    values = np.frombuffer(data, dtype="<f8", count=8, offset=4)
+    np.testing.assert_array_equal(values, np.concatenate([x_value, x_value * 2]))
+    error, length = struct.unpack_from("<II", data, 68)
+    assert data[76:76 + length].decode("utf-8") == "failed"
+
+
+def test_binary_headers():
+    x_value = np.linspace(2000, 2001, 4)
+    y_value = np.ones((3, 4))
+    downgraded = {"resolution": 0.5, "zeroFill": 0}
+    response = encode_spectrum(x_value, {"y": y_value}, response_options({"format": "binary"}),
+                               {"handle": "abc", "decimated": True, "downgraded": downgraded})
+
+    assert response.headers["X-Spectrum-Rows"] == "3"
+    assert response.headers["X-Spectrum-handle"] == "abc"
+    assert json.loads(response.headers["X-Spectrum-decimated"]) is True
+    assert json.loads(response.headers["X-Spectrum-downgraded"]) == downgraded
+
+    values = np.frombuffer(response.get_data(), dtype="<f8")
+    rows = int(response.headers["X-Spectrum-Rows"])
+    np.testing.assert_array_equal(values[4:].reshape(rows, 4), y_value)
+
+
+def test_binary_sweep_rows(client, params):
+    response = post(client, "/sweep", {**params, "moles": [0.1, 0.2], "format": "binary"})
+    count, rows = int(response.headers["X-Spectrum-Count"]), int(response.headers["X-Spectrum-Rows"])
+
+    assert rows == 2
+    assert len(np.frombuffer(response.data, dtype="<f8")) == count * (rows + 1)
+    assert post(client, "/sweep", {**params, "moles": [0.1, 0.2], "format": "base64"}).get_json()["rows"] == 2
@@ -0,0 +1,46 @@
+import logging
+
+import engines
+from conftest import post
+
+
+def test_fallback_without_radis_internals(client, params, monkeypatch):
+    expected = post(client, "/sample", params).get_json()
+
+    monkeypatch.setattr(engines, "ENGINES_SUPPORTED", None)
+    monkeypatch.setattr(engines, "RADIS_INTERNALS", {**engines.RADIS_INTERNALS, "_not_in_radis": "method"})
+    monkeypatch.setattr(engines, "ENGINES", {})
+    assert not engines.engines_supported()
+    assert engines.get_engine("CO") is None
+    assert engines.warm_start(["CO"])["molecules"]["CO"]["error"]
+
+    # without engines, spectra go through calc_spectrum, which needs the HITRAN files
+    calls = []
+
+    def calc_spectrum(*args, **kwargs):
+        calls.append(kwargs)
+        raise RuntimeError("no HITRAN files")
+
+    monkeypatch.setattr("radis.calc_spectrum", calc_spectrum)
+    response = post(client, "/sample", {**params, "pressure": 0.5}).get_json()
+    assert calls and response == {"success": False, "text": "no HITRAN files"}
+    assert expected["success"] is True
+
+
+def test_engines_supported_by_installed_radis(monkeypatch, caplog):
+    monkeypatch.setattr(engines, "ENGINES_SUPPORTED", None)
+    with caplog.at_level(logging.WARNING, logger="engines"):
+        assert engines.engines_supported()
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_engines_unsupported_is_logged(monkeypatch, caplog):
+    # a method that became a property, and a slot that became a method
+    for internals in [{"_wstep": "method"}, {"_reset_references": "slot"}, {"_not_in_radis": "slot"}]:
+        monkeypatch.setattr(engines, "ENGINES_SUPPORTED", None)
+        monkeypatch.setattr(engines, "RADIS_INTERNALS", internals)
+        caplog.clear()
+        with caplog.at_level(logging.ERROR, logger="engines"):
+            assert not engines.engines_supported()
+        assert [record for record in caplog.records if record.levelno == logging.ERROR]
+        assert list(internals)[0] in caplog.text and engines.RADIS_VERSION in caplog.text
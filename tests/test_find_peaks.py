@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from conftest import post
+from processing import find_peaks
+
+
+@pytest.mark.parametrize("threshold", [0, 0.005])
+def test_numpy_matches_specutils(client, params, threshold):
+    # an absorbance-like spectrum: noisy lines around zero
+    spectrum = post(client, "/sample", params).get_json()
+    x_value = np.array(spectrum["x"], dtype=float)
+    y_value = 1 - np.array(spectrum["y"], dtype=float) / np.max(np.array(spectrum["y"], dtype=float))
+
+    for bounds in [(None, None), (2050, 2150)]:
+        numpy, error = find_peaks(x_value, y_value, threshold, *bounds, method="numpy")
+        assert error is None
+        specutils, error = find_peaks(x_value, y_value, threshold, *bounds, method="specutils")
+        assert error is None
+        assert numpy == specutils
+        assert numpy
+
+
+def test_flat_tops_and_edges():
+    x_value = np.arange(10, dtype=float)
+    y_value = np.array([1, 0, 2, 2, -1, 0, 3, 1, -2, 4], dtype=float)
+    peaks, error = find_peaks(x_value, y_value, method="numpy")
+    assert error is None
+    assert peaks == {0.0: 1.0, 2.0: 2.0, 6.0: 3.0, 9.0: 4.0}
+    assert peaks == find_peaks(x_value, y_value, method="specutils")[0]
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pytest
+
+import app
+from cache import SharedCache
+from conftest import post
+
+
+def value(number: int, size: int = 1000) -> tuple[np.ndarray, ...]:
+    return (np.full(size, number, dtype=np.float64),)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # room for two values of 'value()' and the headers of their files
+    store = SharedCache(str(tmp_path), 2 * 8000 + 2000, name="handle", ttl=600)
+    monkeypatch.setattr(app, "SPECTRUM_STORE", store)
+    return store
+
+
+def peaks(client, data):
+    return client.post("/find_peaks", json={"threshold": 0, **data}).get_json()
+
+
+def test_handle_is_shared_between_workers(tmp_path):
+    first = SharedCache(str(tmp_path), 2**20, ttl=600)
+    second = SharedCache(str(tmp_path), 2**20, ttl=600)
+
+    first.put("handle", value(1))
+    stored = second.get("handle")
+    np.testing.assert_array_equal(stored[0], value(1)[0])
+    assert not stored[0].flags.writeable
+    assert second.stats()["hits"] == 1 and second.stats()["entries"] == 1
+
+
+def test_handle_expires(client, params, store):
+    response = post(client, "/sample", {**params, "handle": True}).get_json()
+    assert response["expires"] == 600
+    assert peaks(client, {"handle": response["handle"]})["text"] is None
+
+    store.ttl = 0.05
+    time.sleep(0.1)
+    expired = peaks(client, {"handle": response["handle"]})
+    assert expired["success"] is False and "expired" in expired["text"]
+    assert store.stats()["entries"] == 0
+
+
+def test_least_recently_used_handle_is_evicted(store):
+    store.put("a", value(1))
+    store.put("b", value(2))
+    assert store.get("a") is not None
+
+    store.put("c", value(3))
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+
+    stats = store.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= store.max_bytes
+
+    # a value larger than the whole store is never kept
+    store.put("d", value(4, 10000))
+    assert store.get("d") is None
+
+
+def test_handle_keeps_the_full_spectrum_with_max_points(client, params, tmp_path, monkeypatch):
+    store = SharedCache(str(tmp_path), 2**20, name="handle", ttl=600)
+    monkeypatch.setattr(app, "SPECTRUM_STORE", store)
+    params.update({"resolution": 0.25, "handle": True})
+    full = post(client, "/sample", params).get_json()
+    decimated = post(client, "/sample", {**params, "maxPoints": 50}).get_json()
+
+    assert decimated["decimated"] is True and len(decimated["x"]) <= 50
+    x_value, y_value = store.get(decimated["handle"])
+    assert len(x_value) == len(full["x"])
+    np.testing.assert_array_equal(y_value, np.array(full["y"], dtype=float))
+
+    # the peaks are found on the full spectrum, not on the decimated one
+    found = peaks(client, {"handle": decimated["handle"]})["peaks"]
+    assert found and found == peaks(client, {"x": full["x"], "y": full["y"]})["peaks"]
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import app
+import jobs
+from jobs import JOB_MAX_PRIORITY, PRIORITY_HEADER, JobQueue
+
+
+@pytest.fixture(autouse=True)
+def cancel_jobs():
+    yield
+    # jobs left in the queue would be handed to the pool after it is shut down at exit
+    for job_id in list(app.JOBS._jobs):
+        app.JOBS.cancel(job_id)
+
+
+def submit(client, params, priority, headers=None):
+    response = client.post("/jobs", data=json.dumps({**params, "priority": priority}), headers=headers or {})
+    return app.JOBS._jobs[response.get_json()["id"]]
+
+
+def test_priority_is_clamped_and_raised_only_by_operators(client, params, monkeypatch):
+    assert submit(client, params, 1000).priority == 0
+    assert submit(client, params, -1000).priority == -JOB_MAX_PRIORITY
+
+    monkeypatch.setattr(jobs, "JOB_PRIORITY_TOKEN", "operator")
+    assert submit(client, params, 1000, {PRIORITY_HEADER: "operator"}).priority == JOB_MAX_PRIORITY
+    assert submit(client, params, 3, {PRIORITY_HEADER: "operator"}).priority == 3
+    assert submit(client, params, 3, {PRIORITY_HEADER: "guess"}).priority == 0
+
+
+def test_profile_token_does_not_raise_priority(client, params, monkeypatch):
+    monkeypatch.setattr(app, "profile_allowed", lambda token: True)
+    assert submit(client, params, 5, {app.PROFILE_HEADER: "operator"}).priority == 0
+
+
+def test_invalid_priority(client, params):
+    for priority in ["high", 1.5, True]:
+        response = client.post("/jobs", data=json.dumps({**params, "priority": priority}))
+        assert response.get_json()["success"] is False
+
+
+def test_wait_is_capped(client, params):
+    job = submit(client, params, 0)
+    response = client.get(f"/jobs/{job.id}/result?wait=3600").get_json()
+    assert response["success"] is True or response["state"] in ["queued", "running"]
+    assert app.MAX_JOB_WAIT <= 5
+
+
+class FailingAdmission:
+    # admitting the first job raises, and every later one is rejected
+    def __init__(self):
+        self.calls = 0
+
+    def admit(self, params, kind):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("admission failed")
+        return None, True, "rejected"
+
+
+def test_dispatcher_survives_an_admission_error(params):
+    queue = JobQueue(workers=1, admission=FailingAdmission())
+    first = queue.submit("background", params, {})
+    second = queue.submit("background", params, {})
+
+    assert queue.wait(first.id, 5).state == "failed"
+    # the next job is still handed out after the error
+    assert queue.wait(second.id, 5).message == "rejected"
+    assert queue.stats()["running"] == 0
@@ -0,0 +1,37 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import processing
+from build_library import build_entry
+from library import INDEX_FILE, LIBRARY_TOLERANCE, SpectrumLibrary
+
+
+def test_library_matches_the_calculation(params, monkeypatch, tmp_path):
+    params = {**params, "pressure": 0.5, "mole": 0.05}
+    pressures, moles = [0.5, 0.7], [0.05, 0.07]
+
+    # the engine of a molecule calculates one spectrum at a time, so one thread is enough
+    with ThreadPoolExecutor(1) as pool:
+        entry = build_entry(pool, str(tmp_path), "CO", params["resolution"], params["zeroFill"],
+                            pressures, moles, validate=True)
+    with open(tmp_path / INDEX_FILE, "w") as f:
+        json.dump({"entries": [entry]}, f)
+
+    # a grid point, and the centre of the cell, where the interpolation error is largest
+    for pressure, mole in [(0.5, 0.05), (0.6, 0.06)]:
+        request = {**params, "pressure": pressure, "mole": mole}
+
+        monkeypatch.setattr(processing, "LIBRARY", None)
+        (x_value, calculated), error, message = processing.generate_ideal(request)
+        assert not error, message
+
+        library = SpectrumLibrary(str(tmp_path))
+        assert library.lookup(request, entry["wstep"], (2000, 2200)) is not None
+        monkeypatch.setattr(processing, "LIBRARY", library)
+        (library_x, stored), error, message = processing.generate_ideal(request)
+        assert not error, message
+
+        np.testing.assert_allclose(library_x, x_value)
+        np.testing.assert_allclose(stored, calculated, rtol=0, atol=LIBRARY_TOLERANCE)
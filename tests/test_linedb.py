@@ -0,0 +1,39 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from engines import Engine
+from linedb import open_linedb, write_linedb
+from synthetic import synthetic_lines
+
+
+def with_isotopes(lines: pd.DataFrame) -> pd.DataFrame:
+    # the same lines again as isotopes 2 and 5, like a conversion of the whole HITRAN cache
+    return pd.concat([lines, lines.assign(iso=2), lines.assign(iso=5)], ignore_index=True)
+
+
+def test_write_linedb_keeps_only_calculated_isotopes():
+    lines = synthetic_lines(200)
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = write_linedb(with_isotopes(lines), directory, "CO")
+        database = open_linedb("CO", directory)
+
+        assert manifest["rows"] == 2 * len(lines)
+        assert set(database.lines(0, 1e6)["iso"]) == {1, 2}
+
+
+def test_engine_skips_other_isotopes():
+    lines = synthetic_lines(200)
+    with tempfile.TemporaryDirectory() as directory:
+        write_linedb(lines, directory, "CO")
+        database = open_linedb("CO", directory)
+        engine = Engine("CO", database)
+        expected = engine.calc_spectrum(2000, 2200, 0.5, 50, 1, 0.1).get("transmittance_noslit")
+
+        # a database written before the isotopes were filtered
+        read = database.lines
+        database.lines = lambda wave_min, wave_max: with_isotopes(read(wave_min, wave_max)).query("iso != 2")
+        spectrum = engine.calc_spectrum(2000, 2200, 0.5, 50, 1, 0.1).get("transmittance_noslit")
+
+        np.testing.assert_allclose(spectrum[1], expected[1])
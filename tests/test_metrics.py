@@ -0,0 +1,39 @@
+import re
+
+import pytest
+
+import app
+import metrics
+from conftest import post
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(app, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+
+
+def count(text: str, name: str, labels: str, default: int = None) -> int:
+    match = re.search(rf"^{name}{{{labels}}} (\S+)$", text, re.MULTILINE)
+    assert match or default is not None, f"{name}{{{labels}}} is missing"
+    return int(float(match.group(1))) if match else default
+
+
+def test_metrics_are_off_by_default(client):
+    assert client.get("/metrics").get_json() == {"success": False, "text": "Metrics are turned off on this server."}
+
+
+def test_metrics_count_requests_and_stages(client, params, enabled):
+    before = client.get("/metrics").get_data(as_text=True)
+    requests = count(before, "ftir_request_seconds_count", 'endpoint="sample"', default=0)
+
+    response = post(client, "/sample", params)
+    assert "calc_spectrum;dur=" in response.headers["Server-Timing"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert count(text, "ftir_request_seconds_count", 'endpoint="sample"') == requests + 1
+    assert count(text, "ftir_stage_seconds_count", 'stage="calc_spectrum"') >= 1
+    assert count(text, "ftir_request_seconds_bucket", 'endpoint="sample",le="\\+Inf"') == requests + 1
+    assert re.search(r'^ftir_cache_misses_total\{cache="\w+"\} \d+$', text, re.MULTILINE)
+    assert re.search(r"^ftir_resident_memory_bytes \d+$", text, re.MULTILINE)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from conftest import post
+from engines import get_engine
+from processing import generate_ideal
+from processing_utils import WING_MARGIN, calc_wstep, calc_window
+
+MIXTURE = {"CO": 0.1, "CO2": 0.05}
+
+
+def absorbance(transmittance: np.ndarray) -> np.ndarray:
+    return -np.log(transmittance)
+
+
+def test_mixture_absorbance_is_the_sum_of_its_molecules(params):
+    params.pop("mole")
+    (x_value, mixture), error, message = generate_ideal({**params, "molecule": MIXTURE})
+    assert not error, message
+
+    parts = []
+    for molecule, mole in MIXTURE.items():
+        (single_x, transmittance), error, message = generate_ideal({**params, "molecule": molecule, "mole": mole})
+        assert not error, message
+        np.testing.assert_array_equal(single_x, x_value)
+        parts.append(absorbance(transmittance))
+
+    # both molecules absorb in the window, so neither part can be left out
+    assert all(part.max() > 1e-3 for part in parts)
+    np.testing.assert_allclose(absorbance(mixture), np.sum(parts, axis=0), rtol=1e-9, atol=1e-12)
+
+
+def test_mixture_matches_merged_slabs(params):
+    from radis import MergeSlabs
+
+    params.pop("mole")
+    (x_value, mixture), error, message = generate_ideal({**params, "molecule": MIXTURE})
+    assert not error, message
+
+    # what radis gives for the same gas, one slab per molecule merged into one cell
+    wstep = calc_wstep(params["resolution"], params["zeroFill"])
+    window = calc_window(params["waveMin"], params["waveMax"], wstep)
+    slabs = [
+        get_engine(molecule).calc_spectrum(*window, wstep, WING_MARGIN, params["pressure"], mole)
+        for molecule, mole in MIXTURE.items()
+    ]
+    merged = MergeSlabs(*slabs, resample="intersect")
+
+    wave_number, transmittance = merged.get("transmittance_noslit")
+    np.testing.assert_allclose(wave_number, x_value)
+    np.testing.assert_allclose(transmittance, mixture, rtol=0, atol=1e-9)
+
+
+def test_mixture_fails_when_one_molecule_has_no_lines(client, params):
+    params.pop("mole")
+    response = post(client, "/sample", {**params, "molecule": MIXTURE, "waveMin": 5000, "waveMax": 5100})
+    assert response.get_json()["success"] is False
+    assert post(client, "/sample", {**params, "molecule": MIXTURE}).get_json()["success"] is True
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import ROOT
+from processing_utils import add_noise, scan_noise
+
+
+def noise_in_new_process(seed: str) -> str:
+    # NOISE_RNG is seeded from FTIR_NOISE_SEED when processing_utils is imported
+    script = "from processing_utils import scan_noise; print(list(scan_noise(5, 10)))"
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env={**os.environ, "FTIR_NOISE_SEED": seed},
+                            capture_output=True, text=True, check=True).stdout
+    return output.strip().splitlines()[-1]
+
+
+def test_seeded_noise_is_reproducible():
+    assert noise_in_new_process("7") == noise_in_new_process("7")
+    assert noise_in_new_process("7") != noise_in_new_process("8")
+
+
+@pytest.mark.parametrize("scans", [1, 10, 1000])
+def test_noise_of_averaged_scans(scans):
+    noise = scan_noise(1_000_000, scans, np.random.default_rng(0))
+
+    # the average of n scans with a standard deviation of 0.005 each
+    assert abs(noise.mean()) < 3e-5
+    assert noise.std() == pytest.approx(0.005 / np.sqrt(scans), rel=0.01)
+
+
+def test_no_scans_add_no_noise():
+    y_value = np.ones(10)
+    assert add_noise(y_value, 0, np.random.default_rng(0)) is y_value
+    np.testing.assert_array_equal(y_value, 1)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from conftest import post
+
+
+def values(response: dict[str, object], name: str) -> np.ndarray:
+    return np.array(response[name], dtype=float)
+
+
+def test_pair_shares_the_crop_of_single_requests(client, params):
+    quiet = {**params, "scan": 10000}
+    pair = post(client, "/sample_background", {**quiet, "ratio": "transmittance"}).get_json()
+
+    for kind in ["sample", "background"]:
+        single = post(client, f"/{kind}", quiet).get_json()
+        assert pair["x"] == single["x"]
+        np.testing.assert_allclose(values(pair, kind), values(single, "y"), atol=5e-4)
+
+    np.testing.assert_allclose(values(pair, "transmittance"), values(pair, "sample") / values(pair, "background"))
+
+
+def test_absorbance_is_nan_where_the_ratio_is_not_positive(client, params):
+    # with a single scan, the noise pushes much of this range, where the CaF2 windows pass
+    # almost no light, to or below zero
+    pair = post(client, "/sample_background",
+                {**params, "waveMin": 700, "waveMax": 1200, "ratio": "absorbance"}).get_json()
+    assert pair["success"] is True
+
+    quotient = values(pair, "sample") / values(pair, "background")
+    absorbance = values(pair, "absorbance")
+    assert len(quotient) == len(pair["x"]) == len(absorbance)
+
+    positive = quotient > 0
+    assert positive.any() and not positive.all()
+    np.testing.assert_array_equal(np.isnan(absorbance), ~positive)
+    np.testing.assert_allclose(absorbance[positive], -np.log10(quotient[positive]))
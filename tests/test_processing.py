@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from processing import generate_ideal, generate_spectrum, process_arrays, process_spectrum
+
+
+@pytest.mark.parametrize("detector", ["MCT", "InSb"])
+@pytest.mark.parametrize("window", ["CaF2", "ZnSe"])
+@pytest.mark.parametrize("beamsplitter", ["AR_ZnSe", "AR_CaF2"])
+def test_process_arrays_matches_process_spectrum(params, detector, window, beamsplitter):
+    # without scans no noise is added, so both give exactly the same spectrum
+    params.update({"detector": detector, "window": window, "beamsplitter": beamsplitter, "scan": 0})
+
+    spectrum, error, message = generate_spectrum(params)
+    assert not error, message
+    expected = process_spectrum(params, spectrum).get("transmittance_noslit")
+
+    ideal, error, message = generate_ideal(params)
+    assert not error, message
+    x_value, y_value = process_arrays(params, *ideal)
+
+    np.testing.assert_array_equal(x_value, expected[0])
+    np.testing.assert_allclose(y_value, expected[1], rtol=1e-12, atol=0)
@@ -0,0 +1,57 @@
+import os
+import time
+
+import pytest
+
+import app
+import profiling
+from conftest import post
+
+
+@pytest.fixture
+def operator(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "profile_allowed", lambda token: True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+
+def test_profile_of_a_request(client, params, operator):
+    response = post(client, "/background", params)
+    assert response.headers["X-Profile-Id"]
+    assert not profiling.PROFILE_LOCK.locked()
+
+
+def test_failed_request_releases_the_profiler(client, params, operator, monkeypatch):
+    def fail(params):
+        raise RuntimeError("failed")
+
+    # with exceptions propagated Flask skips the after_request hooks, only teardown_request runs
+    monkeypatch.setattr(app, "generate_ideal", fail)
+    monkeypatch.setitem(app.app.config, "PROPAGATE_EXCEPTIONS", True)
+    with pytest.raises(RuntimeError):
+        post(client, "/sample", params)
+
+    assert not profiling.PROFILE_LOCK.locked()
+
+
+def test_old_profiles_are_removed(client, params, operator, monkeypatch, tmp_path):
+    ids = [post(client, "/background", params).headers["X-Profile-Id"] for _ in range(3)]
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{profile_id}.{extension}" for profile_id in ids
+                                                  for extension in ["json", "pstats"])
+
+    def age(profile_id):
+        old = time.time() - 60
+        for extension in ["json", "pstats"]:
+            os.utime(tmp_path / f"{profile_id}.{extension}", (old, old))
+
+    # the oldest profile is dropped when a new one goes past PROFILE_KEEP
+    age(ids[0])
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 3)
+    ids.append(post(client, "/background", params).headers["X-Profile-Id"])
+    assert profiling.profile_path(ids[0], ".json") is None
+    assert all(profiling.profile_path(profile_id, ".json") for profile_id in ids[1:])
+
+    # and the ones older than PROFILE_TTL, whatever their number
+    age(ids[1])
+    assert profiling.prune_profiles(keep=0, ttl=30) == [ids[1]]
+    assert profiling.profile_path(ids[1], ".pstats") is None
+    assert len(os.listdir(tmp_path)) == 4
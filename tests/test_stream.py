@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+import processing
+from cache import LRUCache
+from conftest import post
+from engines import Engine
+from linedb import open_linedb
+
+
+def read_stream(response):
+    segments = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert all(segment["success"] for segment in segments)
+    return (
+        np.concatenate([np.array(segment["x"], dtype=float) for segment in segments]),
+        np.concatenate([np.array(segment["y"], dtype=float) for segment in segments]),
+        len(segments),
+    )
+
+
+def test_stream_matches_full_spectrum(client, params, monkeypatch):
+    monkeypatch.setattr(processing, "STREAM_POINTS", 50)
+    params.update({"scan": 10000, "zoomMin": 2010, "zoomMax": 2190})
+
+    full = post(client, "/sample", params).get_json()
+    x_value, y_value, count = read_stream(post(client, "/sample", {**params, "stream": True}))
+
+    assert count > 1
+    np.testing.assert_allclose(x_value, np.array(full["x"], dtype=float), rtol=1e-12)
+    # every segment gets its own noise, which is small after 10000 scans
+    np.testing.assert_allclose(y_value, np.array(full["y"], dtype=float), atol=1e-3)
+
+
+def test_stream_loads_lines_once_and_is_not_cached(client, params, monkeypatch):
+    engines = []
+
+    def engine(molecule, window):
+        engines.append(Engine(molecule, open_linedb(molecule)))
+        return engines[-1]
+
+    monkeypatch.setattr(processing, "STREAM_POINTS", 20)
+    monkeypatch.setattr(processing, "get_engine", lambda molecule: None)
+    monkeypatch.setattr(processing, "Engine", engine)
+    monkeypatch.setattr(processing, "SPECTRUM_CACHE", LRUCache(2**30, name="test"))
+
+    _, _, count = read_stream(post(client, "/sample", {**params, "stream": True}))
+    assert count > 5
+    assert len(engines) == 1
+    assert processing.SPECTRUM_CACHE.get(processing.ideal_key(params)) is None
+    assert not processing.SPECTRUM_CACHE._entries
+
+
+def test_stream_rejects_handle_and_max_points(client, params):
+    for option in [{"handle": True}, {"maxPoints": 100}]:
+        response = post(client, "/sample", {**params, "stream": True, **option}).get_json()
+        assert response["success"] is False
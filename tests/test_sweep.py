@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from conftest import post
+from processing import generate_sweep
+from processing_utils import sweep_steps
+
+MOLES = [0.1, 0.5, 1]
+
+
+@pytest.fixture
+def quiet(params):
+    # after 10000 scans the noise is small next to the differences between the steps
+    return {**params, "scan": 10000}
+
+
+def test_exact_sweep_matches_separate_samples(client, quiet):
+    sweep = post(client, "/sweep", {**quiet, "moles": MOLES}).get_json()
+    assert "approximate" not in sweep
+
+    for mole, row in zip(MOLES, sweep["y"]):
+        sample = post(client, "/sample", {**quiet, "mole": mole}).get_json()
+        np.testing.assert_allclose(np.array(row, dtype=float), np.array(sample["y"], dtype=float), atol=5e-4)
+
+
+def test_scaled_sweep_is_approximate(client, quiet):
+    exact = generate_sweep(quiet, sweep_steps({**quiet, "moles": MOLES}, 25))[0][1]
+    scaled = generate_sweep(quiet, sweep_steps({**quiet, "moles": MOLES}, 25), exact=False)[0][1]
+
+    # the smallest mole fraction is calculated either way; scaling the others leaves out
+    # the self-broadening, which matters more the more concentrated the gas is
+    errors = np.max(np.abs(scaled - exact), axis=1)
+    assert errors[-1] > 5 * errors[0]
+
+    response = post(client, "/sweep", {**quiet, "moles": MOLES, "exact": False}).get_json()
+    assert response["success"] is True and response["approximate"] is True
+
+
+@pytest.mark.parametrize("steps", [
+    {"moles": [0.5, 1.5]},
+    {"moles": [0, 0.5]},
+    {"moles": [-0.1]},
+    {"pressures": [0, 1]},
+    {"moles": ["0.5"]},
+    {"moles": [True]},
+])
+def test_invalid_steps(client, params, steps):
+    with pytest.raises(ValueError):
+        sweep_steps({**params, **steps}, 25)
+    assert post(client, "/sweep", {**params, **steps}).get_json()["success"] is False
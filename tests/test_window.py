@@ -0,0 +1,17 @@
+import numpy as np
+
+from processing import generate_ideal
+
+
+def test_window_matches_full_range(params):
+    (x_window, y_window), error, _ = generate_ideal(params, windowed=True)
+    assert not error
+    (x_full, y_full), error, _ = generate_ideal(params, windowed=False)
+    assert not error
+
+    # the window is a slice of the full grid
+    start = np.searchsorted(x_full, x_window[0] - 1e-9)
+    np.testing.assert_allclose(x_window, x_full[start:start + len(x_window)], rtol=0, atol=1e-9)
+
+    # lines outside of WING_MARGIN are left out, which only changes the lineshapes slightly
+    np.testing.assert_allclose(y_window, y_full[start:start + len(x_window)], rtol=0, atol=1e-3)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from conftest import post
+from encoding import response_options
+from processing_utils import get_component, param_check
+
+
+@pytest.mark.parametrize("zoom", [
+    {"zoomMin": 2500, "zoomMax": 2600},
+    {"zoomMin": 1000, "zoomMax": 1500},
+    {"zoomMin": 2150, "zoomMax": 2100},
+    {"zoomMin": "abc"},
+    {"zoomMax": True},
+    {"zoomMin": "nan"},
+])
+def test_zoom_outside_window_is_rejected(client, params, zoom):
+    assert not param_check({**params, **zoom})
+    for endpoint in ["/sample", "/background"]:
+        response = post(client, endpoint, {**params, **zoom})
+        assert response.status_code == 200
+        assert response.get_json()["success"] is False
+
+
+def test_reversed_window_is_rejected(client, params):
+    params.update({"waveMin": 2200, "waveMax": 2000})
+    assert not param_check(params)
+    assert post(client, "/sample", params).get_json()["success"] is False
+
+
+def test_range_given_as_strings(client, params):
+    params.update({"waveMin": "2000", "waveMax": "2200.5", "zoomMin": "2100"})
+    assert param_check(params)
+    assert (params["waveMin"], params["waveMax"], params["zoomMin"]) == (2000.0, 2200.5, 2100.0)
+
+    response = post(client, "/sample", {**params, "waveMin": "2000", "waveMax": "2200.5", "zoomMin": "2100"})
+    assert response.get_json()["success"] is True
+    assert float(response.get_json()["x"][0]) >= 2100
+
+
+def test_zoom_narrower_than_a_step(client, params):
+    response = post(client, "/background", {**params, "zoomMin": 2100.1, "zoomMax": 2100.2}).get_json()
+    assert response["success"] is True
+    assert response["x"] == [] and response["y"] == []
+
+
+def test_empty_component():
+    for component in ["sPlanck", "CaF2", "MCT"]:
+        assert len(get_component(component, np.empty(0), 3100, 1.0)) == 0
+
+
+@pytest.mark.parametrize("max_points", ["abc", 1, 0, -5, True, [10]])
+def test_invalid_max_points(client, params, max_points):
+    with pytest.raises(ValueError):
+        response_options({"maxPoints": max_points})
+    response = post(client, "/sample", {**params, "maxPoints": max_points})
+    assert response.status_code == 200
+    assert response.get_json()["success"] is False
+
+
+def test_max_points(client, params):
+    response = post(client, "/sample", {**params, "resolution": 0.25, "maxPoints": "100"}).get_json()
+    assert response["decimated"] is True
+    assert len(response["x"]) <= 100
@@ -1,10 +1,28 @@
+import time
+
+from startup import PRELOAD, STARTUP_REPORT, preload
+
+start = time.perf_counter()
 from app import app
+STARTUP_REPORT["app_import_seconds"] = round(time.perf_counter() - start, 3)
+
+from engines import WARM_MOLECULES, warm_start
 import sys
 
+# import radis and specutils now. with gunicorn --preload (see gunicorn.conf.py)
+# this runs once in the master and the workers share the imported modules
+if PRELOAD:
+    print(f"preload: {preload()}s")
+
+# load the line databases of FTIR_WARM_MOLECULES before the first request.
+# with gunicorn --preload this runs once in the master and the workers share them
+if WARM_MOLECULES:
+    print(f"warm start: {warm_start()}")
+
 if __name__ == "__main__":
 
     debug = False
     if len(sys.argv) > 1 and sys.argv[1].lower() == "debug":
         debug = bool(sys.argv[1])
-    
+
     app.run(debug=debug)